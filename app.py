@@ -1,8 +1,22 @@
 import streamlit as st
 import asyncio
-from pages.summarizer_page import show_summarizer_page
-from pages.glossary_page import show_glossary_page
-from pages.quiz_page import show_quiz_page  # Add this import
+import importlib
+import inspect
+from modules.document_cache import get_document_cache
+from modules.jobs import get_job_manager
+from modules.metrics import start_metrics_server
+
+# Pages are imported the first time they are opened, so startup and the Home page skip their
+# dependencies (LangChain, the Adobe SDK, python-pptx); later reruns reuse the loaded module
+PAGES = {
+    "📝 PDF Summarizer": ("pages.summarizer_page", "show_summarizer_page"),
+    "📖 Glossary Extractor": ("pages.glossary_page", "show_glossary_page"),
+    "❓ Quiz": ("pages.quiz_page", "show_quiz_page"),
+}
+
+def load_page(page):
+    module_name, function_name = PAGES[page]
+    return getattr(importlib.import_module(module_name), function_name)
 
 def style_app():
     st.markdown(
@@ -57,11 +71,21 @@ def style_app():
 async def main():
     st.set_page_config(page_title="Edusage", page_icon="📚", layout="wide")
     style_app()
+    start_metrics_server()
 
     st.sidebar.title("📚 Edusage Navigation")
     st.sidebar.markdown("---")
     page = st.sidebar.selectbox("Choose a Mode 🔽", ["🏠 Home", "📝 PDF Summarizer", "📖 Glossary Extractor", "🤖 Chatbot", "❓ Quiz"])
 
+    cache_stats = get_document_cache().stats()
+    st.sidebar.markdown("---")
+    st.sidebar.caption(
+        f"🗄️ Document cache: {cache_stats['entries']} entries, "
+        f"{cache_stats['bytes'] / 2**20:.1f} / {cache_stats['max_bytes'] / 2**20:.0f} MB"
+    )
+    job_stats = get_job_manager().stats()
+    st.sidebar.caption(f"⚙️ Background jobs: {job_stats['running']} running, {job_stats['queued']} queued")
+
     if page == "🏠 Home":
         st.title("🎓 Welcome to Edusage")
         st.write("""
@@ -76,12 +100,10 @@ async def main():
         if uploaded_file is not None:
             st.success("✅ File uploaded successfully! Choose a mode from the sidebar to analyze it.")
         
-    elif page == "📝 PDF Summarizer":
-        await show_summarizer_page()
-    elif page == "📖 Glossary Extractor":
-        await show_glossary_page()
-    elif page == "❓ Quiz":
-        show_quiz_page()  # Add this line to call the quiz page
+    elif page in PAGES:
+        result = load_page(page)()
+        if inspect.isawaitable(result):
+            await result
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
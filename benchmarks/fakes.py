@@ -0,0 +1,161 @@
+import asyncio
+import hashlib
+import random
+import re
+import time
+from typing import Any
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.runnables import RunnableLambda
+from modules.extraction import ExtractionBackend, iter_zip_elements
+
+SECTION_PATTERN = re.compile(r"### Section (\d+)")
+QUESTION_COUNT_PATTERN = re.compile(r"Generate a (\d+)-question")
+REDUCE_TOPICS_PATTERN = re.compile(r"higher-level summary with at most (\d+) topics")
+TOPIC_PATTERN = re.compile(r"Main Topic: (.+)")
+QUIZ_ANSWERS = {"QuizMultipleChoice": "A", "QuizTrueFalse": "True"}
+
+
+def _prompt_text(value):
+    if hasattr(value, "to_string"):
+        return value.to_string()
+    return "\n".join(str(message.content) for message in value)
+
+
+def fake_reply(text):
+    """A deterministic reply in the format the prompt asks for, one block per packed section."""
+    reduce_match = REDUCE_TOPICS_PATTERN.search(text)
+    if reduce_match:
+        # Merge the incoming topics into at most the requested number, keeping their order
+        topics = TOPIC_PATTERN.findall(text.split("Summaries:", 1)[-1]) or ["Overview"]
+        count = min(int(reduce_match.group(1)), len(topics))
+        groups = [topics[i * len(topics) // count:(i + 1) * len(topics) // count] for i in range(count)]
+        return "\n\n".join(
+            f"Main Topic: {group[0]} to {group[-1]}\n• Combines {len(group)} topics\n  - Shared technique" for group in groups
+        )
+    sections = SECTION_PATTERN.findall(text) or ["1"]
+    if "TERM:" in text:
+        return "\n\n".join(
+            f"TERM: Concept {n}\nDEFINITION: The idea introduced in section {n}.\nDETAILS: N/A" for n in sections
+        )
+    return "\n\n".join(
+        f"### Section {n}\nMain Topic: Section {n}\n• Key idea of section {n}\n  - Supporting detail\n  - Worked example"
+        for n in sections
+    )
+
+
+def fake_structured_reply(schema, text):
+    fields = schema.__fields__
+    if "entries" in fields:
+        entry_schema = fields["entries"].type_
+        return schema(entries=[
+            entry_schema(section=int(n), term=f"Concept {n}", definition=f"The idea introduced in section {n}.", details="N/A")
+            for n in SECTION_PATTERN.findall(text) or ["1"]
+        ])
+    match = QUESTION_COUNT_PATTERN.search(text)
+    count = int(match.group(1)) if match else 1
+    values = {"questions": [f"Question {i + 1} about the context?" for i in range(count)]}
+    if "alternatives" in fields:
+        values["alternatives"] = [[f"{letter}) Option {letter}" for letter in "ABCD"] for _ in range(count)]
+    values["answers"] = [QUIZ_ANSWERS.get(schema.__name__, "A reference answer.") for _ in range(count)]
+    return schema(**values)
+
+
+class FakeChatModel(BaseChatModel):
+    """Stand-in for ChatOpenAI: sleeps for a simulated latency and answers deterministically.
+
+    Latency is latency * (1 ± jitter), seeded by the prompt so repeated runs see the same delays.
+    """
+
+    model_name: str = "gpt-3.5-turbo-16k"
+    temperature: float = 0.0
+    latency: float = 0.05
+    jitter: float = 0.5
+    stream_chunk_chars: int = 16
+    # A plain list shared by every model a benchmark creates (Any, so pydantic doesn't copy it)
+    call_latencies: Any = None
+
+    @property
+    def _llm_type(self):
+        return "edusage-fake"
+
+    def _record(self, start):
+        if self.call_latencies is not None:
+            self.call_latencies.append(time.perf_counter() - start)
+
+    def _delay(self, text):
+        seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "big")
+        return max(0.0, self.latency * (1 + self.jitter * (2 * random.Random(seed).random() - 1)))
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        start = time.perf_counter()
+        text = _prompt_text(messages)
+        time.sleep(self._delay(text))
+        result = ChatResult(generations=[ChatGeneration(message=AIMessage(content=fake_reply(text)))])
+        self._record(start)
+        return result
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        start = time.perf_counter()
+        text = _prompt_text(messages)
+        await asyncio.sleep(self._delay(text))
+        result = ChatResult(generations=[ChatGeneration(message=AIMessage(content=fake_reply(text)))])
+        self._record(start)
+        return result
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        start = time.perf_counter()
+        text = _prompt_text(messages)
+        # Time to first token dominates; the rest of the reply streams out quickly
+        await asyncio.sleep(self._delay(text))
+        reply = fake_reply(text)
+        for i in range(0, len(reply), self.stream_chunk_chars):
+            yield ChatGenerationChunk(message=AIMessageChunk(content=reply[i:i + self.stream_chunk_chars]))
+        self._record(start)
+
+    def with_structured_output(self, schema, **kwargs):
+        def invoke(prompt_value):
+            start = time.perf_counter()
+            text = _prompt_text(prompt_value)
+            time.sleep(self._delay(text))
+            self._record(start)
+            return fake_structured_reply(schema, text)
+
+        async def ainvoke(prompt_value):
+            start = time.perf_counter()
+            text = _prompt_text(prompt_value)
+            await asyncio.sleep(self._delay(text))
+            self._record(start)
+            return fake_structured_reply(schema, text)
+
+        return RunnableLambda(invoke, afunc=ainvoke)
+
+
+class FakeExtractionBackend(ExtractionBackend):
+    """Stand-in for the Adobe service: waits, then parses a prepared structuredData.json zip.
+
+    results maps each input PDF path to the zip the service would have returned for it.
+    """
+
+    name = "fake"
+
+    def __init__(self, results, latency=0.5):
+        self.results = results
+        self.latency = latency
+
+    def iter_elements(self, input_file_path):
+        time.sleep(self.latency)
+        with open(self.results[input_file_path], "rb") as result_zip:
+            yield from iter_zip_elements(result_zip)
+
+
+def fake_chat_model_factory(latency, jitter, call_latencies):
+    """Returns a ChatOpenAI-compatible constructor whose models share one latency log."""
+
+    def create(model_name="gpt-3.5-turbo-16k", temperature=0.0, **kwargs):
+        return FakeChatModel(
+            model_name=model_name, temperature=temperature, latency=latency, jitter=jitter, call_latencies=call_latencies
+        )
+
+    return create
@@ -0,0 +1,266 @@
+"""Offline pipeline benchmarks.
+
+    python -m benchmarks.run --sections 10 100 1000 10000 --json results.json
+
+Every stage runs against synthetic documents with fake LLM and extraction backends, so
+no network access or API keys are needed and numbers are comparable between runs.
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from unittest import mock
+import langchain_openai
+
+# Every run must reach the (fake) model; a warm response cache would hide the work being measured
+os.environ["EDUSAGE_LLM_CACHE_BYPASS"] = "1"
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+
+from benchmarks.fakes import FakeExtractionBackend, fake_chat_model_factory
+from benchmarks.synthetic import synthetic_pdf, synthetic_sections, write_structured_zip
+from modules import glossary, quiz, rate_limit, summarizer
+from modules.chunking import get_token_budget, pack_sections, split_text_by_tokens
+from modules.deck import create_ppt
+from modules.extraction import LocalPDFExtractionBackend, PDFSectionExtractor, iter_sections
+from modules.extraction_cache import ExtractionCache
+
+DEFAULT_SECTIONS = [10, 100, 1000, 10000]
+
+
+class BenchmarkContext:
+    def __init__(self, num_sections, args, work_dir):
+        self.num_sections = num_sections
+        self.args = args
+        self.work_dir = work_dir
+        self.call_latencies = []
+
+        sections = synthetic_sections(num_sections, seed=num_sections)
+        self.pdf_path = os.path.join(work_dir, f"synthetic-{num_sections}.pdf")
+        with open(self.pdf_path, "wb") as f:
+            f.write(synthetic_pdf(sections))
+        self.zip_path = os.path.join(work_dir, f"synthetic-{num_sections}.zip")
+        with open(self.zip_path, "wb") as f:
+            write_structured_zip(sections, f)
+
+        # Inputs for the later stages, prepared outside the timed region
+        self.docs = list(iter_sections(self.extraction_backend().iter_elements(self.pdf_path), source=self.pdf_path))
+        self.chunks = split_text_by_tokens(self.docs, quiz.QUIZ_CHUNK_TOKENS, quiz.QUIZ_MODEL_NAME)
+        self.summaries = [
+            f"Main Topic: {heading}\n• {body[0][:120]}\n  - {body[-1][:120]}" for heading, body in sections
+        ]
+
+    def extraction_backend(self):
+        return FakeExtractionBackend({self.pdf_path: self.zip_path}, latency=self.args.extract_latency)
+
+    def output_dir(self):
+        return tempfile.mkdtemp(dir=self.work_dir)
+
+
+def stage_extract(ctx):
+    # Simulated Adobe round trip, then zip/JSON parsing, section splitting and the cache write-through
+    extractor = PDFSectionExtractor(None, None, backend=ctx.extraction_backend())
+    extractor.extraction_cache = ExtractionCache(ctx.output_dir())
+    return len(list(extractor.extract_sections(ctx.pdf_path)))
+
+
+def stage_local_extract(ctx):
+    backend = LocalPDFExtractionBackend()
+    return len(list(iter_sections(backend.iter_elements(ctx.pdf_path), source=ctx.pdf_path)))
+
+
+def stage_chunking(ctx):
+    model_name = "gpt-3.5-turbo-16k"
+    pack_sections(ctx.docs, get_token_budget(model_name), model_name)
+    split_text_by_tokens(ctx.docs, quiz.QUIZ_CHUNK_TOKENS, quiz.QUIZ_MODEL_NAME)
+    return len(ctx.docs)
+
+
+def stage_quiz_chunking(ctx):
+    with open(ctx.pdf_path, "rb") as f:
+        upload = io.BytesIO(f.read())
+    upload.name = os.path.basename(ctx.pdf_path)
+    quiz.process_document(upload)
+    return len(ctx.docs)
+
+
+def stage_summarize(ctx):
+    pdf_extract = summarizer.PDFExtract(None, None, backend=ctx.extraction_backend())
+    asyncio.run(pdf_extract.process_documents(ctx.docs, ctx.output_dir(), max_concurrency=ctx.args.concurrency))
+    return len(ctx.docs)
+
+
+def stage_reduce(ctx):
+    # Reduce tree over one map summary per section, down to a deck-sized document summary
+    pdf_extract = summarizer.PDFExtract(None, None, backend=ctx.extraction_backend())
+    tree = asyncio.run(
+        pdf_extract.reduce_summaries(ctx.summaries, ctx.args.deck_topics, max_concurrency=ctx.args.concurrency)
+    )
+    return len(ctx.summaries) if tree.depth else 0
+
+
+def stage_glossary(ctx):
+    pdf_extract = glossary.PDFExtract(None, None, backend=ctx.extraction_backend())
+    asyncio.run(pdf_extract.create_glossary(ctx.docs, ctx.output_dir()))
+    return len(ctx.docs)
+
+
+def stage_quiz(ctx):
+    quiz.generate_quiz(ctx.chunks, ctx.args.questions, "Multiple Choice", use_cache=False)
+    return len(ctx.docs)
+
+
+def stage_quiz_parallel(ctx):
+    asyncio.run(quiz.agenerate_quiz(
+        ctx.chunks, ctx.args.questions, "Multiple Choice", use_cache=False, max_concurrency=ctx.args.concurrency
+    ))
+    return len(ctx.docs)
+
+
+def stage_deck(ctx):
+    create_ppt(ctx.summaries, ctx.output_dir(), "synthetic.pdf")
+    return len(ctx.docs)
+
+
+STAGES = {
+    "extract": stage_extract,
+    "local_extract": stage_local_extract,
+    "chunking": stage_chunking,
+    "quiz_chunking": stage_quiz_chunking,
+    "summarize": stage_summarize,
+    "reduce": stage_reduce,
+    "glossary": stage_glossary,
+    "quiz": stage_quiz,
+    "quiz_parallel": stage_quiz_parallel,
+    "deck": stage_deck,
+}
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def run_stage(name, ctx, repeats, measure_memory=True):
+    stage = STAGES[name]
+    del ctx.call_latencies[:]
+    durations = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(repeats):
+            start = time.perf_counter()
+            items = stage(ctx)
+            durations.append(time.perf_counter() - start)
+        call_latencies = list(ctx.call_latencies)
+
+        # Peak memory comes from one extra run, since tracing allocations slows the timed runs down.
+        # Only the benchmark process is traced; local_extract's worker processes are not included.
+        peak_memory = None
+        if measure_memory:
+            tracemalloc.start()
+            stage(ctx)
+            peak_memory = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+    median = statistics.median(durations)
+    return {
+        "stage": name,
+        "sections": ctx.num_sections,
+        "items": items,
+        "runs": repeats,
+        "throughput": items / median if median else None,
+        "p50_seconds": percentile(durations, 0.5),
+        "p99_seconds": percentile(durations, 0.99),
+        "llm_calls": len(call_latencies) // repeats,
+        "llm_p50_seconds": percentile(call_latencies, 0.5),
+        "llm_p99_seconds": percentile(call_latencies, 0.99),
+        "peak_memory_bytes": peak_memory,
+    }
+
+
+def format_seconds(value):
+    return "-" if value is None else f"{value * 1000:.1f}ms"
+
+
+def format_megabytes(value):
+    return "-" if value is None else f"{value / 1e6:.1f}"
+
+
+def print_results(results):
+    header = f"{'stage':<14}{'sections':>9}{'items/s':>11}{'p50':>11}{'p99':>11}{'llm calls':>10}{'llm p99':>11}{'peak MB':>9}"
+    print(header)
+    print("-" * len(header))
+    for result in results:
+        print(
+            f"{result['stage']:<14}{result['sections']:>9}{result['throughput'] or 0:>11.1f}"
+            f"{format_seconds(result['p50_seconds']):>11}{format_seconds(result['p99_seconds']):>11}"
+            f"{result['llm_calls']:>10}{format_seconds(result['llm_p99_seconds']):>11}"
+            f"{format_megabytes(result['peak_memory_bytes']):>9}"
+        )
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the EduSage pipelines offline.")
+    parser.add_argument("--sections", type=int, nargs="+", default=DEFAULT_SECTIONS, help="Document sizes to generate")
+    parser.add_argument("--stages", nargs="+", choices=list(STAGES), default=list(STAGES))
+    parser.add_argument("--repeats", type=int, default=3, help="Timed runs per stage and size")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="Mean simulated seconds per LLM call")
+    parser.add_argument("--llm-jitter", type=float, default=0.5, help="Latency spread as a fraction of the mean")
+    parser.add_argument("--extract-latency", type=float, default=0.2, help="Simulated Adobe round trip in seconds")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent summary requests")
+    parser.add_argument("--rpm", type=int, default=10 ** 9, help="Rate limiter requests per minute (default: unlimited)")
+    parser.add_argument("--tpm", type=int, default=10 ** 12, help="Rate limiter tokens per minute (default: unlimited)")
+    parser.add_argument("--questions", type=int, default=10, help="Questions per generated quiz")
+    parser.add_argument("--deck-topics", type=int, default=20, help="Topics the reduce stage summarizes down to")
+    parser.add_argument("--no-memory", action="store_true", help="Skip the traced run that measures peak memory")
+    parser.add_argument("--json", help="Also write the results to this file")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.getLogger().setLevel(logging.WARNING)
+    results = []
+    with tempfile.TemporaryDirectory() as work_dir, contextlib.ExitStack() as patches:
+        call_latencies = []
+        factory = fake_chat_model_factory(args.llm_latency, args.llm_jitter, call_latencies)
+        # Every pipeline gets its model from the shared client pool; start it empty so it only holds fakes
+        patches.enter_context(mock.patch.object(langchain_openai, "ChatOpenAI", factory))
+        patches.enter_context(mock.patch.dict(rate_limit._clients, clear=True))
+        patches.enter_context(mock.patch.dict(rate_limit._limiters, clear=True))
+        patches.enter_context(mock.patch.object(rate_limit, "DEFAULT_RPM", args.rpm))
+        patches.enter_context(mock.patch.object(rate_limit, "DEFAULT_TPM", args.tpm))
+
+        for num_sections in args.sections:
+            ctx = BenchmarkContext(num_sections, args, work_dir)
+            ctx.call_latencies = call_latencies
+            for name in args.stages:
+                result = run_stage(name, ctx, args.repeats, measure_memory=not args.no_memory)
+                results.append(result)
+                print(f"{name} x {num_sections} sections: {format_seconds(result['p50_seconds'])}", file=sys.stderr)
+
+    print_results(results)
+    if args.json:
+        report = {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "config": vars(args),
+            "results": results,
+        }
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""Cold-start import cost of the app and each page.
+
+    python -m benchmarks.startup --repeats 5 --target 1.5 --json startup.json
+
+Every measurement imports the module in a fresh interpreter with `-X importtime`, so
+nothing is shared between runs. The command exits with status 1 when the app's median
+cold start exceeds --target seconds.
+"""
+import argparse
+import json
+import os
+import platform
+import re
+import statistics
+import subprocess
+import sys
+import time
+from collections import Counter
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODULES = {
+    "app": "app",
+    "summarizer": "pages.summarizer_page",
+    "glossary": "pages.glossary_page",
+    "quiz": "pages.quiz_page",
+}
+
+OWN_PACKAGES = {"app", "benchmarks", "modules", "pages"}
+
+# "import time:      self [us] |  cumulative | imported package"
+IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def measure_import(module):
+    """Imports module in a new interpreter; returns (wall seconds, {package: seconds}).
+
+    Package times cover the third-party and standard library packages imported directly by
+    the app's own modules, including everything they import in turn.
+    """
+    start = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=REPO_ROOT, capture_output=True, text=True,
+    )
+    seconds = time.perf_counter() - start
+    if completed.returncode:
+        raise RuntimeError(f"Importing {module} failed:\n{completed.stderr[-2000:]}")
+    # importtime prints children before their parent; reversed, each import follows its parent
+    packages = Counter()
+    stack = []
+    for line in reversed(completed.stderr.splitlines()):
+        match = IMPORTTIME_LINE.match(line)
+        if not match:
+            continue
+        depth, package = len(match.group(3)), match.group(4).split(".")[0]
+        while stack and stack[-1][0] >= depth:
+            stack.pop()
+        # Charge each package that our own code imports directly with everything it pulls in
+        if package not in OWN_PACKAGES and stack and all(parent in OWN_PACKAGES for _, parent in stack):
+            packages[package] += int(match.group(2)) / 1e6
+        stack.append((depth, package))
+    return seconds, packages
+
+
+def measure(name, module, repeats):
+    runs = [measure_import(module) for _ in range(repeats)]
+    seconds = sorted(wall for wall, _ in runs)
+    packages = Counter()
+    for _, run_packages in runs:
+        packages.update(run_packages)
+    return {
+        "name": name,
+        "module": module,
+        "p50_seconds": statistics.median(seconds),
+        "max_seconds": seconds[-1],
+        "heaviest": [(package, total / repeats) for package, total in packages.most_common(5)],
+    }
+
+
+def print_results(results):
+    header = f"{'module':<12}{'p50':>9}{'max':>9}  heaviest imports"
+    print(header)
+    print("-" * len(header))
+    for result in results:
+        heaviest = ", ".join(f"{package} {seconds * 1000:.0f}ms" for package, seconds in result["heaviest"])
+        print(f"{result['name']:<12}{result['p50_seconds']:>8.2f}s{result['max_seconds']:>8.2f}s  {heaviest}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Measure the cold-start import cost of the app and its pages.")
+    parser.add_argument("--modules", nargs="+", choices=list(MODULES), default=list(MODULES))
+    parser.add_argument("--repeats", type=int, default=5, help="Fresh interpreters per module")
+    parser.add_argument("--target", type=float, help="Fail if the app's median cold start exceeds this many seconds")
+    parser.add_argument("--json", help="Also write the results to this file")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    # Interpreter startup alone, so the per-module numbers can be read against it
+    baseline = measure("python", "sys", args.repeats)
+    results = [baseline] + [measure(name, MODULES[name], args.repeats) for name in args.modules]
+    print_results(results)
+    if args.json:
+        report = {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "config": vars(args),
+            "results": results,
+        }
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+    app = next((result for result in results if result["name"] == "app"), None)
+    if args.target is not None and app is not None and app["p50_seconds"] > args.target:
+        print(f"App cold start {app['p50_seconds']:.2f}s is over the {args.target:.2f}s target", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,124 @@
+import io
+import json
+import random
+import zipfile
+
+VOCABULARY = (
+    "gradient descent converges when the learning rate satisfies the bound while momentum accelerates "
+    "the update attention weights each token by its similarity to the query and the softmax normalizes "
+    "the scores the encoder maps inputs to latent vectors and the decoder reconstructs them from the "
+    "representation regularization penalizes large weights to reduce variance on held out data the "
+    "loss surface of deep networks contains saddle points rather than poor local minima batch "
+    "normalization stabilizes activations across layers and dropout samples thinned subnetworks"
+).split()
+HEADING_WORDS = (
+    "Optimization Attention Encoders Regularization Normalization Convergence Sampling Inference "
+    "Training Evaluation Architecture Objectives Representations Generalization Scaling"
+).split()
+
+PAGE_WIDTH = 612
+PAGE_HEIGHT = 792
+MARGIN = 72
+HEADING_SIZE = 16
+BODY_SIZE = 10
+LINE_CHARS = 95
+
+
+def synthetic_sections(num_sections, words_per_section=180, paragraphs=2, seed=0):
+    """Deterministic [(heading, [paragraph, ...]), ...] for a document with num_sections sections."""
+    rng = random.Random(seed)
+    sections = []
+    for number in range(1, num_sections + 1):
+        heading = f"{number} {rng.choice(HEADING_WORDS)} and {rng.choice(HEADING_WORDS)}"
+        words_per_paragraph = max(1, words_per_section // paragraphs)
+        body = [
+            " ".join(rng.choice(VOCABULARY) for _ in range(words_per_paragraph)).capitalize() + "."
+            for _ in range(paragraphs)
+        ]
+        sections.append((heading, body))
+    return sections
+
+
+def structured_data(sections):
+    """Adobe Extract-style structuredData.json content for the given sections."""
+    elements = [{"Path": "//Document/Title", "Text": "Synthetic Benchmark Document", "Page": 0}]
+    for heading, body in sections:
+        elements.append({"Path": "//Document/H2", "Text": heading, "Page": 0, "TextSize": HEADING_SIZE})
+        for paragraph in body:
+            elements.append({"Path": "//Document/P", "Text": paragraph, "Page": 0, "TextSize": BODY_SIZE})
+    return {"version": {"json_export": "161"}, "elements": elements}
+
+
+def write_structured_zip(sections, stream):
+    """Writes the zip the Adobe extract operation returns (structuredData.json inside)."""
+    with zipfile.ZipFile(stream, "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("structuredData.json", json.dumps(structured_data(sections)))
+
+
+def _wrap(text, width=LINE_CHARS):
+    lines, current = [], ""
+    for word in text.split():
+        if current and len(current) + len(word) + 1 > width:
+            lines.append(current)
+            current = word
+        else:
+            current = f"{current} {word}".strip()
+    if current:
+        lines.append(current)
+    return lines
+
+
+def _pdf_string(text):
+    return "(" + text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)") + ")"
+
+
+def synthetic_pdf(sections):
+    """A minimal text-only PDF: headings set larger than body text, wrapped and paginated."""
+    lines = [("Synthetic Benchmark Document", HEADING_SIZE + 4)]
+    for heading, body in sections:
+        lines.append((heading, HEADING_SIZE))
+        for paragraph in body:
+            lines.extend((line, BODY_SIZE) for line in _wrap(paragraph))
+
+    pages, current, y = [], [], PAGE_HEIGHT - MARGIN
+    for text, size in lines:
+        leading = size * 1.4
+        if y - leading < MARGIN:
+            pages.append(current)
+            current, y = [], PAGE_HEIGHT - MARGIN
+        y -= leading
+        current.append((text, size, y))
+    if current:
+        pages.append(current)
+
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # page tree, filled in once the page object numbers are known
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    page_refs = []
+    for page in pages:
+        content = "".join(
+            f"BT /F1 {size} Tf {MARGIN} {y:.1f} Td {_pdf_string(text)} Tj ET\n" for text, size, y in page
+        ).encode("latin-1", "replace")
+        objects.append(b"<< /Length %d >>\nstream\n" % len(content) + content + b"endstream")
+        page_refs.append(len(objects) + 1)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] /Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>"
+            % (PAGE_WIDTH, PAGE_HEIGHT, len(objects))
+        )
+    kids = " ".join(f"{ref} 0 R" for ref in page_refs)
+    objects[1] = f"<< /Type /Pages /Kids [{kids}] /Count {len(page_refs)} >>".encode()
+
+    output = io.BytesIO()
+    output.write(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(output.tell())
+        output.write(b"%d 0 obj\n" % number + body + b"\nendobj\n")
+    xref = output.tell()
+    output.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+    for offset in offsets:
+        output.write(b"%010d 00000 n \n" % offset)
+    output.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref))
+    return output.getvalue()
@@ -0,0 +1,283 @@
+"""Headless batch processing of course PDFs.
+
+    python -m modules.batch lectures/ --output build/ --tasks summary glossary quiz --workers 4
+
+Inputs are PDF files, directories (searched recursively) or manifests: a .txt file with one
+path per line, or a .json list of paths; relative paths are resolved against the manifest.
+Each PDF gets its own output directory with a state file recording the PDF hash and the
+settings every output was built with, so re-runs skip documents that are already up to date.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# Allow running this file directly as well as with python -m
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modules.extraction_cache import hash_file
+from modules.metrics import span
+
+TASKS = ("summary", "glossary", "quiz")
+QUIZ_TYPES = ("Multiple Choice", "True/False", "Open Ended")
+STATE_FILE = "edusage_state.json"
+
+
+def find_pdfs(inputs):
+    """Returns [(pdf_path, root), ...]; root is the directory outputs are laid out relative to."""
+    found = []
+    for item in inputs:
+        item = os.path.abspath(item)
+        if os.path.isdir(item):
+            for dirpath, dirnames, filenames in os.walk(item):
+                dirnames.sort()
+                for name in sorted(filenames):
+                    if name.lower().endswith(".pdf"):
+                        found.append((os.path.join(dirpath, name), item))
+        elif item.lower().endswith(".pdf"):
+            found.append((item, os.path.dirname(item)))
+        else:
+            root = os.path.dirname(item)
+            with open(item, encoding="utf-8") as f:
+                if item.lower().endswith(".json"):
+                    paths = json.load(f)
+                else:
+                    paths = [line.strip() for line in f if line.strip() and not line.lstrip().startswith("#")]
+            found.extend((os.path.normpath(os.path.join(root, path)), root) for path in paths)
+
+    # The same file listed twice (e.g. in a directory and a manifest) is processed once
+    unique = {}
+    for path, root in found:
+        unique.setdefault(path, root)
+    return list(unique.items())
+
+
+def output_dir_for(pdf_path, root, output_root):
+    relative = os.path.relpath(pdf_path, root)
+    if relative.startswith(os.pardir):
+        # Outside the input root; keep the name readable and unique
+        digest = hashlib.sha256(pdf_path.encode("utf-8")).hexdigest()[:8]
+        relative = f"{os.path.splitext(os.path.basename(pdf_path))[0]}-{digest}"
+    return os.path.join(output_root, os.path.splitext(relative)[0])
+
+
+def task_config(task, options):
+    """Everything a task's outputs depend on besides the PDF itself."""
+    config = {"task": task, "backend": os.getenv("EDUSAGE_EXTRACTION_BACKEND", "adobe")}
+    if task == "summary":
+        config.update(slides=options.slides)
+    if task == "quiz":
+        config.update(questions=options.questions, quiz_types=list(QUIZ_TYPES))
+    return hashlib.sha256(json.dumps(config, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def load_state(doc_dir):
+    try:
+        with open(os.path.join(doc_dir, STATE_FILE), encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {"tasks": {}}
+
+
+def save_state(doc_dir, state):
+    path = os.path.join(doc_dir, STATE_FILE)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+def source_hash(pdf_path, state):
+    # Hashing hundreds of PDFs on every run is wasted work when size and mtime haven't changed
+    stat = os.stat(pdf_path)
+    source = state.get("source", {})
+    if source.get("size") == stat.st_size and source.get("mtime") == stat.st_mtime and source.get("sha256"):
+        return source["sha256"]
+    return hash_file(pdf_path)
+
+
+def is_up_to_date(state, task, sha256, config):
+    record = state["tasks"].get(task)
+    return (
+        record is not None
+        and state.get("source", {}).get("sha256") == sha256
+        and record.get("config") == config
+        and all(os.path.exists(path) for path in record.get("outputs", []))
+    )
+
+
+async def run_summary(document, options):
+    from modules.deck import create_ppt
+    from modules.summarizer import PDFExtract
+
+    pdf_extract = PDFExtract(os.getenv("PDF_SERVICES_CLIENT_ID"), os.getenv("PDF_SERVICES_CLIENT_SECRET"))
+    if not options.slides:
+        summaries = await pdf_extract.process_documents(document.sections, document.dir, max_concurrency=options.concurrency)
+        ppt_path = await asyncio.to_thread(create_ppt, summaries, document.dir, os.path.basename(document.path))
+        return [os.path.join(document.dir, "technical_summaries.txt"), ppt_path] if summaries else [ppt_path]
+
+    # Book-length documents: reduce the section summaries to a deck of the requested length
+    tree = await pdf_extract.summarize_hierarchically(
+        document.sections, document.dir, options.slides - 1, max_concurrency=options.concurrency
+    )
+    ppt_path = await asyncio.to_thread(
+        create_ppt, tree, document.dir, os.path.basename(document.path), max_slides=options.slides
+    )
+    outputs = [os.path.join(document.dir, "document_summary.txt"), ppt_path]
+    return outputs + [os.path.join(document.dir, "technical_summaries.txt")] if tree.levels[0] else outputs
+
+
+async def run_glossary(document, options):
+    from modules.glossary import PDFExtract
+    from modules.glossary_store import get_glossary_store
+
+    pdf_extract = PDFExtract(os.getenv("PDF_SERVICES_CLIENT_ID"), os.getenv("PDF_SERVICES_CLIENT_SECRET"))
+    glossary = await pdf_extract.create_glossary(document.sections, document.dir, max_concurrency=options.concurrency)
+    # Shared with the Glossary Extractor page, which then shows these documents instantly
+    get_glossary_store().add_document(document.sha256, glossary, name=os.path.basename(document.path))
+    glossary_path = os.path.join(document.dir, "glossary.json")
+    with open(glossary_path, "w", encoding="utf-8") as f:
+        json.dump(glossary, f, indent=2)
+    return [glossary_path]
+
+
+async def run_quiz(document, options):
+    from modules.quiz import agenerate_quiz, process_document
+    from modules.quiz_bank import get_question_bank
+
+    with open(document.path, "rb") as f:
+        chunks = await asyncio.to_thread(process_document, f)
+    # Every quiz type's questions are requested concurrently, each from its own chunk
+    quizzes = await asyncio.gather(*[
+        agenerate_quiz(chunks, options.questions, quiz_type, max_concurrency=options.concurrency) for quiz_type in QUIZ_TYPES
+    ])
+    # Seeds the Quiz Generator's question bank, which is keyed by the same file hash
+    question_bank = get_question_bank()
+    for quiz_type, quiz in zip(QUIZ_TYPES, quizzes):
+        question_bank.add(document.sha256, quiz_type, quiz)
+    bank_path = os.path.join(document.dir, "quiz_bank.json")
+    with open(bank_path, "w", encoding="utf-8") as f:
+        json.dump({quiz_type: quiz.dict() for quiz_type, quiz in zip(QUIZ_TYPES, quizzes)}, f, indent=2)
+    return [bank_path]
+
+
+TASK_RUNNERS = {"summary": run_summary, "glossary": run_glossary, "quiz": run_quiz}
+
+
+async def process_pdf_async(pdf_path, doc_dir, options):
+    os.makedirs(doc_dir, exist_ok=True)
+    state = load_state(doc_dir)
+    sha256 = source_hash(pdf_path, state)
+    configs = {task: task_config(task, options) for task in options.tasks}
+    pending = [task for task in options.tasks if options.force or not is_up_to_date(state, task, sha256, configs[task])]
+    if not pending:
+        return {"path": pdf_path, "status": "skipped", "tasks": []}
+
+    if state.get("source", {}).get("sha256") != sha256:
+        # The PDF changed; outputs of tasks not requested this time no longer match it
+        state["tasks"] = {}
+    stat = os.stat(pdf_path)
+    state["source"] = {"path": pdf_path, "sha256": sha256, "size": stat.st_size, "mtime": stat.st_mtime}
+    document = argparse.Namespace(path=pdf_path, dir=doc_dir, sha256=sha256, sections=None)
+
+    if "summary" in pending or "glossary" in pending:
+        from modules.extraction import PDFSectionExtractor
+
+        # Extract once and share the sections between the summary and glossary tasks
+        extractor = PDFSectionExtractor(os.getenv("PDF_SERVICES_CLIENT_ID"), os.getenv("PDF_SERVICES_CLIENT_SECRET"))
+        document.sections = await asyncio.to_thread(lambda: list(extractor.extract_sections(pdf_path)))
+
+    results = await asyncio.gather(
+        *[TASK_RUNNERS[task](document, options) for task in pending], return_exceptions=True
+    )
+    errors = {}
+    for task, result in zip(pending, results):
+        if isinstance(result, Exception):
+            logging.error(f"{task} failed for {pdf_path}: {result}")
+            errors[task] = str(result)
+        else:
+            state["tasks"][task] = {"config": configs[task], "outputs": result, "completed_at": time.time()}
+    save_state(doc_dir, state)
+    return {
+        "path": pdf_path,
+        "status": "failed" if errors else "processed",
+        "tasks": [task for task in pending if task not in errors],
+        "errors": errors,
+    }
+
+
+def process_pdf(pdf_path, doc_dir, options):
+    """Process pool entry point: one document, with its LLM requests running concurrently."""
+    with span("batch_document"):
+        try:
+            return asyncio.run(process_pdf_async(pdf_path, doc_dir, options))
+        except Exception as e:
+            logging.exception(f"Processing {pdf_path} failed")
+            return {"path": pdf_path, "status": "failed", "tasks": [], "errors": {"document": str(e)}}
+
+
+def init_worker(rpm, tpm):
+    """Process pool initializer: each worker gets its share of the OpenAI budget."""
+    from modules import rate_limit
+
+    rate_limit.DEFAULT_RPM = rpm
+    rate_limit.DEFAULT_TPM = tpm
+    # Forked workers may inherit limiters the parent built with the full budget
+    rate_limit._limiters.clear()
+
+
+def run_batch(options):
+    from modules import rate_limit
+
+    pdfs = find_pdfs(options.inputs)
+    print(f"Found {len(pdfs)} PDF(s)")
+    results = []
+    # Rate limiters are per process, so the workers split the account's limits between them
+    workers = max(1, min(options.workers, len(pdfs)))
+    budget = (max(1, rate_limit.DEFAULT_RPM // workers), max(1, rate_limit.DEFAULT_TPM // workers))
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=budget) as executor:
+        futures = [
+            executor.submit(process_pdf, pdf_path, output_dir_for(pdf_path, root, options.output), options)
+            for pdf_path, root in pdfs
+        ]
+        for completed, future in enumerate(as_completed(futures), 1):
+            result = future.result()
+            results.append(result)
+            detail = ", ".join(result["tasks"]) if result["tasks"] else ""
+            if result.get("errors"):
+                detail = "; ".join(f"{task}: {error}" for task, error in result["errors"].items())
+            print(f"[{completed}/{len(pdfs)}] {result['status']:<9} {result['path']} {detail}".rstrip())
+
+    counts = {status: sum(result["status"] == status for result in results) for status in ("processed", "skipped", "failed")}
+    print(f"{counts['processed']} processed, {counts['skipped']} up to date, {counts['failed']} failed")
+    return results
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Generate summaries, slide decks, glossaries and quiz banks for many PDFs.")
+    parser.add_argument("inputs", nargs="+", help="PDF files, directories or manifest files (.txt or .json)")
+    parser.add_argument("--output", required=True, help="Directory to write per-document outputs to")
+    parser.add_argument("--tasks", nargs="+", choices=TASKS, default=list(TASKS))
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Documents processed in parallel")
+    parser.add_argument("--concurrency", type=int, default=int(os.getenv("SUMMARY_MAX_CONCURRENCY", "8")),
+                        help="Concurrent summary and glossary requests per document")
+    parser.add_argument("--questions", type=int, default=10, help="Questions per quiz type in each quiz bank")
+    parser.add_argument("--slides", type=int, help="Condense each summary deck to at most this many slides")
+    parser.add_argument("--force", action="store_true", help="Regenerate outputs even if they are up to date")
+    options = parser.parse_args(argv)
+    if options.slides is not None and options.slides < 2:
+        parser.error("--slides must be at least 2: the title slide and one topic")
+    return options
+
+
+def main(argv=None):
+    results = run_batch(parse_args(argv))
+    return 1 if any(result["status"] == "failed" for result in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,129 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+DEFAULT_CHECKPOINT_DIR = os.getenv(
+    "EDUSAGE_CHECKPOINT_DIR", os.path.join(os.path.expanduser("~"), ".edusage", "checkpoints")
+)
+# Attempts per section before a run gives up on it, and the first retry delay (doubled each time)
+SECTION_ATTEMPTS = int(os.getenv("EDUSAGE_SECTION_ATTEMPTS", "3"))
+RETRY_DELAY_SECONDS = 1.0
+# Journals of runs that never finished are deleted once they haven't been written to for this long
+MAX_JOURNAL_AGE_DAYS = float(os.getenv("EDUSAGE_CHECKPOINT_MAX_AGE_DAYS", "7"))
+
+
+def section_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def run_key(task, docs, *identity):
+    """Identifies one task over one document: the model, prompt etc. in identity plus every section's text."""
+    digest = hashlib.sha256(task.encode("utf-8"))
+    for part in identity:
+        digest.update(b"\0" + str(part).encode("utf-8"))
+    for doc in docs:
+        digest.update(b"\1" + doc.page_content.encode("utf-8"))
+    return digest.hexdigest()
+
+
+class CheckpointJournal:
+    """Append-only JSON-lines journal of finished sections, keyed by section hash.
+
+    Each result is flushed to disk as soon as it arrives, so a run that dies part way through
+    resumes from the sections it already finished. A torn last line from a crash is ignored.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._results = {}
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    self._results[record["section"]] = record["result"]
+        except FileNotFoundError:
+            pass
+        self._file = open(path, "a", encoding="utf-8")
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._results
+
+    def __len__(self):
+        with self._lock:
+            return len(self._results)
+
+    def get(self, key, default=None):
+        with self._lock:
+            return self._results.get(key, default)
+
+    def record(self, key, result):
+        line = json.dumps({"section": key, "result": result}) + "\n"
+        with self._lock:
+            self._results[key] = result
+            self._file.write(line)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+    def discard(self):
+        """Removes the journal once its run has finished and written its outputs."""
+        self.close()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+def expire_journals(checkpoint_dir=DEFAULT_CHECKPOINT_DIR, max_age_days=MAX_JOURNAL_AGE_DAYS, keep=None):
+    """Removes journals last written more than max_age_days ago, except keep; returns how many were removed."""
+    cutoff = time.time() - max_age_days * 24 * 3600
+    removed = 0
+    try:
+        names = os.listdir(checkpoint_dir)
+    except FileNotFoundError:
+        return 0
+    for name in names:
+        path = os.path.join(checkpoint_dir, name)
+        if not name.endswith(".jsonl") or path == keep:
+            continue
+        try:
+            if os.stat(path).st_mtime < cutoff:
+                os.remove(path)
+                removed += 1
+        except FileNotFoundError:
+            pass
+    if removed:
+        logging.info(f"Removed {removed} checkpoint journal(s) older than {max_age_days:g} days from {checkpoint_dir}")
+    return removed
+
+
+def open_journal(task, docs, *identity, checkpoint_dir=DEFAULT_CHECKPOINT_DIR):
+    path = os.path.join(checkpoint_dir, f"{task}-{run_key(task, docs, *identity)}.jsonl")
+    # Runs that crashed and were never retried would otherwise leave their journals behind for good
+    expire_journals(checkpoint_dir, keep=path)
+    return CheckpointJournal(path)
+
+
+async def retry_section(fn, description, attempts=SECTION_ATTEMPTS, delay=RETRY_DELAY_SECONDS):
+    """Awaits fn(), retrying with exponential backoff so one flaky request doesn't fail the document."""
+    for attempt in range(1, attempts + 1):
+        try:
+            return await fn()
+        except Exception as e:
+            if attempt == attempts:
+                raise
+            logging.warning(f"{description} failed (attempt {attempt} of {attempts}): {e}; retrying")
+            await asyncio.sleep(delay * 2 ** (attempt - 1))
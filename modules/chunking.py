@@ -0,0 +1,108 @@
+import logging
+import os
+from functools import lru_cache
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_core.documents import Document
+
+# Context window sizes (prompt + completion) for the models this app uses
+MODEL_CONTEXT_TOKENS = {
+    "gpt-3.5-turbo": 16385,
+    "gpt-3.5-turbo-16k": 16385,
+    "gpt-4": 8192,
+    "gpt-4-turbo": 128000,
+    "gpt-4o": 128000,
+    "gpt-4o-mini": 128000,
+}
+DEFAULT_CONTEXT_TOKENS = 4096
+# Upper bound on sections per request so a single reply doesn't have to cover too much
+MAX_SECTIONS_PER_REQUEST = int(os.getenv("EDUSAGE_MAX_SECTIONS_PER_REQUEST", "8"))
+SECTION_MARKER = "### Section {number}"
+
+
+@lru_cache(maxsize=None)
+def _get_encoding(model_name):
+    try:
+        import tiktoken
+
+        try:
+            return tiktoken.encoding_for_model(model_name)
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        # tiktoken missing, or its encoding files can't be fetched (offline); fall back to an estimate
+        logging.warning("tiktoken encoding unavailable; estimating token counts from text length.")
+        return None
+
+
+def count_tokens(text, model_name):
+    encoding = _get_encoding(model_name)
+    if encoding is None:
+        return len(text) // 4 + 1
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def get_token_budget(model_name):
+    """Input tokens per request for model_name; leaves room for the prompt and a multi-section reply.
+
+    EDUSAGE_SECTION_TOKEN_BUDGET overrides the default for every model.
+    """
+    override = os.getenv("EDUSAGE_SECTION_TOKEN_BUDGET")
+    if override:
+        return int(override)
+    return MODEL_CONTEXT_TOKENS.get(model_name, DEFAULT_CONTEXT_TOKENS) // 3
+
+
+def split_text_by_tokens(docs, chunk_tokens, model_name):
+    text_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=chunk_tokens, chunk_overlap=0, length_function=lambda text: count_tokens(text, model_name)
+    )
+    return text_splitter.split_documents(docs)
+
+
+def sections_label(sections):
+    """"Section 3", "Sections 3-7" or "Sections 2, 5" for a packed document's metadata["sections"]."""
+    if not sections:
+        return None
+    if len(sections) == 1:
+        return f"Section {sections[0]}"
+    numbers = [section for section in sections if isinstance(section, int)]
+    if len(numbers) == len(sections) and numbers == list(range(numbers[0], numbers[0] + len(numbers))):
+        return f"Sections {numbers[0]}-{numbers[-1]}"
+    return f"Sections {', '.join(str(section) for section in sections)}"
+
+
+def pack_sections(docs, max_tokens, model_name, max_sections=MAX_SECTIONS_PER_REQUEST):
+    """Merges adjacent small sections and splits oversized ones so each request fits max_tokens.
+
+    Every original section inside a packed document starts with a "### Section n" line, and
+    metadata["sections"] lists the section numbers it covers.
+    """
+    pieces = []
+    for number, doc in enumerate(docs, 1):
+        section = doc.metadata.get("section", number)
+        marker = SECTION_MARKER.format(number=section)
+        # Reserve room for the marker so a split piece still fits once it is labelled
+        piece_budget = max(1, max_tokens - count_tokens(marker, model_name) - 2)
+        if count_tokens(doc.page_content, model_name) > piece_budget:
+            parts = split_text_by_tokens([doc], piece_budget, model_name)
+        else:
+            parts = [doc]
+        for part in parts:
+            text = f"{marker}\n{part.page_content.strip()}\n"
+            pieces.append((section, text, count_tokens(text, model_name), doc.metadata.get("source")))
+
+    packed = []
+    current, current_tokens, current_sections, current_source = [], 0, [], None
+    for section, text, tokens, source in pieces:
+        if current and (current_tokens + tokens > max_tokens or len(current) >= max_sections):
+            packed.append(Document(page_content="\n".join(current), metadata={"source": current_source, "sections": current_sections}))
+            current, current_tokens, current_sections = [], 0, []
+        if not current:
+            current_source = source
+        current.append(text)
+        current_tokens += tokens
+        if section not in current_sections:
+            current_sections.append(section)
+    if current:
+        packed.append(Document(page_content="\n".join(current), metadata={"source": current_source, "sections": current_sections}))
+    return packed
@@ -0,0 +1,220 @@
+import os
+import re
+import threading
+import zipfile
+import zlib
+from io import BytesIO
+from xml.sax.saxutils import escape
+from modules.metrics import span
+from modules.summary_tree import SummaryTree
+
+TITLE_SENTINEL = "EDUSAGE_TITLE"
+SUBTITLE_SENTINEL = "EDUSAGE_SUBTITLE"
+BODY_SENTINEL = "EDUSAGE_BODY"
+FIRST_SLIDE_ID = 256
+SLIDE_CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.presentationml.slide+xml"
+SLIDE_RELATIONSHIP_TYPE = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/slide"
+BODY_FONT_SIZE = 1400  # hundredths of a point
+# Characters XML 1.0 can't hold; LLM output occasionally contains them
+INVALID_XML_CHARS = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+
+def split_summary_topics(summaries):
+    topics = []
+    for summary in summaries:
+        blocks = []
+        for line in summary.split('\n'):
+            if line.startswith("Main Topic:"):
+                blocks.append([line])
+            elif blocks and line.strip() and not line.startswith(("=", "###")):
+                blocks[-1].append(line)
+        if not blocks:
+            # No recognizable topic lines; keep the whole summary on one slide
+            blocks = [[line for line in summary.split('\n') if line.strip() and not line.startswith("=")]]
+        topics.extend(block for block in blocks if block)
+    return topics
+
+
+def _xml_text(text):
+    return escape(INVALID_XML_CHARS.sub("", text))
+
+
+class DeckTemplate:
+    """Package parts and slide prototypes rendered once by python-pptx and reused for every deck.
+
+    python-pptx re-scans every relationship when a slide is added, which makes long decks
+    quadratic. Instead, a title slide and a title-and-content slide are built once with
+    sentinel text and kept as XML strings; decks fill them in and write the zip themselves.
+    """
+
+    def __init__(self, template_path=None):
+        # python-pptx is only needed to render the template once, so it is imported here rather than at startup
+        from pptx import Presentation
+        from pptx.util import Inches
+
+        prs = Presentation(template_path)
+        if len(prs.slides):
+            raise ValueError("Deck templates must not contain slides")
+        if template_path is None:
+            prs.slide_width = Inches(16)
+            prs.slide_height = Inches(9)
+
+        slide = prs.slides.add_slide(prs.slide_layouts[0])
+        slide.shapes.title.text = TITLE_SENTINEL
+        slide.placeholders[1].text = SUBTITLE_SENTINEL
+        slide = prs.slides.add_slide(prs.slide_layouts[1])
+        slide.shapes.title.text = TITLE_SENTINEL
+        slide.placeholders[1].text_frame.text = BODY_SENTINEL
+
+        buffer = BytesIO()
+        prs.save(buffer)
+        with zipfile.ZipFile(buffer) as package:
+            parts = {name: package.read(name) for name in package.namelist()}
+
+        self.title_slide = parts.pop("ppt/slides/slide1.xml").decode("utf-8")
+        self.title_slide_rels = parts.pop("ppt/slides/_rels/slide1.xml.rels")
+        self.content_slide = parts.pop("ppt/slides/slide2.xml").decode("utf-8")
+        self.content_slide_rels = parts.pop("ppt/slides/_rels/slide2.xml.rels")
+        self.body_paragraph = f"<a:p><a:r><a:t>{BODY_SENTINEL}</a:t></a:r></a:p>"
+
+        presentation = parts.pop("ppt/presentation.xml").decode("utf-8")
+        self.presentation = re.sub(r"<p:sldIdLst>.*?</p:sldIdLst>", "<p:sldIdLst>{slide_ids}</p:sldIdLst>", presentation)
+        relationships = parts.pop("ppt/_rels/presentation.xml.rels").decode("utf-8")
+        relationships = re.sub(rf'<Relationship [^>]*Type="{SLIDE_RELATIONSHIP_TYPE}"[^>]*/>', "", relationships)
+        self.relationships = relationships.replace("</Relationships>", "{slide_relationships}</Relationships>")
+        content_types = parts.pop("[Content_Types].xml").decode("utf-8")
+        content_types = re.sub(r'<Override PartName="/ppt/slides/[^"]*"[^>]*/>', "", content_types)
+        self.content_types = content_types.replace("</Types>", "{slide_overrides}</Types>")
+        self.parts = parts
+
+    def render_title_slide(self, title, subtitle):
+        return (
+            self.title_slide
+            .replace(f"<a:t>{TITLE_SENTINEL}</a:t>", f"<a:t>{_xml_text(title)}</a:t>")
+            .replace(f"<a:t>{SUBTITLE_SENTINEL}</a:t>", f"<a:t>{_xml_text(subtitle)}</a:t>")
+        )
+
+    def render_content_slide(self, title, lines):
+        paragraphs = []
+        for line in lines:
+            level = "" if line.startswith('•') else ' lvl="1"'
+            paragraphs.append(
+                f'<a:p><a:pPr{level}><a:defRPr sz="{BODY_FONT_SIZE}"><a:solidFill><a:srgbClr val="000000"/>'
+                f"</a:solidFill></a:defRPr></a:pPr><a:r><a:t>{_xml_text(line.strip())}</a:t></a:r></a:p>"
+            )
+        return (
+            self.content_slide
+            .replace(f"<a:t>{TITLE_SENTINEL}</a:t>", f"<a:t>{_xml_text(title)}</a:t>")
+            .replace(self.body_paragraph, "".join(paragraphs) or "<a:p/>")
+        )
+
+
+_default_template = None
+_default_template_lock = threading.Lock()
+
+
+def get_deck_template():
+    global _default_template
+    with _default_template_lock:
+        if _default_template is None:
+            _default_template = DeckTemplate(os.getenv("EDUSAGE_DECK_TEMPLATE") or None)
+        return _default_template
+
+
+class DeckBuilder:
+    """Builds the summary deck slide by slide so a partial deck can be saved at any point.
+
+    Slides are kept as compressed XML (a few hundred bytes each) and written straight into
+    the output stream, so decks with thousands of slides stay small in memory.
+    """
+
+    def __init__(self, filename, template=None):
+        self.filename = filename
+        self.template = template or get_deck_template()
+        self._lock = threading.Lock()
+        self._slides = []
+
+        # Add a title slide
+        self._add_slide(self.template.render_title_slide(os.path.splitext(filename)[0], "Document Summary"), title=True)
+
+    def _add_slide(self, xml, title=False):
+        self._slides.append((zlib.compress(xml.encode("utf-8")), title))
+
+    def add_summary(self, summary, max_slides=None):
+        # A summary covering several sections yields one slide per topic
+        with self._lock:
+            for lines in split_summary_topics([summary]):
+                if max_slides is not None and len(self._slides) >= max_slides:
+                    break
+                self._add_topic_slide(lines)
+
+    def _add_topic_slide(self, lines):
+        title = ""
+        # Handle the topic line
+        if lines[0].startswith("Main Topic:"):
+            title = lines[0].replace("Main Topic:", "Topic:").strip()
+            lines = lines[1:]  # Remove the topic line from further processing
+        self._add_slide(self.template.render_content_slide(title, lines))
+
+    @property
+    def slide_count(self):
+        with self._lock:
+            return len(self._slides)
+
+    def write_to(self, stream):
+        """Writes the .pptx package to a binary stream (a file, BytesIO or HTTP response)."""
+        with self._lock:
+            slides = list(self._slides)
+        template = self.template
+        slide_ids, slide_relationships, slide_overrides = [], [], []
+        for number in range(1, len(slides) + 1):
+            slide_ids.append(f'<p:sldId id="{FIRST_SLIDE_ID + number - 1}" r:id="rIdSlide{number}"/>')
+            slide_relationships.append(
+                f'<Relationship Id="rIdSlide{number}" Type="{SLIDE_RELATIONSHIP_TYPE}" Target="slides/slide{number}.xml"/>'
+            )
+            slide_overrides.append(f'<Override PartName="/ppt/slides/slide{number}.xml" ContentType="{SLIDE_CONTENT_TYPE}"/>')
+
+        with span("deck_render", slides=len(slides)), zipfile.ZipFile(stream, "w", zipfile.ZIP_DEFLATED) as package:
+            package.writestr("[Content_Types].xml", template.content_types.replace("{slide_overrides}", "".join(slide_overrides)))
+            for name, data in template.parts.items():
+                package.writestr(name, data)
+            package.writestr("ppt/presentation.xml", template.presentation.replace("{slide_ids}", "".join(slide_ids)))
+            package.writestr(
+                "ppt/_rels/presentation.xml.rels",
+                template.relationships.replace("{slide_relationships}", "".join(slide_relationships)),
+            )
+            for number, (xml, title) in enumerate(slides, 1):
+                package.writestr(f"ppt/slides/slide{number}.xml", zlib.decompress(xml))
+                package.writestr(
+                    f"ppt/slides/_rels/slide{number}.xml.rels",
+                    template.title_slide_rels if title else template.content_slide_rels,
+                )
+
+    def to_bytes(self):
+        buffer = BytesIO()
+        self.write_to(buffer)
+        return buffer.getvalue()
+
+
+def deck_file_name(file_name):
+    return f"{os.path.splitext(file_name)[0]}_summary.pptx"
+
+
+def create_ppt(summaries, output_dir, filename, max_slides=None):
+    """Writes the summary deck; summaries is a list of summaries or a SummaryTree.
+
+    With a SummaryTree, max_slides picks the most detailed level that fits (the document-level
+    summary if none do). A plain list is cut off once the deck reaches max_slides.
+    """
+    if isinstance(summaries, SummaryTree):
+        # One slide per topic, plus the title slide
+        summaries = summaries.select(max_slides - 1) if max_slides else summaries.summaries()
+    deck = DeckBuilder(filename)
+    for summary in summaries:
+        deck.add_summary(summary, max_slides=max_slides)
+
+    # Stream the presentation straight to disk
+    ppt_path = os.path.join(output_dir, deck_file_name(filename))
+    with open(ppt_path, "wb") as f:
+        deck.write_to(f)
+    return ppt_path
@@ -0,0 +1,322 @@
+import io
+import itertools
+import json
+import logging
+import os
+import re
+import tempfile
+import zipfile
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from langchain_core.documents import Document
+from modules.metrics import span
+from modules.extraction_cache import UNREADABLE_ENTRY_ERRORS, get_extraction_cache, hash_file
+
+SECTION_HEADER_PATH = "//Document/H2"
+# Extraction results up to this size stay in memory; larger ones spill to a temp file
+SPOOL_MAX_BYTES = 32 * 1024 * 1024
+
+_WHITESPACE = re.compile(r"\s*")
+
+
+class _JSONStreamReader:
+    """Decodes JSON values one at a time from a text stream while holding only a small buffer."""
+
+    def __init__(self, stream, chunk_size=64 * 1024):
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self):
+        if self.eof:
+            return False
+        data = self.stream.read(self.chunk_size)
+        if not data:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.pos:] + data
+        self.pos = 0
+        return True
+
+    def peek(self):
+        while True:
+            self.pos = _WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError(f"Expected '{char}' at offset {self.pos} of the JSON stream")
+        self.pos += 1
+
+    def decode(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            # A number at the end of the buffer may continue in the next chunk
+            if end == len(self.buffer) and self._fill():
+                continue
+            self.pos = end
+            return value
+
+
+def iter_json_array(stream, key="elements"):
+    """Yields the items of the top-level array stored under key without loading the whole document."""
+    reader = _JSONStreamReader(stream)
+    reader.expect("{")
+    while reader.peek() != "}":
+        name = reader.decode()
+        reader.expect(":")
+        if name != key:
+            reader.decode()
+        else:
+            reader.expect("[")
+            while reader.peek() != "]":
+                yield reader.decode()
+                if reader.peek() == ",":
+                    reader.pos += 1
+            return
+        if reader.peek() == ",":
+            reader.pos += 1
+
+
+def iter_zip_elements(zip_file, member="structuredData.json"):
+    with zipfile.ZipFile(zip_file) as archive:
+        with archive.open(member) as raw:
+            with io.TextIOWrapper(raw, encoding="utf-8") as stream:
+                yield from iter_json_array(stream)
+
+
+def iter_sections(elements, source=None):
+    """Splits extracted elements into one Document per H2 section.
+
+    Text before the first H2 belongs to the first section, matching the original
+    file_{n}.txt chunking. Sections are numbered from 1.
+    """
+    lines = []
+    section = 1
+    seen_header = False
+    for element in elements:
+        is_header = SECTION_HEADER_PATH in element.get("Path", "")
+        if is_header and seen_header:
+            if "".join(lines).strip():
+                yield Document(page_content="".join(lines), metadata={"source": source, "section": section})
+            lines = []
+            section += 1
+        seen_header = seen_header or is_header
+        text = element.get("Text")
+        if text is not None:
+            lines.append(text + "\n")
+    if "".join(lines).strip():
+        yield Document(page_content="".join(lines), metadata={"source": source, "section": section})
+
+
+class ExtractionBackend:
+    """Turns a PDF into Adobe-style elements ({"Path": ..., "Text": ...}) in reading order."""
+
+    name = None
+
+    def iter_elements(self, input_file_path):
+        raise NotImplementedError
+
+
+class AdobeExtractionBackend(ExtractionBackend):
+    name = "adobe"
+
+    def __init__(self, client_id, client_secret):
+        self.client_id = client_id
+        self.client_secret = client_secret
+
+    def _get_credentials(self):
+        from adobe.pdfservices.operation.auth.credentials import Credentials
+
+        credentials = Credentials.service_principal_credentials_builder().with_client_id(
+            self.client_id).with_client_secret(self.client_secret).build()
+        return credentials
+
+    def _run_extract_operation(self, input_file_path, output_stream):
+        # The SDK is slow to import, so it is only loaded once a PDF is actually sent to Adobe
+        from adobe.pdfservices.operation.execution_context import ExecutionContext
+        from adobe.pdfservices.operation.io.file_ref import FileRef
+        from adobe.pdfservices.operation.pdfops.extract_pdf_operation import ExtractPDFOperation
+        from adobe.pdfservices.operation.pdfops.options.extractpdf.extract_pdf_options import ExtractPDFOptions
+        from adobe.pdfservices.operation.pdfops.options.extractpdf.extract_element_type import ExtractElementType
+
+        credentials = self._get_credentials()
+        execution_context = ExecutionContext.create(credentials)
+        extract_pdf_operation = ExtractPDFOperation.create_new()
+        source = FileRef.create_from_local_file(input_file_path)
+        extract_pdf_operation.set_input(source)
+        extract_pdf_options = ExtractPDFOptions.builder().with_element_to_extract(ExtractElementType.TEXT).build()
+        extract_pdf_operation.set_options(extract_pdf_options)
+
+        result = extract_pdf_operation.execute(execution_context)
+        result.write_to_stream(output_stream)
+
+    def iter_elements(self, input_file_path):
+        with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES) as result_zip:
+            with span("extract_remote", backend=self.name):
+                self._run_extract_operation(input_file_path, result_zip)
+            result_zip.seek(0)
+            with span("extract_parse", backend=self.name):
+                yield from iter_zip_elements(result_zip)
+
+
+# Numbered headings such as "3 Method", "2.1 Training Setup" or "IV. RESULTS"
+_NUMBERED_HEADING = re.compile(r"^(?:(\d{1,2}(?:\.\d{1,2})*)\.?|[IVXLC]+\.)\s+[A-Z]")
+HEADING_SIZE_RATIO = 1.15
+HEADING_MAX_CHARS = 100
+
+
+def _extract_page_lines(input_file_path, page_numbers):
+    """Returns [(text, font_size), ...] for each requested page; runs inside a worker process."""
+    from pypdf import PdfReader
+
+    reader = PdfReader(input_file_path)
+    pages = []
+    for page_number in page_numbers:
+        lines = []
+        current = {"text": [], "size": 0.0, "y": None}
+
+        def flush():
+            text = "".join(current["text"]).strip()
+            if text:
+                lines.append((text, current["size"]))
+            current["text"], current["size"] = [], 0.0
+
+        def visit(text, cm, tm, font_dict, font_size):
+            if not text:
+                return
+            y = tm[5] * cm[3] + cm[5]
+            if current["y"] is not None and abs(y - current["y"]) > 1:
+                flush()
+            current["y"] = y
+            for i, part in enumerate(text.split("\n")):
+                if i:
+                    flush()
+                if part.strip():
+                    size = abs(font_size * (tm[3] or 1) * (cm[3] or 1))
+                    current["size"] = max(current["size"], round(size, 1))
+                current["text"].append(part)
+
+        reader.pages[page_number].extract_text(visitor_text=visit)
+        flush()
+        pages.append(lines)
+    return pages
+
+
+class LocalPDFExtractionBackend(ExtractionBackend):
+    """Offline extraction with pypdf, spreading pages across a process pool.
+
+    Headings are detected heuristically: short lines set noticeably larger than the body
+    text, or lines that look like numbered section headings, become //Document/H2 elements
+    so iter_sections() splits them the same way it splits Adobe output.
+    """
+
+    name = "local"
+
+    def __init__(self, max_workers=None, pages_per_task=8):
+        self.max_workers = max_workers or int(os.getenv("EDUSAGE_LOCAL_EXTRACTION_WORKERS", str(os.cpu_count() or 1)))
+        self.pages_per_task = pages_per_task
+
+    def _iter_page_lines(self, input_file_path):
+        from pypdf import PdfReader
+
+        num_pages = len(PdfReader(input_file_path).pages)
+        batches = [
+            list(range(start, min(start + self.pages_per_task, num_pages)))
+            for start in range(0, num_pages, self.pages_per_task)
+        ]
+        if len(batches) <= 1 or self.max_workers <= 1:
+            for batch in batches:
+                yield from _extract_page_lines(input_file_path, batch)
+            return
+        with ProcessPoolExecutor(max_workers=min(self.max_workers, len(batches))) as executor:
+            # map() returns batches in page order even when workers finish out of order
+            for pages in executor.map(_extract_page_lines, [input_file_path] * len(batches), batches):
+                yield from pages
+
+    def iter_elements(self, input_file_path):
+        with span("extract_text", backend=self.name):
+            pages = list(self._iter_page_lines(input_file_path))
+
+        # Body text size is the size covering the most characters
+        chars_by_size = Counter()
+        for lines in pages:
+            for text, size in lines:
+                chars_by_size[size] += len(text)
+        body_size = chars_by_size.most_common(1)[0][0] if chars_by_size else 0.0
+
+        for lines in pages:
+            for text, size in lines:
+                yield {"Path": self._classify(text, size, body_size), "Text": text}
+
+    def _classify(self, text, size, body_size):
+        if len(text) > HEADING_MAX_CHARS:
+            return "//Document/P"
+        numbered = _NUMBERED_HEADING.match(text)
+        if numbered and not text.endswith("."):
+            if numbered.group(1) and numbered.group(1).count(".") >= 2:
+                # Third-level numbering (1.2.3) is a subsection, not a new section
+                return "//Document/H3"
+            return "//Document/H2"
+        if text.endswith((".", ",", ";")):
+            return "//Document/P"
+        if body_size and size >= body_size * HEADING_SIZE_RATIO:
+            return "//Document/H2"
+        return "//Document/P"
+
+
+def get_extraction_backend(name=None, client_id=None, client_secret=None):
+    name = (name or os.getenv("EDUSAGE_EXTRACTION_BACKEND", "adobe")).lower()
+    if name == AdobeExtractionBackend.name:
+        return AdobeExtractionBackend(
+            client_id or os.getenv("PDF_SERVICES_CLIENT_ID"), client_secret or os.getenv("PDF_SERVICES_CLIENT_SECRET")
+        )
+    if name == LocalPDFExtractionBackend.name:
+        return LocalPDFExtractionBackend()
+    raise ValueError(f"Unsupported extraction backend: {name}")
+
+
+class PDFSectionExtractor:
+    def __init__(self, client_id, client_secret, backend=None):
+        self.backend = backend or get_extraction_backend(client_id=client_id, client_secret=client_secret)
+        self.extraction_cache = get_extraction_cache()
+
+    def iter_elements(self, input_file_path):
+        # Identical PDFs share one extraction per backend across pages and sessions
+        cache_key = f"{self.backend.name}-{hash_file(input_file_path)}"
+        streamed = 0
+        if self.extraction_cache.contains(cache_key):
+            logging.info(f"Using cached extraction {cache_key}.")
+            try:
+                for element in self.extraction_cache.iter_elements(cache_key):
+                    yield element
+                    streamed += 1
+                return
+            except UNREADABLE_ENTRY_ERRORS:
+                # Corrupt, or evicted after the contains() check; the backend's elements come in the
+                # same order, so the ones already streamed from the cache are skipped
+                self.extraction_cache.discard(cache_key)
+        elements = self.extraction_cache.write_through(cache_key, self.backend.iter_elements(input_file_path))
+        yield from itertools.islice(elements, streamed, None)
+
+    def extract_sections(self, input_file_path):
+        try:
+            with span("extract", backend=self.backend.name):
+                for document in iter_sections(self.iter_elements(input_file_path), source=input_file_path):
+                    yield document
+        except Exception:
+            logging.exception("Exception encountered while executing operation")
+            raise
+        logging.info(f"PDF parsing completed for '{input_file_path}'.")
@@ -0,0 +1,154 @@
+import gzip
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import zlib
+from modules.metrics import register_cache
+
+DEFAULT_CACHE_DIR = os.getenv(
+    "EDUSAGE_EXTRACTION_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".edusage", "extractions")
+)
+DEFAULT_MAX_BYTES = int(os.getenv("EDUSAGE_EXTRACTION_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+
+# The section splitter only reads these fields; bounds, fonts etc. are dropped to keep entries small
+CACHED_FIELDS = ("Path", "Text")
+# What reading a truncated, corrupt or concurrently evicted entry raises
+UNREADABLE_ENTRY_ERRORS = (OSError, EOFError, ValueError, zlib.error)
+
+
+def hash_file(file_path, block_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def hash_bytes(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+class ExtractionCache:
+    """Stores extracted PDF elements as gzipped JSON lines, one file per PDF SHA-256.
+
+    Entries are evicted least recently used first (by file mtime, refreshed on every hit)
+    once the directory grows past max_bytes.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, pdf_hash):
+        return os.path.join(self.cache_dir, f"{pdf_hash}.jsonl.gz")
+
+    def contains(self, pdf_hash):
+        return os.path.exists(self._path(pdf_hash))
+
+    def iter_elements(self, pdf_hash):
+        path = self._path(pdf_hash)
+        os.utime(path)
+        self.hits += 1
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                yield json.loads(line)
+
+    def get(self, pdf_hash):
+        if not self.contains(pdf_hash):
+            return None
+        try:
+            return list(self.iter_elements(pdf_hash))
+        except UNREADABLE_ENTRY_ERRORS:
+            self.discard(pdf_hash)
+            return None
+
+    def discard(self, pdf_hash):
+        """Drops an entry that could not be read, so the next lookup extracts the PDF again."""
+        logging.warning(f"Discarding unreadable extraction cache entry {pdf_hash}")
+        self._remove(pdf_hash)
+
+    def write_through(self, pdf_hash, elements):
+        """Yields elements unchanged while caching them; the entry is committed only once fully consumed."""
+        self.misses += 1
+        # Write to a temp file first so readers never see a half-written entry
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as raw, gzip.GzipFile(fileobj=raw, mode="wb") as f:
+                for element in elements:
+                    cached = {k: element[k] for k in CACHED_FIELDS if k in element}
+                    f.write(json.dumps(cached, separators=(",", ":")).encode("utf-8"))
+                    f.write(b"\n")
+                    yield element
+            os.replace(tmp_path, self._path(pdf_hash))
+        finally:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+        self._evict()
+
+    def put(self, pdf_hash, elements):
+        for _ in self.write_through(pdf_hash, elements):
+            pass
+
+    def _remove(self, pdf_hash):
+        try:
+            os.unlink(self._path(pdf_hash))
+        except FileNotFoundError:
+            pass
+
+    def _entries(self):
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".jsonl.gz"):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.cache_dir, name))
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name))
+        return entries
+
+    def _evict(self):
+        with self._lock:
+            entries = sorted(self._entries())
+            total = sum(size for _, size, _ in entries)
+            for _, size, name in entries:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.unlink(os.path.join(self.cache_dir, name))
+                except FileNotFoundError:
+                    pass
+                total -= size
+                logging.info(f"Evicted extraction cache entry {name}")
+
+    def size_bytes(self):
+        return sum(size for _, size, _ in self._entries())
+
+    def stats(self):
+        entries = self._entries()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": len(entries),
+            "bytes": sum(size for _, size, _ in entries),
+        }
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_extraction_cache():
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = ExtractionCache()
+            register_cache("extraction", _default_cache.stats)
+        return _default_cache
@@ -1,29 +1,48 @@
 import logging
 import os
-import json
-import zipfile
-from adobe.pdfservices.operation.auth.credentials import Credentials
-from adobe.pdfservices.operation.execution_context import ExecutionContext
-from adobe.pdfservices.operation.io.file_ref import FileRef
-from adobe.pdfservices.operation.pdfops.extract_pdf_operation import ExtractPDFOperation
-from adobe.pdfservices.operation.pdfops.options.extractpdf.extract_pdf_options import ExtractPDFOptions
-from adobe.pdfservices.operation.pdfops.options.extractpdf.extract_element_type import ExtractElementType
-from langchain_openai import ChatOpenAI
-from langchain_community.document_loaders import TextLoader
+import re
+from typing import List, Optional
+from langchain_core.exceptions import OutputParserException
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import ChatPromptTemplate
+from langchain.pydantic_v1 import BaseModel, Field, ValidationError
 from dotenv import load_dotenv
+from modules.llm_cache import CachedChain
+from modules.rate_limit import get_chat_model
+from modules.checkpoint import open_journal, retry_section, section_hash
+from modules.extraction import PDFSectionExtractor
+from modules.metrics import span, traced
+from modules.chunking import MODEL_CONTEXT_TOKENS, DEFAULT_CONTEXT_TOKENS, get_token_budget, pack_sections
 import asyncio
 
 load_dotenv()
 
 logging.basicConfig(level=logging.INFO)
 
-class PDFExtract:
-    def __init__(self, client_id, client_secret):
-        self.client_id = client_id
-        self.client_secret = client_secret
-        self.llm = ChatOpenAI(temperature=0, model_name="gpt-3.5-turbo-16k")
+GLOSSARY_ENTRY_PATTERN = re.compile(
+    r"TERM:\s*(?P<term>.+?)\s*\n\s*DEFINITION:\s*(?P<definition>.+?)\s*\n\s*DETAILS:\s*(?P<details>.+?)\s*(?=\n\s*TERM:|\Z)",
+    re.DOTALL,
+)
+# Rough completion size of one structured entry, and the most a single reply may use
+GLOSSARY_ENTRY_TOKENS = 200
+MAX_REPLY_TOKENS = 4096
+# In-flight extraction requests per glossary
+GLOSSARY_MAX_CONCURRENCY = int(os.getenv("GLOSSARY_MAX_CONCURRENCY", "8"))
+
+class GlossaryEntry(BaseModel):
+    section: Optional[int] = Field(description="The number from the '### Section n' line the entry was taken from")
+    term: str = Field(description="The main term or concept discussed in the section")
+    definition: str = Field(description="A clear and concise definition of the term")
+    details: str = Field(description="Formulas, related concepts or key characteristics; 'N/A' if there are none")
+
+class GlossaryEntries(BaseModel):
+    entries: List[GlossaryEntry] = Field(description="One entry per suitable section, in order; empty if no section is suitable")
+
+class PDFExtract(PDFSectionExtractor):
+    def __init__(self, client_id, client_secret, backend=None):
+        super().__init__(client_id, client_secret, backend=backend)
+        self.llm = get_chat_model("gpt-3.5-turbo-16k", temperature=0)
+        self.token_budget = get_token_budget(self.llm.model_name)
         # Add the glossary map prompt
         self.glossary_map_template = """
         You are an AI assistant creating a glossary entry for a technical term or concept. Given the following content, please:
@@ -33,7 +52,11 @@ class PDFExtract:
         3. Include any relevant additional information such as formulas, related concepts, or key characteristics.
         4. If the content isn't suitable for a glossary entry, respond with just the word "SKIP".
 
-        Format your response as follows:
+        The content may contain several sections, each starting with a line like "### Section 3".
+        Create one entry per suitable section, in order, separated by a blank line, and leave out sections
+        that aren't suitable. Respond with "SKIP" only if none of them are.
+
+        Format each entry as follows:
         TERM: [The identified term]
         DEFINITION: [Concise definition]
         DETAILS: [Any additional relevant information. If none, write "N/A"]
@@ -41,113 +64,132 @@ class PDFExtract:
         Content:
         {context}
 
-        Glossary Entry:
+        Glossary Entries:
         """
         self.glossary_map_prompt = ChatPromptTemplate([("human", self.glossary_map_template)])
-        self.glossary_map_chain = self.glossary_map_prompt | self.llm | StrOutputParser()
-
-    def _get_credentials(self):
-        credentials = Credentials.service_principal_credentials_builder().with_client_id(
-            self.client_id).with_client_secret(self.client_secret).build()
-        return credentials
-
-    def _zip_file(self, output_path, unzip_dir):
-        with zipfile.ZipFile(output_path, 'r') as zip_ref:
-            zip_ref.extractall(unzip_dir)
+        self.glossary_map_chain = CachedChain(
+            self.glossary_map_prompt | self.llm | StrOutputParser(),
+            model_name=self.llm.model_name,
+            temperature=self.llm.temperature,
+            template=self.glossary_map_template,
+            name="glossary",
+        )
+
+        # Batched mode: many sections per request, entries returned as a structured list
+        self.glossary_batch_template = """
+        You are an AI assistant creating glossary entries for technical terms and concepts.
+        The content below contains several sections, each starting with a line like "### Section 3".
+        For every section that discusses a technical term or concept:
 
-    def _parse_json(self, json_file_path):
-        with open(json_file_path, "r") as json_file:
-            content = json.loads(json_file.read())
-        pdf_element = content["elements"]
-        return pdf_element
-
-    def get_files_from_dir(self, dir):
-        files = [os.path.join(dir, f) for f in os.listdir(dir) if os.path.isfile(os.path.join(dir, f))]
-        return files
+        1. Identify the main term or concept being discussed.
+        2. Provide a clear and concise definition.
+        3. Include any relevant additional information such as formulas, related concepts, or key characteristics.
 
-    def load_docs(self, file_path):
-        loader = TextLoader(file_path)
-        docs = loader.load()
-        return docs
+        Leave out sections that aren't suitable for a glossary entry, and return no entries if none are.
 
-    def parse_pdf(self, input_file_path, output_path, unzip_dir, chunked_dir):
+        Content:
+        {context}
+        """
+        self.glossary_batch_prompt = ChatPromptTemplate([("human", self.glossary_batch_template)])
+        self.glossary_batch_chain = CachedChain(
+            self.glossary_batch_prompt | self.llm.with_structured_output(GlossaryEntries),
+            model_name=self.llm.model_name,
+            temperature=self.llm.temperature,
+            template=self.glossary_batch_template,
+            output_schema=GlossaryEntries,
+            name="glossary_batch",
+            completion_tokens=self.batch_size() * GLOSSARY_ENTRY_TOKENS,
+        )
+
+    def batch_size(self):
+        # The reply must fit next to the packed input, so fewer sections fit when the input budget is larger
+        context_tokens = MODEL_CONTEXT_TOKENS.get(self.llm.model_name, DEFAULT_CONTEXT_TOKENS)
+        reply_tokens = min(MAX_REPLY_TOKENS, context_tokens - self.token_budget)
+        return max(1, reply_tokens // GLOSSARY_ENTRY_TOKENS)
+
+    async def extract_entries(self, doc):
+        """Returns (term, definition, details) tuples for one packed request."""
         try:
-            credentials = self._get_credentials()
-            execution_context = ExecutionContext.create(credentials)
-            extract_pdf_operation = ExtractPDFOperation.create_new()
-            source = FileRef.create_from_local_file(input_file_path)
-            extract_pdf_operation.set_input(source)
-            extract_pdf_options = ExtractPDFOptions.builder().with_element_to_extract(ExtractElementType.TEXT).build()
-            extract_pdf_operation.set_options(extract_pdf_options)
-
-            result = extract_pdf_operation.execute(execution_context)
-            result.save_as(output_path)
-            self._zip_file(output_path, unzip_dir)
-            json_file_path = os.path.join(unzip_dir, "structuredData.json")
-            elements = self._parse_json(json_file_path)
-
-            file_split = 0
-            FIRST_TIME_HEADER = True
-            file_name = os.path.join(chunked_dir, f"file_{file_split}.txt")
-            parsed_file = open(file_name, "a", encoding="utf-8")
-            for element in elements:
-                if "//Document/H2" in element["Path"]:
-                    hdr_txt = element["Text"]
-                    if FIRST_TIME_HEADER:
-                        FIRST_TIME_HEADER = False
-                        parsed_file.write(hdr_txt)
-                        parsed_file.write("\n")
-                    else:
-                        parsed_file.close()
-                        file_split = file_split + 1
-                        file_name = os.path.join(chunked_dir, f"file_{file_split}.txt")
-                        parsed_file = open(file_name, "a", encoding="utf-8")
-                        parsed_file.write(hdr_txt)
-                        parsed_file.write("\n")
-                else:
-                    try:
-                        text_content = element["Text"]
-                        parsed_file.write(text_content)
-                        parsed_file.write("\n")
-                    except KeyError:
-                        pass
-            parsed_file.close()
-            logging.info(f"PDF parsing completed. Chunks saved in '{chunked_dir}'.")
-        except Exception as e:
-            print(e)
-            logging.exception("Exception encountered while executing operation")
-
-    async def create_glossary(self, chunked_dir):
+            response = await self.glossary_batch_chain.ainvoke({"context": doc.page_content})
+            return [(entry.term, entry.definition, entry.details) for entry in response.entries]
+        except (OutputParserException, ValidationError) as e:
+            # A malformed function call shouldn't lose the batch; retry it with the plain text prompt.
+            # Anything else (rate limits, auth, network) would fail the same way again, so it is raised
+            logging.warning(f"Structured glossary extraction failed ({e}); retrying sections {doc.metadata.get('sections')} as text.")
+            return await self.parse_text_entries(doc)
+
+    async def parse_text_entries(self, doc):
+        response = await self.glossary_map_chain.ainvoke({"context": doc.page_content})
+        if response.strip().upper().startswith("SKIP"):
+            return []
+        entries = list(GLOSSARY_ENTRY_PATTERN.finditer(response.strip()))
+        if not entries:
+            print(f"Unexpected result format: {response}")
+        return [(entry.group("term"), entry.group("definition"), entry.group("details")) for entry in entries]
+
+    @traced("glossary")
+    async def create_glossary(self, docs, output_dir, progress_callback=None, batched=True, checkpoint=True,
+                              max_concurrency=GLOSSARY_MAX_CONCURRENCY):
         glossary = {}
-        files = self.get_files_from_dir(chunked_dir)
-        
-        async def process_document(file):
-            docs = self.load_docs(file)
-            for doc in docs:
-                print(f"Processing document: {file}")
-                
-                response = await self.glossary_map_chain.ainvoke({"context": doc.page_content})
-                
-                if not response.strip().upper().startswith("SKIP"):
-                    try:
-                        lines = response.strip().split('\n')
-                        term = lines[0].split('TERM:')[1].strip()
-                        definition = lines[1].split('DEFINITION:')[1].strip()
-                        details = lines[2].split('DETAILS:')[1].strip()
-                        
-                        glossary_entry = f"{definition}\n\nAdditional Details: {details}"
-                        glossary[term] = glossary_entry
-                        print(f"Generated glossary entry: {term}")
-                    except IndexError:
-                        print(f"Unexpected result format: {response}")
-                else:
-                    print(f"Skipped document: {file}")
-
-        document_tasks = [process_document(file) for file in files]
-        await asyncio.gather(*document_tasks)
+        with span("pack_sections"):
+            if batched:
+                docs = pack_sections(docs, self.token_budget, self.llm.model_name, max_sections=self.batch_size())
+            else:
+                docs = pack_sections(docs, self.token_budget, self.llm.model_name)
+        completed = 0
+
+        template = self.glossary_batch_template if batched else self.glossary_map_template
+        journal = open_journal("glossary", docs, self.llm.model_name, template) if checkpoint else None
+        if journal is not None and len(journal):
+            print(f"Resuming: {len(journal)} of {len(docs)} section batches were already processed")
+        failed = {}
+        # Bound the number of in-flight LLM requests rather than leaving every batch to the rate limiter
+        semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+        async def process_document(doc):
+            sections = doc.metadata.get("sections")
+            key = section_hash(doc.page_content)
+            if journal is not None and key in journal:
+                entries = journal.get(key)
+            else:
+                print(f"Processing sections: {sections}")
+                extract = self.extract_entries if batched else self.parse_text_entries
+                try:
+                    async with semaphore:
+                        entries = await retry_section(lambda: extract(doc), f"Glossary extraction for sections {sections}")
+                except Exception as e:
+                    logging.error(f"Glossary extraction for sections {sections} failed: {e}")
+                    failed[tuple(sections or ())] = e
+                    return
+                if journal is not None:
+                    journal.record(key, [list(entry) for entry in entries])
+
+            for term, definition, details in entries:
+                glossary[term] = f"{definition}\n\nAdditional Details: {details}"
+                print(f"Generated glossary entry: {term}")
+            if not entries:
+                print(f"Skipped sections: {sections}")
+
+            nonlocal completed
+            completed += 1
+            if progress_callback is not None:
+                progress_callback(completed, len(docs))
+
+        document_tasks = [process_document(doc) for doc in docs]
+        try:
+            await asyncio.gather(*document_tasks)
+        finally:
+            if journal is not None:
+                journal.close()
+        if failed:
+            first_error = next(iter(failed.values()))
+            raise RuntimeError(
+                f"{len(failed)} of {len(docs)} section batches could not be processed ({first_error}). "
+                "The finished ones were saved; run the extraction again to retry the rest."
+            ) from first_error
 
         if glossary:
-            output_file = os.path.join(chunked_dir, "technical_glossary.txt")
+            output_file = os.path.join(output_dir, "technical_glossary.txt")
             with open(output_file, "w") as f:
                 for term, entry in glossary.items():
                     f.write(f"{term}:\n{entry}\n")
@@ -157,4 +199,7 @@ class PDFExtract:
         else:
             print("No glossary entries were generated as all documents were skipped.")
 
+        if journal is not None:
+            # The outputs are complete, so there is nothing left to resume
+            journal.discard()
         return glossary
\ No newline at end of file
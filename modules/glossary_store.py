@@ -0,0 +1,168 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+
+DEFAULT_STORE_PATH = os.getenv(
+    "EDUSAGE_GLOSSARY_STORE_PATH", os.path.join(os.path.expanduser("~"), ".edusage", "glossary.sqlite3")
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    doc_key TEXT PRIMARY KEY, name TEXT, term_count INTEGER NOT NULL, created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS entries (
+    term_key TEXT NOT NULL, doc_key TEXT NOT NULL, term TEXT NOT NULL, definition TEXT NOT NULL,
+    position INTEGER NOT NULL, PRIMARY KEY (term_key, doc_key)
+);
+CREATE INDEX IF NOT EXISTS entries_doc_key ON entries (doc_key, position);
+CREATE VIRTUAL TABLE IF NOT EXISTS entries_fts USING fts5(
+    term, definition, content='entries', content_rowid='rowid', tokenize='unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS entries_ai AFTER INSERT ON entries BEGIN
+    INSERT INTO entries_fts (rowid, term, definition) VALUES (new.rowid, new.term, new.definition);
+END;
+CREATE TRIGGER IF NOT EXISTS entries_ad AFTER DELETE ON entries BEGIN
+    INSERT INTO entries_fts (entries_fts, rowid, term, definition) VALUES ('delete', old.rowid, old.term, old.definition);
+END;
+"""
+
+
+def normalize_term(term):
+    """Case-, accent- and punctuation-insensitive key, so "TCP/IP" and "tcp-ip" merge."""
+    term = unicodedata.normalize("NFKD", term)
+    term = "".join(ch for ch in term if not unicodedata.combining(ch)).casefold()
+    return " ".join(re.findall(r"\w+", term))
+
+
+class GlossaryStore:
+    """Glossary entries from every processed document in one SQLite database with an FTS5 index.
+
+    Entries are keyed by (normalized term, document), so the same term extracted from several
+    documents is merged at lookup time. Prefix lookups use the term_key primary key; full-text
+    queries over terms and definitions go through FTS5 and are ranked with bm25.
+    """
+
+    def __init__(self, path=DEFAULT_STORE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+
+    def has_document(self, doc_key):
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM documents WHERE doc_key = ?", (doc_key,)).fetchone() is not None
+
+    def add_document(self, doc_key, glossary, name=None):
+        """Replaces the entries stored for doc_key with glossary ({term: definition})."""
+        entries = {}
+        for position, (term, definition) in enumerate(glossary.items()):
+            term_key = normalize_term(term)
+            if not term_key:
+                continue
+            # Variants of one term in the same document keep the fuller definition and the first position
+            if term_key in entries:
+                _, existing, first_position = entries[term_key]
+                if len(definition) > len(existing):
+                    entries[term_key] = (term, definition, first_position)
+            else:
+                entries[term_key] = (term, definition, position)
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.execute("DELETE FROM entries WHERE doc_key = ?", (doc_key,))
+                self._conn.executemany(
+                    "INSERT INTO entries (term_key, doc_key, term, definition, position) VALUES (?, ?, ?, ?, ?)",
+                    [(term_key, doc_key, term, definition, position) for term_key, (term, definition, position) in entries.items()],
+                )
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO documents (doc_key, name, term_count, created_at) VALUES (?, ?, ?, ?)",
+                    (doc_key, name, len(entries), time.time()),
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def get_document(self, doc_key):
+        """Returns {term: definition} for doc_key in extraction order, or None if it was never stored."""
+        with self._lock:
+            if self._conn.execute("SELECT 1 FROM documents WHERE doc_key = ?", (doc_key,)).fetchone() is None:
+                return None
+            rows = self._conn.execute(
+                "SELECT term, definition FROM entries WHERE doc_key = ? ORDER BY position", (doc_key,)
+            ).fetchall()
+        return dict(rows)
+
+    def delete_document(self, doc_key):
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.execute("DELETE FROM entries WHERE doc_key = ?", (doc_key,))
+            self._conn.execute("DELETE FROM documents WHERE doc_key = ?", (doc_key,))
+            self._conn.execute("COMMIT")
+
+    def _prefix_keys(self, key, limit):
+        # A range scan on the primary key; no LIKE, so the index is always used
+        rows = self._conn.execute(
+            "SELECT DISTINCT term_key FROM entries WHERE term_key >= ? AND term_key < ? ORDER BY term_key LIMIT ?",
+            (key, key + "\U0010ffff", limit),
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def _full_text_keys(self, key, limit):
+        match = " ".join(f'"{token}"*' for token in key.split())
+        rows = self._conn.execute(
+            "SELECT entries.term_key FROM entries_fts JOIN entries ON entries.rowid = entries_fts.rowid "
+            "WHERE entries_fts MATCH ? ORDER BY bm25(entries_fts, 10.0, 1.0) LIMIT ?",
+            (match, limit * 4),
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def search(self, query, limit=20):
+        """Terms starting with query first, then full-text matches in terms and definitions.
+
+        Returns dicts with the term, its fullest definition and the number of documents it appears in.
+        """
+        key = normalize_term(query)
+        if not key:
+            return []
+        with self._lock:
+            term_keys = list(dict.fromkeys(self._prefix_keys(key, limit) + self._full_text_keys(key, limit)))[:limit]
+            if not term_keys:
+                return []
+            placeholders = ",".join("?" * len(term_keys))
+            rows = self._conn.execute(
+                f"SELECT term_key, term, definition FROM entries WHERE term_key IN ({placeholders})", term_keys
+            ).fetchall()
+        merged = {}
+        for term_key, term, definition in rows:
+            if term_key not in merged:
+                merged[term_key] = {"term": term, "definition": definition, "documents": 0}
+            entry = merged[term_key]
+            entry["documents"] += 1
+            if len(definition) > len(entry["definition"]):
+                entry.update(term=term, definition=definition)
+        return [merged[term_key] for term_key in term_keys]
+
+    def stats(self):
+        with self._lock:
+            documents = self._conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+            terms = self._conn.execute("SELECT COUNT(DISTINCT term_key) FROM entries").fetchone()[0]
+        return {"documents": documents, "terms": terms}
+
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+
+def get_glossary_store():
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = GlossaryStore()
+        return _default_store
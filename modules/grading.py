@@ -0,0 +1,179 @@
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+import numpy as np
+from modules.metrics import span
+
+# Weights of character n-gram similarity, word TF-IDF similarity and reference keyword coverage
+CHAR_WEIGHT = 0.35
+WORD_WEIGHT = 0.25
+KEYWORD_WEIGHT = 0.4
+# Scores at or above CORRECT_THRESHOLD pass, below INCORRECT_THRESHOLD fail, and the rest are borderline
+CORRECT_THRESHOLD = 0.6
+INCORRECT_THRESHOLD = 0.35
+
+CORRECT = "correct"
+INCORRECT = "incorrect"
+BORDERLINE = "borderline"
+
+_WORD = re.compile(r"[a-z0-9]+(?:\.[0-9]+)*")
+# Suffix and replacement, tried in order; a crude stemmer is enough to match inflected keywords
+_SUFFIXES = (("ations", ""), ("ation", ""), ("ings", ""), ("ing", ""), ("ies", "y"), ("ed", ""), ("es", ""), ("ly", ""), ("s", ""))
+
+
+def _stem(word):
+    for suffix, replacement in _SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            return word[:-len(suffix)] + replacement
+    return word
+
+
+def keywords(text):
+    """Content words of text, stemmed and in order of first appearance."""
+    from sklearn.feature_extraction.text import ENGLISH_STOP_WORDS
+
+    seen = OrderedDict()
+    for word in _WORD.findall(text.lower()):
+        if word in ENGLISH_STOP_WORDS or (len(word) < 3 and not word.isdigit()):
+            continue
+        seen.setdefault(_stem(word), word)
+    return seen
+
+
+def references_key(references):
+    digest = hashlib.sha256()
+    for reference in references:
+        digest.update(reference.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class _ReferenceFeatures:
+    def __init__(self, references):
+        from sklearn.feature_extraction.text import TfidfVectorizer
+
+        # Character n-grams tolerate typos and inflections; words weigh the rarer terms
+        self.char_vectorizer = TfidfVectorizer(analyzer="char_wb", ngram_range=(3, 5), sublinear_tf=True, dtype=np.float32)
+        self.word_vectorizer = TfidfVectorizer(stop_words="english", sublinear_tf=True, dtype=np.float32)
+        self.char_matrix = self._fit(self.char_vectorizer, references)
+        self.word_matrix = self._fit(self.word_vectorizer, references)
+        self.keywords = [keywords(reference) for reference in references]
+
+    @staticmethod
+    def _fit(vectorizer, texts):
+        try:
+            # Rows come back L2-normalized, so row-wise dot products are cosine similarity
+            return vectorizer.fit_transform(texts).tocsr()
+        except ValueError:
+            # Only stop words or empty references; that similarity is left out
+            return None
+
+    @staticmethod
+    def _similarity(vectorizer, matrix, answers):
+        if matrix is None:
+            return None
+        similarity = np.asarray(matrix.multiply(vectorizer.transform(answers)).sum(axis=1)).ravel()
+        # transform() normalizes over the references' vocabulary only; scale by the share of the
+        # answer inside it so padding an answer with unrelated text doesn't raise its similarity
+        analyzer = vectorizer.build_analyzer()
+        for i, answer in enumerate(answers):
+            terms = analyzer(answer)
+            if terms:
+                similarity[i] *= np.sqrt(sum(term in vectorizer.vocabulary_ for term in terms) / len(terms))
+        return similarity
+
+    def similarities(self, answers):
+        """Character n-gram and word cosine similarity of each answer to its own reference (None if unavailable)."""
+        return (
+            self._similarity(self.char_vectorizer, self.char_matrix, answers),
+            self._similarity(self.word_vectorizer, self.word_matrix, answers),
+        )
+
+
+class AnswerGrader:
+    """Scores open-ended answers against reference answers without calling the model.
+
+    Each score mixes character n-gram and word TF-IDF cosine similarity with the share of
+    the reference's keywords the answer mentions. Vectorizers are fitted once per set of
+    references (one quiz) and kept in a small LRU, so grading a whole attempt is a few
+    sparse products.
+    """
+
+    def __init__(self, max_quizzes=64):
+        self.max_quizzes = max_quizzes
+        self._features = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get_features(self, references):
+        key = references_key(references)
+        with self._lock:
+            if key in self._features:
+                self._features.move_to_end(key)
+                return self._features[key]
+        features = _ReferenceFeatures(references)
+        with self._lock:
+            self._features[key] = features
+            while len(self._features) > self.max_quizzes:
+                self._features.popitem(last=False)
+        return features
+
+    def grade(self, references, answers, escalate=None, questions=None):
+        """Returns one grade dict per answer: score, verdict and the reference keywords it missed.
+
+        escalate, if given, is called once with the borderline cases as a list of
+        {"question", "reference", "answer"} dicts and returns True/False for each; those
+        grades get its verdict and escalated=True.
+        """
+        if len(references) != len(answers):
+            raise ValueError("Every answer needs a reference answer.")
+        if not references:
+            return []
+        answers = [(answer or "").strip() for answer in answers]
+        with span("grade_answers", answers=len(answers)):
+            features = self._get_features(list(references))
+            char_similarity, word_similarity = features.similarities(answers)
+
+            grades = []
+            for i, answer in enumerate(answers):
+                reference_keywords = features.keywords[i]
+                answer_keywords = keywords(answer)
+                missing = [word for stem, word in reference_keywords.items() if stem not in answer_keywords]
+                parts = []
+                if char_similarity is not None:
+                    parts.append((CHAR_WEIGHT, float(char_similarity[i])))
+                if word_similarity is not None:
+                    parts.append((WORD_WEIGHT, float(word_similarity[i])))
+                if reference_keywords:
+                    parts.append((KEYWORD_WEIGHT, 1 - len(missing) / len(reference_keywords)))
+                total_weight = sum(weight for weight, _ in parts)
+                score = sum(weight * value for weight, value in parts) / total_weight if answer and total_weight else 0.0
+                if score >= CORRECT_THRESHOLD:
+                    verdict = CORRECT
+                elif score < INCORRECT_THRESHOLD:
+                    verdict = INCORRECT
+                else:
+                    verdict = BORDERLINE
+                grades.append({"score": round(score, 3), "verdict": verdict, "missing_keywords": missing, "escalated": False})
+
+        borderline = [i for i, grade in enumerate(grades) if grade["verdict"] == BORDERLINE]
+        if escalate is not None and borderline:
+            cases = [
+                {"question": questions[i] if questions else "", "reference": references[i], "answer": answers[i]}
+                for i in borderline
+            ]
+            for i, correct in zip(borderline, escalate(cases)):
+                grades[i].update(verdict=CORRECT if correct else INCORRECT, escalated=True)
+        return grades
+
+
+_default_grader = None
+_default_grader_lock = threading.Lock()
+
+
+def get_answer_grader():
+    global _default_grader
+    with _default_grader_lock:
+        if _default_grader is None:
+            _default_grader = AnswerGrader()
+        return _default_grader
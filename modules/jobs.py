@@ -0,0 +1,142 @@
+import asyncio
+import inspect
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_MAX_CONCURRENT_JOBS = int(os.getenv("EDUSAGE_MAX_CONCURRENT_JOBS", "2"))
+# Finished jobs are kept this long so users can reconnect and download their results
+DEFAULT_RETENTION_SECONDS = int(os.getenv("EDUSAGE_JOB_RETENTION_SECONDS", "3600"))
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class Job:
+    def __init__(self, kind, key=None):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.key = key
+        self.status = QUEUED
+        self.completed = 0
+        self.total = 0
+        self.message = "Waiting for a free worker..."
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+        # Intermediate results a page can show before the job finishes
+        self.partial = {}
+        self._lock = threading.Lock()
+
+    def update_progress(self, completed, total, message=None):
+        with self._lock:
+            self.completed = completed
+            self.total = total
+            if message is not None:
+                self.message = message
+
+    def publish(self, name, value):
+        with self._lock:
+            self.partial[name] = value
+
+    def get_partial(self, name, default=None):
+        with self._lock:
+            return self.partial.get(name, default)
+
+    def set_message(self, message):
+        with self._lock:
+            self.message = message
+
+    @property
+    def fraction(self):
+        with self._lock:
+            return self.completed / self.total if self.total else 0.0
+
+    @property
+    def finished(self):
+        return self.status in (DONE, FAILED)
+
+
+class JobManager:
+    """Runs summarize/glossary/quiz work on a bounded worker pool outside the Streamlit script run.
+
+    Jobs outlive the session that started them: a page that reconnects with the job id (or submits
+    the same key again) picks up the running job or its finished result instead of starting over.
+    """
+
+    def __init__(self, max_concurrent_jobs=DEFAULT_MAX_CONCURRENT_JOBS, retention_seconds=DEFAULT_RETENTION_SECONDS):
+        self.max_concurrent_jobs = max_concurrent_jobs
+        self.retention_seconds = retention_seconds
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrent_jobs, thread_name_prefix="edusage-job")
+        self._jobs = {}
+        self._jobs_by_key = {}
+        self._lock = threading.Lock()
+
+    def submit(self, kind, fn, *args, key=None, **kwargs):
+        """Schedules fn(job, *args, **kwargs); fn may be a coroutine function."""
+        self._prune()
+        with self._lock:
+            if key is not None and key in self._jobs_by_key:
+                existing = self._jobs[self._jobs_by_key[key]]
+                if existing.status != FAILED:
+                    return existing
+            job = Job(kind, key)
+            self._jobs[job.id] = job
+            if key is not None:
+                self._jobs_by_key[key] = job.id
+        self._executor.submit(self._run, job, fn, args, kwargs)
+        return job
+
+    def _run(self, job, fn, args, kwargs):
+        job.status = RUNNING
+        job.set_message("Starting...")
+        try:
+            if inspect.iscoroutinefunction(fn):
+                job.result = asyncio.run(fn(job, *args, **kwargs))
+            else:
+                job.result = fn(job, *args, **kwargs)
+            job.status = DONE
+            job.set_message("Finished")
+        except Exception as e:
+            logging.exception(f"{job.kind} job {job.id} failed")
+            job.error = str(e)
+            job.status = FAILED
+            job.set_message("Failed")
+        finally:
+            job.finished_at = time.time()
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _prune(self):
+        cutoff = time.time() - self.retention_seconds
+        with self._lock:
+            expired = [job for job in self._jobs.values() if job.finished_at is not None and job.finished_at < cutoff]
+            for job in expired:
+                del self._jobs[job.id]
+                if self._jobs_by_key.get(job.key) == job.id:
+                    del self._jobs_by_key[job.key]
+
+    def stats(self):
+        with self._lock:
+            jobs = list(self._jobs.values())
+        return {status: sum(job.status == status for job in jobs) for status in (QUEUED, RUNNING, DONE, FAILED)}
+
+
+_default_manager = None
+_default_manager_lock = threading.Lock()
+
+
+def get_job_manager():
+    global _default_manager
+    with _default_manager_lock:
+        if _default_manager is None:
+            _default_manager = JobManager()
+        return _default_manager
@@ -0,0 +1,306 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from langchain_core.callbacks import BaseCallbackHandler
+from modules.metrics import metrics_enabled, record_llm_call, register_cache, with_callback
+from modules.rate_limit import DEFAULT_COMPLETION_TOKENS, get_rate_limiter
+
+DEFAULT_CACHE_PATH = os.getenv(
+    "EDUSAGE_LLM_CACHE_PATH", os.path.join(os.path.expanduser("~"), ".edusage", "llm_cache.sqlite3")
+)
+DEFAULT_MAX_BYTES = int(os.getenv("EDUSAGE_LLM_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+# Hits only refresh last_access in memory; the timestamps are written in one batch this often
+ACCESS_FLUSH_SECONDS = 30
+ACCESS_FLUSH_SIZE = 256
+
+
+class TokenUsageHandler(BaseCallbackHandler):
+    """Collects token usage from OpenAI responses, estimating it when the provider reports none (streaming)."""
+
+    def __init__(self, model_name):
+        self.model_name = model_name
+        self.prompt_tokens = None
+        self.completion_tokens = None
+        self._prompt_text = ""
+
+    def on_chat_model_start(self, serialized, messages, **kwargs):
+        self._prompt_text = "\n".join(str(message.content) for batch in messages for message in batch)
+
+    def on_llm_end(self, response, **kwargs):
+        from modules.chunking import count_tokens
+
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        generation = response.generations[0][0] if response.generations and response.generations[0] else None
+        message = getattr(generation, "message", None)
+        usage_metadata = getattr(message, "usage_metadata", None) or {}
+        if usage:
+            self.prompt_tokens, self.completion_tokens = usage.get("prompt_tokens"), usage.get("completion_tokens")
+        elif usage_metadata:
+            self.prompt_tokens, self.completion_tokens = usage_metadata.get("input_tokens"), usage_metadata.get("output_tokens")
+        else:
+            completion = generation.text if generation is not None else ""
+            if not completion and message is not None:
+                # Structured output arrives as function-call arguments rather than text
+                completion = json.dumps(message.additional_kwargs)
+            self.prompt_tokens = count_tokens(self._prompt_text, self.model_name)
+            self.completion_tokens = count_tokens(completion, self.model_name)
+
+
+def cache_bypassed():
+    return os.getenv("EDUSAGE_LLM_CACHE_BYPASS", "").lower() in ("1", "true", "yes")
+
+
+def hash_text(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def make_cache_key(model_name, temperature, template_hash, inputs):
+    payload = json.dumps(
+        {"model": model_name, "temperature": temperature, "template": template_hash, "inputs": inputs},
+        sort_keys=True,
+        default=str,
+    )
+    return hash_text(payload)
+
+
+class LLMResponseCache:
+    """On-disk LLM response cache with least-recently-used eviction once max_bytes is exceeded.
+
+    The total size is read once and kept up to date on every write, so eviction only scans
+    the table when the cache is actually over its cap. Access times of hits are batched.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)")
+        self._total_bytes = self._sum_sizes()
+        self._pending_access = {}
+        self._flushed_at = time.monotonic()
+
+    def _sum_sizes(self):
+        return self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._pending_access[key] = time.time()
+            if len(self._pending_access) >= ACCESS_FLUSH_SIZE or time.monotonic() - self._flushed_at >= ACCESS_FLUSH_SECONDS:
+                self._flush_access()
+            self.hits += 1
+            return row[0]
+
+    def set(self, key, value):
+        size = len(value.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            row = self._conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, size, last_access) VALUES (?, ?, ?, ?)",
+                (key, value, size, time.time()),
+            )
+            self._pending_access.pop(key, None)
+            self._total_bytes += size - (row[0] if row else 0)
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    async def aget(self, key):
+        """get() off the event loop."""
+        return await asyncio.to_thread(self.get, key)
+
+    async def aset(self, key, value):
+        """set() off the event loop."""
+        await asyncio.to_thread(self.set, key, value)
+
+    def _flush_access(self):
+        if self._pending_access:
+            with self._conn:
+                self._conn.execute("BEGIN")
+                self._conn.executemany(
+                    "UPDATE responses SET last_access = ? WHERE key = ?",
+                    [(accessed, key) for key, accessed in self._pending_access.items()],
+                )
+            self._pending_access.clear()
+        self._flushed_at = time.monotonic()
+
+    def _evict(self):
+        # Other processes may share the file, so the running total is checked against the table first
+        self._flush_access()
+        self._total_bytes = self._sum_sizes()
+        if self._total_bytes <= self.max_bytes:
+            return
+        evicted = []
+        for key, size in self._conn.execute("SELECT key, size FROM responses ORDER BY last_access"):
+            if self._total_bytes <= self.max_bytes:
+                break
+            evicted.append((key,))
+            self._total_bytes -= size
+        with self._conn:
+            self._conn.execute("BEGIN")
+            self._conn.executemany("DELETE FROM responses WHERE key = ?", evicted)
+        logging.info(f"LLM cache evicted {len(evicted)} entries to stay under {self.max_bytes} bytes.")
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._pending_access.clear()
+            self._total_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            size = self._total_bytes
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": entries,
+            "bytes": size,
+        }
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_llm_cache():
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = LLMResponseCache()
+            register_cache("llm", _default_cache.stats)
+        return _default_cache
+
+
+class CachedChain:
+    """Wraps a prompt | llm | parser chain and serves repeated calls from the response cache.
+
+    Only temperature 0 chains are cached unless enabled=True is passed explicitly. Structured
+    output chains pass their pydantic schema so cached JSON can be turned back into the model.
+    Calls that reach the model go through the shared rate limiter for model_name.
+    """
+
+    def __init__(self, chain, model_name, temperature, template, output_schema=None, enabled=None, cache=None,
+                 name="chain", completion_tokens=DEFAULT_COMPLETION_TOKENS):
+        self.chain = chain
+        self.name = name
+        self.model_name = model_name
+        self.temperature = temperature
+        self.template = template
+        self.completion_tokens = completion_tokens
+        self.template_hash = hash_text(template)
+        self.output_schema = output_schema
+        self.enabled = temperature == 0 if enabled is None else enabled
+        self._cache = cache
+
+    @property
+    def cache(self):
+        return self._cache if self._cache is not None else get_llm_cache()
+
+    def _use_cache(self, bypass):
+        return self.enabled and not bypass and not cache_bypassed()
+
+    def _key(self, inputs):
+        return make_cache_key(self.model_name, self.temperature, self.template_hash, inputs)
+
+    def _dump(self, response):
+        return response.json() if self.output_schema is not None else response
+
+    def _load(self, value):
+        return self.output_schema.parse_raw(value) if self.output_schema is not None else value
+
+    def _estimate_tokens(self, inputs):
+        from modules.chunking import count_tokens
+
+        prompt = self.template + "".join(str(value) for value in inputs.values())
+        return count_tokens(prompt, self.model_name) + self.completion_tokens
+
+    def _instrument(self, config):
+        # Token usage is only collected when metrics are on, so the disabled path adds no callbacks
+        if not metrics_enabled():
+            return config, None
+        handler = TokenUsageHandler(self.model_name)
+        return with_callback(config, handler), handler
+
+    def _record(self, start, cached=False, handler=None):
+        record_llm_call(
+            self.name, self.model_name, time.perf_counter() - start, cached=cached,
+            prompt_tokens=handler.prompt_tokens if handler else None,
+            completion_tokens=handler.completion_tokens if handler else None,
+        )
+
+    def invoke(self, inputs, config=None, bypass=False):
+        start = time.perf_counter()
+        use_cache = self._use_cache(bypass)
+        if use_cache:
+            key = self._key(inputs)
+            cached = self.cache.get(key)
+            if cached is not None:
+                self._record(start, cached=True)
+                return self._load(cached)
+        config, handler = self._instrument(config)
+        limiter = get_rate_limiter(self.model_name)
+        response = limiter.call(lambda: self.chain.invoke(inputs, config=config), self._estimate_tokens(inputs))
+        self._record(start, handler=handler)
+        if use_cache:
+            self.cache.set(key, self._dump(response))
+        return response
+
+    async def ainvoke(self, inputs, config=None, bypass=False):
+        start = time.perf_counter()
+        use_cache = self._use_cache(bypass)
+        if use_cache:
+            key = self._key(inputs)
+            cached = await self.cache.aget(key)
+            if cached is not None:
+                self._record(start, cached=True)
+                return self._load(cached)
+        config, handler = self._instrument(config)
+        limiter = get_rate_limiter(self.model_name)
+        response = await limiter.acall(lambda: self.chain.ainvoke(inputs, config=config), self._estimate_tokens(inputs))
+        self._record(start, handler=handler)
+        if use_cache:
+            await self.cache.aset(key, self._dump(response))
+        return response
+
+    async def astream(self, inputs, config=None, bypass=False):
+        """Streams string output chunk by chunk; a cache hit arrives as a single chunk."""
+        start = time.perf_counter()
+        use_cache = self._use_cache(bypass)
+        if use_cache:
+            key = self._key(inputs)
+            cached = await self.cache.aget(key)
+            if cached is not None:
+                self._record(start, cached=True)
+                yield self._load(cached)
+                return
+        config, handler = self._instrument(config)
+        chunks = []
+        limiter = get_rate_limiter(self.model_name)
+        async for chunk in limiter.astream(lambda: self.chain.astream(inputs, config=config), self._estimate_tokens(inputs)):
+            chunks.append(chunk)
+            yield chunk
+        self._record(start, handler=handler)
+        if use_cache:
+            await self.cache.aset(key, self._dump("".join(chunks)))
@@ -0,0 +1,312 @@
+import contextvars
+import functools
+import inspect
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def _truthy(value):
+    return (value or "").lower() in ("1", "true", "yes")
+
+
+METRICS_PORT = int(os.getenv("EDUSAGE_METRICS_PORT", "0"))
+# Structured JSON log of spans and LLM calls: a file path, or "-" for stderr
+METRICS_LOG = os.getenv("EDUSAGE_METRICS_LOG")
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+TOKEN_BUCKETS = (16, 64, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768)
+
+_enabled = _truthy(os.getenv("EDUSAGE_METRICS")) or bool(METRICS_PORT) or bool(METRICS_LOG)
+_current_span = contextvars.ContextVar("edusage_current_span", default=None)
+
+_event_logger = logging.getLogger("edusage.metrics")
+_event_logger.propagate = False
+if METRICS_LOG:
+    _handler = logging.StreamHandler() if METRICS_LOG == "-" else logging.FileHandler(METRICS_LOG)
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    _event_logger.addHandler(_handler)
+    _event_logger.setLevel(logging.INFO)
+
+
+def metrics_enabled():
+    return _enabled
+
+
+def enable_metrics(enabled=True):
+    global _enabled
+    _enabled = enabled
+
+
+def _label_text(labels):
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in labels)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + "}"
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["buckets"][i] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {key: dict(value, buckets=list(value["buckets"])) for key, value in self._series.items()}
+        for labels, values in sorted(series.items()):
+            for bound, count in zip(self.buckets, values["buckets"]):
+                lines.append(f"{self.name}_bucket{_label_text(labels + (('le', bound),))} {count}")
+            lines.append(f"{self.name}_bucket{_label_text(labels + (('le', '+Inf'),))} {values['count']}")
+            lines.append(f"{self.name}_sum{_label_text(labels)} {values['sum']}")
+            lines.append(f"{self.name}_count{_label_text(labels)} {values['count']}")
+        return lines
+
+    def snapshot(self):
+        with self._lock:
+            return [
+                {"labels": dict(labels), "count": values["count"], "sum": values["sum"]}
+                for labels, values in sorted(self._series.items())
+            ]
+
+
+class MetricsRegistry:
+    """Histograms recorded by the pipelines plus gauges read from the caches at export time."""
+
+    def __init__(self):
+        self._histograms = {}
+        self._caches = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, name, help_text, buckets=SECONDS_BUCKETS):
+        with self._lock:
+            if name not in self._histograms:
+                self._histograms[name] = Histogram(name, help_text, buckets)
+            return self._histograms[name]
+
+    def register_cache(self, name, stats_fn):
+        """stats_fn returns a dict with hits, misses and optionally entries and bytes."""
+        with self._lock:
+            self._caches[name] = stats_fn
+
+    def cache_stats(self):
+        with self._lock:
+            caches = dict(self._caches)
+        stats = {}
+        for name, stats_fn in caches.items():
+            try:
+                values = stats_fn()
+            except Exception:
+                logging.exception(f"Could not read stats for the {name} cache")
+                continue
+            lookups = values["hits"] + values["misses"]
+            stats[name] = dict(values, hit_rate=values["hits"] / lookups if lookups else 0.0)
+        return stats
+
+    def render_prometheus(self):
+        with self._lock:
+            histograms = list(self._histograms.values())
+        lines = []
+        for histogram in histograms:
+            lines.extend(histogram.render())
+        cache_stats = self.cache_stats()
+        gauges = (
+            ("edusage_cache_hits_total", "counter", "Cache lookups that found an entry", "hits"),
+            ("edusage_cache_misses_total", "counter", "Cache lookups that found nothing", "misses"),
+            ("edusage_cache_hit_ratio", "gauge", "Hits divided by lookups since startup", "hit_rate"),
+            ("edusage_cache_entries", "gauge", "Entries currently held", "entries"),
+            ("edusage_cache_bytes", "gauge", "Bytes currently held", "bytes"),
+        )
+        for name, kind, help_text, field in gauges:
+            samples = [(cache, values[field]) for cache, values in sorted(cache_stats.items()) if field in values]
+            if samples:
+                lines.extend([f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"])
+                lines.extend(f"{name}{_label_text((('cache', cache),))} {value}" for cache, value in samples)
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self):
+        with self._lock:
+            histograms = dict(self._histograms)
+        return {
+            "histograms": {name: histogram.snapshot() for name, histogram in histograms.items()},
+            "caches": self.cache_stats(),
+        }
+
+
+_registry = MetricsRegistry()
+
+
+def get_metrics_registry():
+    return _registry
+
+
+def register_cache(name, stats_fn):
+    _registry.register_cache(name, stats_fn)
+
+
+def _log_event(event):
+    if _event_logger.handlers:
+        _event_logger.info(json.dumps(event, default=str))
+
+
+class Span:
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+        parent = _current_span.get()
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex
+        self.parent_id = parent.span_id if parent else None
+        self.span_id = uuid.uuid4().hex[:16]
+
+    def __enter__(self):
+        self._token = _current_span.set(self)
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self._start
+        try:
+            _current_span.reset(self._token)
+        except ValueError:
+            # Spans around a generator body can finish in a different context than they started in
+            pass
+        status = "error" if exc_type and not issubclass(exc_type, GeneratorExit) else "ok"
+        _registry.histogram("edusage_stage_seconds", "Time spent in each pipeline stage").observe(
+            duration, stage=self.name, status=status
+        )
+        _log_event({
+            "event": "span", "name": self.name, "trace_id": self.trace_id, "span_id": self.span_id,
+            "parent_id": self.parent_id, "duration_seconds": round(duration, 6), "status": status, **self.labels,
+        })
+        return False
+
+
+class _NoopSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+def span(name, **labels):
+    """Times a pipeline stage; nested spans share a trace id. A shared no-op when metrics are off."""
+    if not _enabled:
+        return _NOOP_SPAN
+    return Span(name, labels)
+
+
+def traced(name):
+    """Decorator form of span() for plain and async functions."""
+
+    def decorate(fn):
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with span(name):
+                    return await fn(*args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorate
+
+
+def record_llm_call(chain, model, seconds, cached=False, prompt_tokens=None, completion_tokens=None):
+    if not _enabled:
+        return
+    _registry.histogram("edusage_llm_call_seconds", "Latency of chain invocations, including cache hits").observe(
+        seconds, chain=chain, model=model, cached=str(cached).lower()
+    )
+    if prompt_tokens is not None:
+        _registry.histogram("edusage_llm_prompt_tokens", "Prompt tokens per LLM call", TOKEN_BUCKETS).observe(
+            prompt_tokens, chain=chain, model=model
+        )
+    if completion_tokens is not None:
+        _registry.histogram("edusage_llm_completion_tokens", "Completion tokens per LLM call", TOKEN_BUCKETS).observe(
+            completion_tokens, chain=chain, model=model
+        )
+    parent = _current_span.get()
+    _log_event({
+        "event": "llm_call", "chain": chain, "model": model, "duration_seconds": round(seconds, 6), "cached": cached,
+        "prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+        "trace_id": parent.trace_id if parent else None, "parent_id": parent.span_id if parent else None,
+    })
+
+
+def with_callback(config, handler):
+    config = dict(config or {})
+    callbacks = config.get("callbacks")
+    if callbacks is None:
+        config["callbacks"] = [handler]
+    elif isinstance(callbacks, list):
+        config["callbacks"] = callbacks + [handler]
+    else:
+        callbacks = callbacks.copy()
+        callbacks.add_handler(handler)
+        config["callbacks"] = callbacks
+    return config
+
+
+class _MetricsRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.rstrip("/") == "/metrics":
+            body, content_type = _registry.render_prometheus().encode("utf-8"), "text/plain; version=0.0.4"
+        elif self.path.rstrip("/") == "/metrics.json":
+            body, content_type = json.dumps(_registry.snapshot(), default=str).encode("utf-8"), "application/json"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(port=METRICS_PORT):
+    """Serves /metrics (Prometheus text) and /metrics.json on a daemon thread; safe to call on every rerun."""
+    global _server
+    if not port:
+        return None
+    with _server_lock:
+        if _server is None:
+            _server = ThreadingHTTPServer(("0.0.0.0", port), _MetricsRequestHandler)
+            threading.Thread(target=_server.serve_forever, name="edusage-metrics", daemon=True).start()
+            logging.info(f"Serving metrics on port {port}")
+        return _server
@@ -1,22 +1,32 @@
+import asyncio
+import logging
 import os
+import re
 from dotenv import load_dotenv
 from langchain_core.prompts import PromptTemplate
-from langchain_openai import ChatOpenAI
 from typing import List
 from langchain.pydantic_v1 import BaseModel, Field
-from langchain_openai.embeddings import OpenAIEmbeddings
-from langchain_community.document_loaders import PyPDFLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_pinecone import PineconeVectorStore
-from pinecone import Pinecone
-import tempfile
+from modules.llm_cache import CachedChain
+from modules.rate_limit import get_chat_model
+from modules.metrics import span, traced
+from modules.chunking import split_text_by_tokens
+from modules.selection import document_key, get_chunk_selector
+from modules.vector_store import get_vector_store
+from modules.workspace import get_workspace_store
+from modules.checkpoint import retry_section
 
 load_dotenv()
 
-# Initialize Pinecone
-pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
-
-index_name = "quiz-index"
+QUIZ_MODEL_NAME = "gpt-3.5-turbo"
+# Roughly the 1000 characters the character splitter used to produce
+QUIZ_CHUNK_TOKENS = 250
+# Context sent with each quiz request, and the fewest chunks it is drawn from
+QUIZ_CONTEXT_TOKENS = 2000
+MIN_CONTEXT_CHUNKS = 4
+# Chunks retrieved for a focus topic before diversity selection
+FOCUS_CANDIDATES = 40
+# In-flight requests when a quiz is generated in parallel, one request per grounding chunk
+QUIZ_MAX_CONCURRENCY = int(os.getenv("QUIZ_MAX_CONCURRENCY", "8"))
 
 # Define quiz data models
 class QuizTrueFalse(BaseModel):
@@ -32,6 +42,15 @@ class QuizOpenEnded(BaseModel):
     questions: List[str] = Field(description="The quiz questions")
     answers: List[str] = Field(description="The correct answers for each question")
 
+class AnswerVerdicts(BaseModel):
+    correct: List[bool] = Field(description="For each numbered answer, whether it is correct")
+
+QUIZ_SCHEMAS = {
+    "Multiple Choice": QuizMultipleChoice,
+    "True/False": QuizTrueFalse,
+    "Open Ended": QuizOpenEnded,
+}
+
 def generate_quiz_prompt():
     template = """
     You are an expert quiz maker specializing in highly technical and conceptual questions.
@@ -74,59 +93,64 @@ def generate_quiz_prompt():
     """
     return PromptTemplate(template=template, input_variables=['num_questions', 'quiz_type', 'context'])
 
-def create_quiz_chain(prompt_template, llm, quiz_schema):
-    return prompt_template | llm.with_structured_output(quiz_schema)
+def create_quiz_chain(prompt_template, llm, quiz_schema, use_cache=None):
+    # Quizzes are sampled at a non-zero temperature, so they are only cached when use_cache=True
+    return CachedChain(
+        prompt_template | llm.with_structured_output(quiz_schema),
+        model_name=llm.model_name,
+        temperature=llm.temperature,
+        template=prompt_template.template,
+        output_schema=quiz_schema,
+        enabled=use_cache,
+        name="quiz",
+    )
 
-def load_document(file):
+def load_document(file, workspace):
     file_extension = os.path.splitext(file.name)[1].lower()
-    with tempfile.NamedTemporaryFile(delete=False, suffix=file_extension) as tmp_file:
-        tmp_file.write(file.read())
-        tmp_file_path = tmp_file.name
-        if file_extension == ".pdf":
-            loader = PyPDFLoader(tmp_file_path)
-        else:
-            raise ValueError(f"Unsupported file type: {file_extension}")
-    return loader
+    if file_extension != ".pdf":
+        raise ValueError(f"Unsupported file type: {file_extension}")
+    from langchain_community.document_loaders import PyPDFLoader
 
+    return PyPDFLoader(workspace.write_file(f"input{file_extension}", file.read()))
+
+@traced("quiz_chunking")
 def process_document(file):
-    loader = load_document(file)
-    pages = loader.load_and_split()
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=0)
-    texts = text_splitter.split_documents(pages)
-    return texts
-
-def generate_quiz(chunks, num_questions, quiz_type):
-    # Build the context by selecting non-overlapping chunks
+    # The uploaded copy is only needed while it is parsed, so its workspace goes right after
+    with get_workspace_store().workspace(getattr(file, "size", 0)) as workspace:
+        loader = load_document(file, workspace)
+        pages = loader.load_and_split()
+    return split_text_by_tokens(pages, QUIZ_CHUNK_TOKENS, QUIZ_MODEL_NAME)
+
+def retrieve_focus_chunks(chunks, focus, k=FOCUS_CANDIDATES):
+    vector_store = get_vector_store()
+    doc_id = document_key(chunks)
+    vector_store.add_document(doc_id, chunks)
+    return [chunk for chunk, _ in vector_store.search(doc_id, [focus], k=k)[0]]
+
+@traced("quiz")
+def generate_quiz(chunks, num_questions, quiz_type, use_cache=None, focus=None):
     if not chunks:
         raise ValueError("No chunks available for context.")
 
-    # Calculate the number of chunks needed
-    num_chunks_needed = num_questions
-    chunk_indices = list(range(len(chunks)))
-
-    # Select chunks sequentially to cover different parts
-    step = max(1, len(chunk_indices) // num_questions)
-    selected_indices = chunk_indices[::step][:num_questions]
-    selected_chunks = [chunks[i] for i in selected_indices]
-    combined_context = " ".join([chunk.page_content for chunk in selected_chunks])
+    if focus:
+        # Narrow the candidates to the chunks closest to the requested topic
+        with span("focus_retrieval"):
+            chunks = retrieve_focus_chunks(chunks, focus)
 
-    # Limit the context size to avoid exceeding token limits
-    max_context_length = 3000  # Adjust based on model limits
-    if len(combined_context) > max_context_length:
-        combined_context = combined_context[:max_context_length]
+    # Pick a diverse, information-dense set of chunks that fits the context budget
+    with span("select_chunks"):
+        selected_chunks = get_chunk_selector().select(
+            chunks, QUIZ_CONTEXT_TOKENS, QUIZ_MODEL_NAME, max_chunks=max(num_questions, MIN_CONTEXT_CHUNKS)
+        )
+    combined_context = "\n\n".join([chunk.page_content for chunk in selected_chunks])
 
     prompt_template = generate_quiz_prompt()
-    llm = ChatOpenAI(model_name="gpt-3.5-turbo", temperature=0.7)
+    llm = get_chat_model(QUIZ_MODEL_NAME, temperature=0.7)
 
     # Select the appropriate Pydantic model output schema based on the quiz
-    if quiz_type == "Multiple Choice":
-        quiz_schema = QuizMultipleChoice
-    elif quiz_type == "True/False":
-        quiz_schema = QuizTrueFalse
-    else:
-        quiz_schema = QuizOpenEnded
+    quiz_schema = QUIZ_SCHEMAS.get(quiz_type, QuizOpenEnded)
 
-    chain = create_quiz_chain(prompt_template, llm, quiz_schema)
+    chain = create_quiz_chain(prompt_template, llm, quiz_schema, use_cache=use_cache)
 
     response = chain.invoke({
         'num_questions': num_questions,
@@ -134,4 +158,155 @@ def generate_quiz(chunks, num_questions, quiz_type):
         'context': combined_context
     })
 
-    return response
\ No newline at end of file
+    return response
+
+def quiz_fields(quiz_schema):
+    return [name for name in ("questions", "alternatives", "answers") if name in quiz_schema.__fields__]
+
+# "B", "b)", "(B) Paris", "B. Paris"; a letter followed by a space is left alone, so "A linked list" isn't read as A
+_ANSWER_LETTER = re.compile(r"^\(?([A-Za-z])(?:[).:]|$)")
+# The "A) " an option may be written with
+_OPTION_PREFIX = re.compile(r"^\(?[A-Za-z][).:]\s*")
+
+
+def _normalize_option(text):
+    return " ".join(text.lower().split())
+
+
+def answer_letter(answer, options):
+    """The letter of the option a multiple choice answer picks, or None if it picks none of them.
+
+    An answer is matched against the options' text first, then with their "A)" prefixes removed,
+    and only then read as a bare letter ("B", "B)", "B. Paris").
+    """
+    normalized = _normalize_option(answer)
+    options = [_normalize_option(option) for option in options]
+    for candidates in (options, [_OPTION_PREFIX.sub("", option) for option in options]):
+        if normalized in candidates:
+            return chr(ord("A") + candidates.index(normalized))
+    match = _ANSWER_LETTER.match(normalized)
+    if match:
+        letter = match.group(1).upper()
+        return letter if ord(letter) - ord("A") < len(options) else None
+    return None
+
+
+def check_quiz(quiz, num_questions):
+    """Trims a generated quiz to num_questions; raises ValueError if it is malformed or empty.
+
+    Multiple choice answers are rewritten to the bare letter of the option they pick.
+    """
+    fields = quiz_fields(type(quiz))
+    lengths = {len(getattr(quiz, name)) for name in fields}
+    if len(lengths) != 1 or not quiz.questions:
+        raise ValueError(f"Malformed quiz: {', '.join(f'{len(getattr(quiz, name))} {name}' for name in fields)}")
+    values = {name: getattr(quiz, name)[:num_questions] for name in fields}
+    if "alternatives" in fields:
+        letters = []
+        for options, answer in zip(values["alternatives"], values["answers"]):
+            # The quiz page looks the correct option up by its letter
+            letter = answer_letter(answer, options) if len(options) >= 2 else None
+            if letter is None:
+                raise ValueError(f"Malformed quiz: answer {answer!r} does not pick one of {len(options)} alternatives")
+            letters.append(letter)
+        values["answers"] = letters
+    return type(quiz)(**values)
+
+def merge_quizzes(quiz_schema, quizzes):
+    """Concatenates quizzes of one schema, dropping repeated questions."""
+    fields = quiz_fields(quiz_schema)
+    values = {name: [] for name in fields}
+    seen = set()
+    for quiz in quizzes:
+        for i, question in enumerate(quiz.questions):
+            normalized = " ".join(question.lower().split())
+            if normalized in seen:
+                continue
+            seen.add(normalized)
+            for name in fields:
+                values[name].append(getattr(quiz, name)[i])
+    return quiz_schema(**values)
+
+@traced("quiz")
+async def agenerate_quiz(chunks, num_questions, quiz_type, use_cache=None, focus=None, max_concurrency=QUIZ_MAX_CONCURRENCY):
+    """Generates the quiz as concurrent requests, each grounded in its own selected chunk.
+
+    Questions are spread over up to num_questions diverse chunks, so latency stays at about one
+    request however long the quiz is. A request whose reply is malformed or fails is retried on
+    its own; if it still fails, the quiz goes ahead without its questions.
+    """
+    if not chunks:
+        raise ValueError("No chunks available for context.")
+
+    if focus:
+        with span("focus_retrieval"):
+            chunks = retrieve_focus_chunks(chunks, focus)
+
+    # One chunk per question while the document has enough; otherwise chunks get several questions each
+    with span("select_chunks"):
+        selected_chunks = get_chunk_selector().select(
+            chunks, num_questions * QUIZ_CHUNK_TOKENS, QUIZ_MODEL_NAME, max_chunks=num_questions
+        )
+    if not selected_chunks:
+        raise ValueError("No chunks available for context.")
+    counts = [num_questions // len(selected_chunks) + (i < num_questions % len(selected_chunks))
+              for i in range(len(selected_chunks))]
+
+    prompt_template = generate_quiz_prompt()
+    llm = get_chat_model(QUIZ_MODEL_NAME, temperature=0.7)
+    quiz_schema = QUIZ_SCHEMAS.get(quiz_type, QuizOpenEnded)
+    chain = create_quiz_chain(prompt_template, llm, quiz_schema, use_cache=use_cache)
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+    async def request(chunk, count):
+        response = await chain.ainvoke({'num_questions': count, 'quiz_type': quiz_type, 'context': chunk.page_content})
+        return check_quiz(response, count)
+
+    async def generate(i, chunk, count):
+        async with semaphore:
+            try:
+                return await retry_section(lambda: request(chunk, count), f"Generating quiz questions from chunk {i}")
+            except Exception as e:
+                logging.error(f"Generating quiz questions from chunk {i} failed: {e}")
+                return e
+
+    results = await asyncio.gather(*[
+        generate(i, chunk, count) for i, (chunk, count) in enumerate(zip(selected_chunks, counts), 1) if count
+    ])
+    quizzes = [result for result in results if not isinstance(result, Exception)]
+    if not quizzes:
+        raise RuntimeError(f"No quiz questions could be generated ({results[0]}).") from results[0]
+    return merge_quizzes(quiz_schema, quizzes)
+
+def grade_answers_prompt():
+    template = """
+    You are grading a student's answers to technical quiz questions.
+    For each numbered case, decide whether the student's answer is correct. An answer is correct
+    if it states the key ideas of the reference answer, even in different words; it does not
+    need to be complete or well phrased.
+
+    {cases}
+
+    Return one true/false verdict per case, in order.
+    """
+    return PromptTemplate(template=template, input_variables=['cases'])
+
+def grade_borderline_answers(cases):
+    """Escalation hook for AnswerGrader.grade: one model call for all of an attempt's borderline answers."""
+    prompt_template = grade_answers_prompt()
+    llm = get_chat_model(QUIZ_MODEL_NAME, temperature=0)
+    chain = CachedChain(
+        prompt_template | llm.with_structured_output(AnswerVerdicts),
+        model_name=llm.model_name,
+        temperature=llm.temperature,
+        template=prompt_template.template,
+        output_schema=AnswerVerdicts,
+        name="quiz_grading",
+    )
+    text = "\n\n".join(
+        f"Case {i}:\nQuestion: {case['question']}\nReference answer: {case['reference']}\nStudent answer: {case['answer']}"
+        for i, case in enumerate(cases, 1)
+    )
+    verdicts = chain.invoke({'cases': text}).correct
+    # Cases the model left out keep the stricter verdict
+    return [i < len(verdicts) and verdicts[i] for i in range(len(cases))]
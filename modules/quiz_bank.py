@@ -0,0 +1,232 @@
+import hashlib
+import json
+import logging
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from modules.metrics import register_cache, span
+from modules.quiz import QUIZ_SCHEMAS, answer_letter, generate_quiz
+
+DEFAULT_BANK_DIR = os.getenv(
+    "EDUSAGE_QUIZ_BANK_DIR", os.path.join(os.path.expanduser("~"), ".edusage", "quiz_bank")
+)
+# Questions kept ready per document and quiz type, and how many are requested per refill call
+TARGET_QUESTIONS = int(os.getenv("EDUSAGE_QUIZ_BANK_TARGET", "30"))
+BATCH_QUESTIONS = 10
+# A session with fewer unseen questions than this triggers a top-up
+LOW_WATERMARK = 10
+# Oldest questions are dropped past this, so sessions that have seen everything still get new ones
+MAX_QUESTIONS = 200
+# Each refill draws its context from one strided slice of the document, this many chunks long
+WINDOW_CHUNKS = 24
+# Refill calls that add nothing new before a fill gives up; the bank is then marked exhausted
+MAX_EMPTY_ROUNDS = 3
+# After a refill fails, no new one is started for the same document and quiz type for this long
+RETRY_COOLDOWN_SECONDS = int(os.getenv("EDUSAGE_QUIZ_BANK_RETRY_SECONDS", "300"))
+
+
+def question_id(question):
+    normalized = re.sub(r"\W+", " ", question).strip().lower()
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()[:16]
+
+
+def quiz_items(quiz):
+    """Splits a quiz model into one dict per question, skipping multiple choice questions without a valid answer."""
+    items = []
+    for i, question in enumerate(quiz.questions):
+        if i >= len(quiz.answers):
+            break
+        item = {"id": question_id(question), "question": question, "answer": quiz.answers[i]}
+        if hasattr(quiz, "alternatives"):
+            if i >= len(quiz.alternatives):
+                break
+            # Banked quizzes come straight from the model; the quiz page needs the bare option letter
+            letter = answer_letter(item["answer"], quiz.alternatives[i])
+            if letter is None:
+                logging.warning(f"Dropping multiple choice question with unusable answer {item['answer']!r}")
+                continue
+            item.update(answer=letter, alternatives=quiz.alternatives[i])
+        items.append(item)
+    return items
+
+
+def build_quiz(quiz_type, items):
+    schema = QUIZ_SCHEMAS[quiz_type]
+    values = {"questions": [item["question"] for item in items], "answers": [item["answer"] for item in items]}
+    if "alternatives" in schema.__fields__:
+        values["alternatives"] = [item["alternatives"] for item in items]
+    return schema(**values)
+
+
+class QuestionBank:
+    """Pre-generated quiz questions per document, shared by every Streamlit session.
+
+    Each quiz type is filled in the background after upload, so quizzes are sampled instantly
+    instead of waiting on the model. Callers pass the question ids a session has already seen,
+    and a draw that leaves the session running low on unseen questions schedules a top-up.
+    Banks are saved as one JSON file per document hash.
+    """
+
+    def __init__(self, bank_dir=DEFAULT_BANK_DIR, target_questions=TARGET_QUESTIONS, batch_questions=BATCH_QUESTIONS,
+                 low_watermark=LOW_WATERMARK, max_questions=MAX_QUESTIONS, max_workers=2):
+        self.bank_dir = bank_dir
+        self.target_questions = target_questions
+        self.batch_questions = batch_questions
+        self.low_watermark = low_watermark
+        self.max_questions = max_questions
+        self.hits = 0
+        self.misses = 0
+        self._banks = {}
+        self._refilling = set()
+        self._retry_after = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="edusage-quiz-bank")
+        os.makedirs(bank_dir, exist_ok=True)
+
+    def _path(self, doc_key):
+        return os.path.join(self.bank_dir, f"{doc_key}.json")
+
+    def _bank(self, doc_key):
+        # Callers hold self._lock
+        bank = self._banks.get(doc_key)
+        if bank is None:
+            try:
+                with open(self._path(doc_key), encoding="utf-8") as f:
+                    bank = json.load(f)
+            except FileNotFoundError:
+                bank = {}
+            except ValueError:
+                logging.warning(f"Ignoring unreadable quiz bank for {doc_key}")
+                bank = {}
+            bank.setdefault("questions", {})
+            bank.setdefault("rounds", {})
+            bank.setdefault("exhausted", {})
+            for quiz_type in QUIZ_SCHEMAS:
+                bank["questions"].setdefault(quiz_type, [])
+                bank["rounds"].setdefault(quiz_type, 0)
+                bank["exhausted"].setdefault(quiz_type, False)
+            self._banks[doc_key] = bank
+        return bank
+
+    def _save(self, doc_key):
+        with self._lock:
+            data = json.dumps(self._bank(doc_key))
+        fd, tmp_path = tempfile.mkstemp(dir=self.bank_dir, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(data)
+        os.replace(tmp_path, self._path(doc_key))
+
+    def count(self, doc_key, quiz_type, exclude=()):
+        with self._lock:
+            return sum(item["id"] not in exclude for item in self._bank(doc_key)["questions"][quiz_type])
+
+    def add(self, doc_key, quiz_type, quiz):
+        """Adds a generated quiz's questions, skipping ones already banked. Returns how many were new."""
+        with self._lock:
+            questions = self._bank(doc_key)["questions"][quiz_type]
+            known = {item["id"] for item in questions}
+            new_items = []
+            for item in quiz_items(quiz):
+                if item["id"] not in known:
+                    known.add(item["id"])
+                    new_items.append(item)
+            questions.extend(new_items)
+            del questions[:max(0, len(questions) - self.max_questions)]
+        if new_items:
+            self._save(doc_key)
+        return len(new_items)
+
+    def draw(self, doc_key, chunks, quiz_type, num_questions, exclude=()):
+        """Returns a quiz of num_questions unseen questions, or None if the bank can't supply one yet."""
+        with self._lock:
+            unseen = [item for item in self._bank(doc_key)["questions"][quiz_type] if item["id"] not in exclude]
+            if len(unseen) < num_questions:
+                self.misses += 1
+                quiz = None
+            else:
+                self.hits += 1
+                quiz = build_quiz(quiz_type, random.sample(unseen, num_questions))
+            unseen_left = len(unseen) - (num_questions if quiz else 0)
+        if unseen_left < self.low_watermark + num_questions:
+            # Stay a quiz ahead of the session, so its next draw is served from the bank too
+            self._schedule(doc_key, chunks, quiz_type, self.low_watermark + num_questions - unseen_left)
+        return quiz
+
+    def fill(self, doc_key, chunks):
+        """Schedules background generation for every quiz type below the target; cheap to call on every rerun."""
+        for quiz_type in QUIZ_SCHEMAS:
+            self._schedule(doc_key, chunks, quiz_type, self.target_questions - self.count(doc_key, quiz_type))
+
+    def _schedule(self, doc_key, chunks, quiz_type, needed):
+        """Generates at least `needed` new questions in the background.
+
+        Nothing is scheduled while a refill is already running, while a failed one is cooling
+        down, or once the document has stopped yielding new questions.
+        """
+        if not chunks or needed <= 0:
+            return
+        with self._lock:
+            key = (doc_key, quiz_type)
+            if key in self._refilling or time.time() < self._retry_after.get(key, 0):
+                return
+            if self._bank(doc_key)["exhausted"][quiz_type]:
+                return
+            self._refilling.add(key)
+        self._executor.submit(self._refill, doc_key, chunks, quiz_type, needed)
+
+    def _refill(self, doc_key, chunks, quiz_type, needed):
+        added = 0
+        empty_rounds = 0
+        try:
+            while added < needed and empty_rounds < MAX_EMPTY_ROUNDS:
+                with self._lock:
+                    bank = self._bank(doc_key)
+                    round_number = bank["rounds"][quiz_type]
+                    bank["rounds"][quiz_type] += 1
+                # Successive rounds read different parts of the document, so questions don't repeat
+                windows = max(1, len(chunks) // WINDOW_CHUNKS)
+                window = chunks[round_number % windows::windows]
+                with span("quiz_bank_refill", quiz_type=quiz_type):
+                    quiz = generate_quiz(window, self.batch_questions, quiz_type, use_cache=False)
+                new_questions = self.add(doc_key, quiz_type, quiz)
+                added += new_questions
+                empty_rounds = 0 if new_questions else empty_rounds + 1
+            if empty_rounds >= MAX_EMPTY_ROUNDS:
+                # Short documents run out of distinct questions; stop asking the model for more
+                logging.info(f"The {quiz_type} question bank for {doc_key} is exhausted")
+                with self._lock:
+                    self._bank(doc_key)["exhausted"][quiz_type] = True
+                self._save(doc_key)
+        except Exception:
+            logging.exception(f"Filling the {quiz_type} question bank for {doc_key} failed")
+            with self._lock:
+                self._retry_after[(doc_key, quiz_type)] = time.time() + RETRY_COOLDOWN_SECONDS
+        finally:
+            with self._lock:
+                self._refilling.discard((doc_key, quiz_type))
+
+    def refilling(self, doc_key, quiz_type):
+        with self._lock:
+            return (doc_key, quiz_type) in self._refilling
+
+    def stats(self):
+        with self._lock:
+            entries = sum(len(items) for bank in self._banks.values() for items in bank["questions"].values())
+            return {"hits": self.hits, "misses": self.misses, "entries": entries}
+
+
+_default_bank = None
+_default_bank_lock = threading.Lock()
+
+
+def get_question_bank():
+    global _default_bank
+    with _default_bank_lock:
+        if _default_bank is None:
+            _default_bank = QuestionBank()
+            register_cache("quiz_bank", _default_bank.stats)
+        return _default_bank
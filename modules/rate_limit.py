@@ -0,0 +1,235 @@
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+from modules.metrics import get_metrics_registry, metrics_enabled
+
+# Per-model budgets; the defaults match OpenAI's tier 1 limits for gpt-3.5-turbo
+DEFAULT_RPM = int(os.getenv("EDUSAGE_OPENAI_RPM", "3500"))
+DEFAULT_TPM = int(os.getenv("EDUSAGE_OPENAI_TPM", "200000"))
+# Buckets hold a few seconds of budget, so a burst can't use up the whole minute at once
+BURST_SECONDS = 10
+# Completion tokens reserved per request unless the chain expects longer replies
+DEFAULT_COMPLETION_TOKENS = 512
+# Attempts per call on rate limits and transient errors before the error is raised to the caller
+MAX_RATE_LIMIT_ATTEMPTS = int(os.getenv("EDUSAGE_RATE_LIMIT_ATTEMPTS", "6"))
+MAX_BACKOFF_SECONDS = 60
+# Throughput is cut to this fraction on a 429 and recovers by RECOVERY_STEP per success
+BACKOFF_FACTOR = 0.5
+MIN_RATE_SCALE = 0.1
+RECOVERY_STEP = 0.02
+
+
+class TokenBucket:
+    """Refills continuously at rate per minute, up to capacity. Reservations may overdraw it,
+    and the overdraft is the caller's wait, so waiting callers are served in arrival order."""
+
+    def __init__(self, rate_per_minute, capacity):
+        self.rate_per_minute = rate_per_minute
+        self.capacity = capacity
+        self.level = capacity
+        self.updated = time.monotonic()
+
+    def reserve(self, amount, now, scale=1.0):
+        rate = self.rate_per_minute * scale / 60
+        self.level = min(self.capacity, self.level + (now - self.updated) * rate)
+        self.updated = now
+        self.level -= amount
+        return -self.level / rate if self.level < 0 else 0.0
+
+
+def is_rate_limit_error(error):
+    # A 429 for an exhausted quota won't clear up by waiting
+    return getattr(error, "status_code", None) == 429 and getattr(error, "code", None) != "insufficient_quota"
+
+
+def is_transient_error(error):
+    # What the OpenAI client retries on its own: timeouts, conflicts, server errors and dropped connections
+    status = getattr(error, "status_code", None)
+    if status is not None:
+        return status in (408, 409) or status >= 500
+    return type(error).__name__ in ("APIConnectionError", "APITimeoutError")
+
+
+def retry_after_seconds(error):
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    for header, unit in (("retry-after-ms", 0.001), ("retry-after", 1)):
+        try:
+            return float(headers[header]) * unit
+        except (KeyError, TypeError, ValueError):
+            continue
+    return None
+
+
+class RateLimiter:
+    """Process-wide requests-per-minute and tokens-per-minute budget for one model.
+
+    Every chain call reserves one request and its estimated tokens before it goes out, from
+    any thread or event loop. A 429 pauses all callers for the server's Retry-After (or an
+    exponential backoff) and halves the rate; successes then restore it gradually.
+    """
+
+    def __init__(self, model_name, rpm=DEFAULT_RPM, tpm=DEFAULT_TPM):
+        self.model_name = model_name
+        self.requests = TokenBucket(rpm, max(1, rpm * BURST_SECONDS / 60))
+        self.tokens = TokenBucket(tpm, max(1, tpm * BURST_SECONDS / 60))
+        self.scale = 1.0
+        self.rate_limited = 0
+        self._blocked_until = 0.0
+        self._consecutive = 0
+        self._lock = threading.Lock()
+
+    def reserve(self, tokens):
+        """Books a request and returns how many seconds the caller must wait before sending it."""
+        with self._lock:
+            now = time.monotonic()
+            return max(
+                self.requests.reserve(1, now, self.scale),
+                self.tokens.reserve(tokens, now, self.scale),
+                self._blocked_until - now,
+            )
+
+    def _reserve_and_observe(self, tokens):
+        wait = self.reserve(tokens)
+        if metrics_enabled():
+            get_metrics_registry().histogram(
+                "edusage_rate_limit_wait_seconds", "Time LLM calls waited for the rate limiter"
+            ).observe(max(0.0, wait), model=self.model_name)
+        return wait
+
+    def acquire(self, tokens):
+        wait = self._reserve_and_observe(tokens)
+        if wait > 0:
+            time.sleep(wait)
+
+    async def aacquire(self, tokens):
+        wait = self._reserve_and_observe(tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def on_success(self):
+        with self._lock:
+            self._consecutive = 0
+            self.scale = min(1.0, self.scale + RECOVERY_STEP)
+
+    def on_rate_limited(self, retry_after=None):
+        with self._lock:
+            self.rate_limited += 1
+            self._consecutive += 1
+            self.scale = max(MIN_RATE_SCALE, self.scale * BACKOFF_FACTOR)
+            backoff = min(MAX_BACKOFF_SECONDS, 2 ** (self._consecutive - 1))
+            delay = retry_after if retry_after is not None else backoff * random.uniform(0.5, 1.0)
+            self._blocked_until = max(self._blocked_until, time.monotonic() + delay)
+        logging.warning(f"Rate limited on {self.model_name}; pausing requests for {delay:.1f}s")
+
+    def _retry_delay(self, error, attempt):
+        """Seconds to sleep before retrying after error, or None if it should be raised."""
+        if attempt == MAX_RATE_LIMIT_ATTEMPTS:
+            return None
+        if is_rate_limit_error(error):
+            # The next acquire waits out the pause, together with every other caller
+            self.on_rate_limited(retry_after_seconds(error))
+            return 0.0
+        if is_transient_error(error):
+            logging.warning(f"{self.model_name} request failed ({error}); retrying")
+            return min(MAX_BACKOFF_SECONDS, 2 ** (attempt - 1)) * random.uniform(0.5, 1.0)
+        return None
+
+    def call(self, fn, tokens):
+        """Runs fn() within the budget, retrying it after rate limits and transient errors."""
+        for attempt in range(1, MAX_RATE_LIMIT_ATTEMPTS + 1):
+            self.acquire(tokens)
+            try:
+                result = fn()
+            except Exception as e:
+                delay = self._retry_delay(e, attempt)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                continue
+            self.on_success()
+            return result
+
+    async def acall(self, fn, tokens):
+        """Async form of call(); fn returns an awaitable."""
+        for attempt in range(1, MAX_RATE_LIMIT_ATTEMPTS + 1):
+            await self.aacquire(tokens)
+            try:
+                result = await fn()
+            except Exception as e:
+                delay = self._retry_delay(e, attempt)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                continue
+            self.on_success()
+            return result
+
+    async def astream(self, stream_fn, tokens):
+        """Yields from stream_fn() within the budget; only a stream that fails before its first chunk is retried."""
+        for attempt in range(1, MAX_RATE_LIMIT_ATTEMPTS + 1):
+            await self.aacquire(tokens)
+            started = False
+            try:
+                async for chunk in stream_fn():
+                    started = True
+                    yield chunk
+            except Exception as e:
+                delay = None if started else self._retry_delay(e, attempt)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                continue
+            self.on_success()
+            return
+
+    def stats(self):
+        with self._lock:
+            return {"scale": self.scale, "rate_limited": self.rate_limited}
+
+
+_limiters = {}
+_clients = {}
+_pool_lock = threading.Lock()
+
+
+def get_rate_limiter(model_name):
+    with _pool_lock:
+        if model_name not in _limiters:
+            _limiters[model_name] = RateLimiter(model_name, rpm=DEFAULT_RPM, tpm=DEFAULT_TPM)
+        return _limiters[model_name]
+
+
+def get_chat_model(model_name, temperature=0.0):
+    """Shared ChatOpenAI client per model and temperature, so sessions reuse connection pools.
+
+    Async connections belong to the event loop that opened them, so clients requested inside
+    a running loop are pooled per loop and dropped once it closes. Retries are left to the rate
+    limiter, which sees every caller's 429s; the client's own retries would hammer the API
+    behind its back.
+    """
+    # The OpenAI client stack is heavy to import; pages only pay for it once they make a request
+    import httpx
+    import openai
+    from langchain_openai import ChatOpenAI
+
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        loop = None
+    key = (model_name, temperature, loop)
+    with _pool_lock:
+        if key not in _clients:
+            for stale in [pooled for pooled in _clients if pooled[2] is not None and pooled[2].is_closed()]:
+                del _clients[stale]
+            # A plain httpx client: openai's default one schedules its own close on whichever loop is
+            # running when it is garbage collected, which fails once its own loop has closed
+            _clients[key] = ChatOpenAI(
+                model_name=model_name, temperature=temperature, max_retries=0,
+                http_async_client=httpx.AsyncClient(
+                    timeout=openai.DEFAULT_TIMEOUT, limits=openai.DEFAULT_CONNECTION_LIMITS
+                ) if loop is not None else None,
+            )
+        return _clients[key]
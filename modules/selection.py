@@ -0,0 +1,111 @@
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+from modules.chunking import count_tokens
+
+
+def document_key(chunks):
+    digest = hashlib.sha256()
+    for chunk in chunks:
+        digest.update(chunk.page_content.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class _ChunkFeatures:
+    def __init__(self, chunks, model_name):
+        from sklearn.feature_extraction.text import TfidfVectorizer
+
+        texts = [chunk.page_content for chunk in chunks]
+        vectorizer = TfidfVectorizer(stop_words="english", sublinear_tf=True, max_features=50000, dtype=np.float32)
+        try:
+            # Rows come back L2-normalized, so X @ X.T is cosine similarity
+            self.matrix = vectorizer.fit_transform(texts).tocsr()
+        except ValueError:
+            # Only stop words or empty chunks; every chunk is equally (un)informative
+            self.matrix = None
+        self.tokens = np.array([count_tokens(text, model_name) for text in texts], dtype=np.int64)
+        self.relevance = self._relevance()
+
+    def _relevance(self):
+        n = len(self.tokens)
+        if self.matrix is None:
+            return np.ones(n, dtype=np.float32)
+        centroid = np.asarray(self.matrix.mean(axis=0)).ravel()
+        norm = np.linalg.norm(centroid)
+        centrality = self.matrix @ (centroid / norm) if norm else np.zeros(n, dtype=np.float32)
+        # Distinct informative terms per token favours dense technical passages over boilerplate
+        density = np.diff(self.matrix.indptr) / np.maximum(self.tokens, 1)
+        relevance = _min_max(np.asarray(centrality).ravel()) + _min_max(density)
+        return relevance.astype(np.float32)
+
+
+def _min_max(values):
+    values = np.asarray(values, dtype=np.float32)
+    spread = values.max() - values.min() if values.size else 0
+    return (values - values.min()) / spread if spread else np.zeros_like(values)
+
+
+class ChunkSelector:
+    """Picks a diverse, information-dense subset of chunks with maximal marginal relevance.
+
+    TF-IDF features are computed once per document (keyed by a hash of its chunks) and kept
+    in a small LRU so repeated quizzes over the same upload skip vectorization.
+    """
+
+    def __init__(self, max_documents=16):
+        self.max_documents = max_documents
+        self._features = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get_features(self, chunks, model_name):
+        key = (document_key(chunks), model_name)
+        with self._lock:
+            if key in self._features:
+                self._features.move_to_end(key)
+                return self._features[key]
+        features = _ChunkFeatures(chunks, model_name)
+        with self._lock:
+            self._features[key] = features
+            while len(self._features) > self.max_documents:
+                self._features.popitem(last=False)
+        return features
+
+    def select(self, chunks, token_budget, model_name, max_chunks=None, diversity=0.5):
+        """Returns chunks in document order; diversity=0 is pure relevance, 1 pure novelty."""
+        if not chunks:
+            return []
+        features = self._get_features(chunks, model_name)
+        n = len(chunks)
+        max_chunks = min(max_chunks or n, n)
+
+        fits = features.tokens <= token_budget
+        best_similarity = np.zeros(n, dtype=np.float32)
+        available = fits.copy()
+        remaining = token_budget
+        selected = []
+        while len(selected) < max_chunks and available.any():
+            scores = (1 - diversity) * features.relevance - diversity * best_similarity
+            scores[~available] = -np.inf
+            best = int(np.argmax(scores))
+            selected.append(best)
+            remaining -= features.tokens[best]
+            available[best] = False
+            available &= features.tokens <= remaining
+            if features.matrix is not None:
+                similarity = (features.matrix @ features.matrix[best].T).toarray().ravel()
+                np.maximum(best_similarity, similarity, out=best_similarity)
+        return [chunks[i] for i in sorted(selected)]
+
+
+_default_selector = None
+_default_selector_lock = threading.Lock()
+
+
+def get_chunk_selector():
+    global _default_selector
+    with _default_selector_lock:
+        if _default_selector is None:
+            _default_selector = ChunkSelector()
+        return _default_selector
@@ -1,29 +1,30 @@
 import logging
 import os
-import json
-import zipfile
-from adobe.pdfservices.operation.auth.credentials import Credentials
-from adobe.pdfservices.operation.execution_context import ExecutionContext
-from adobe.pdfservices.operation.io.file_ref import FileRef
-from adobe.pdfservices.operation.pdfops.extract_pdf_operation import ExtractPDFOperation
-from adobe.pdfservices.operation.pdfops.options.extractpdf.extract_pdf_options import ExtractPDFOptions
-from adobe.pdfservices.operation.pdfops.options.extractpdf.extract_element_type import ExtractElementType
-from langchain_openai import ChatOpenAI
-from langchain_community.document_loaders import TextLoader
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import ChatPromptTemplate
 from dotenv import load_dotenv
+from modules.llm_cache import CachedChain
+from modules.rate_limit import get_chat_model
+from modules.extraction import PDFSectionExtractor
+from modules.checkpoint import open_journal, retry_section, section_hash
+from modules.chunking import count_tokens, get_token_budget, pack_sections, sections_label
+from modules.metrics import span, traced
+from modules.summary_tree import SummaryTree, reduce_plan, topic_share
 import asyncio
 
 load_dotenv()
 
 logging.basicConfig(level=logging.INFO)
 
-class PDFExtract:
-    def __init__(self, client_id, client_secret):
-        self.client_id = client_id
-        self.client_secret = client_secret
-        self.llm = ChatOpenAI(temperature=0, model_name="gpt-3.5-turbo-16k")
+# Summaries merged by one reduce request, and the topics an intermediate (chapter-level) summary keeps
+REDUCE_FAN_IN = int(os.getenv("EDUSAGE_REDUCE_FAN_IN", "6"))
+TOPICS_PER_NODE = 6
+
+class PDFExtract(PDFSectionExtractor):
+    def __init__(self, client_id, client_secret, backend=None):
+        super().__init__(client_id, client_secret, backend=backend)
+        self.llm = get_chat_model("gpt-3.5-turbo-16k", temperature=0)
+        self.token_budget = get_token_budget(self.llm.model_name)
         self.map_template = """
         Analyze the following content and create a structured summary:
 
@@ -33,6 +34,10 @@ class PDFExtract:
         4. Include relevant formulas or mathematical notations if applicable.
         5. If the content is not substantive or doesn't contain important information, respond with "SKIP".
 
+        The content may contain several sections, each starting with a line like "### Section 3".
+        Summarize every substantive section separately and in order, using the format below once per section.
+        Leave out sections that are not substantive, and respond with "SKIP" only if none of them are.
+
         Format your response as follows:
         Main Topic: [Identified main topic or heading]
 
@@ -47,95 +52,141 @@ class PDFExtract:
         Summary:
         """
         self.map_prompt = ChatPromptTemplate([("human", self.map_template)])
-        self.map_chain = self.map_prompt | self.llm | StrOutputParser()
+        self.map_chain = CachedChain(
+            self.map_prompt | self.llm | StrOutputParser(),
+            model_name=self.llm.model_name,
+            temperature=self.llm.temperature,
+            template=self.map_template,
+            name="summary",
+        )
 
-    def _get_credentials(self):
-        credentials = Credentials.service_principal_credentials_builder().with_client_id(
-            self.client_id).with_client_secret(self.client_secret).build()
-        return credentials
+        # Reduce step: merges the summaries of consecutive parts into a higher-level summary
+        self.reduce_template = """
+        The summaries below cover consecutive parts of one document, in order.
+        Combine them into a higher-level summary with at most {max_topics} topics:
 
-    def _zip_file(self, output_path, unzip_dir):
-        with zipfile.ZipFile(output_path, 'r') as zip_ref:
-            zip_ref.extractall(unzip_dir)
+        1. Group related material under a shared topic and drop repetition.
+        2. Keep the most important ideas, techniques, results and formulas.
+        3. Keep the topics in the order the material appears in the document.
 
-    def _parse_json(self, json_file_path):
-        with open(json_file_path, "r") as json_file:
-            content = json.loads(json_file.read())
-        pdf_element = content["elements"]
-        return pdf_element
+        Format each topic as follows:
+        Main Topic: [Topic heading]
 
-    def get_files_from_dir(self, dir):
-        files = [os.path.join(dir, f) for f in os.listdir(dir) if os.path.isfile(os.path.join(dir, f))]
-        return files
+        • [Key point 1]
+        • [Key point 2]
+        • [Key point 3]
+        [Add more bullet points if necessary]
+
+        Summaries:
+        {context}
 
-    def load_docs(self, file_path):
-        loader = TextLoader(file_path)
-        docs = loader.load()
-        return docs
+        Combined Summary:
+        """
+        self.reduce_prompt = ChatPromptTemplate([("human", self.reduce_template)])
+        self.reduce_chain = CachedChain(
+            self.reduce_prompt | self.llm | StrOutputParser(),
+            model_name=self.llm.model_name,
+            temperature=self.llm.temperature,
+            template=self.reduce_template,
+            name="summary_reduce",
+        )
 
-    def parse_pdf(self, input_file_path, output_path, unzip_dir, chunked_dir):
+    async def generate_summary(self, content, bypass_cache=False):
+        response = await self.map_chain.ainvoke({"context": content}, bypass=bypass_cache)
+        return response
+
+    async def stream_summaries(self, list_of_all_docs, max_concurrency=1, on_token=None, journal=None):
+        """Yields (index, response) for each document as soon as its summary completes.
+
+        Indexes start at 1. When on_token is given, replies are streamed from the model and
+        on_token(index, text_so_far) is called as each chunk arrives. Documents already in the
+        journal are yielded from it, and new summaries are recorded there. A document that still
+        fails after its retries doesn't stop the others; the error is raised once they finish.
+        """
+        # Bound the number of in-flight LLM requests; max_concurrency=1 keeps the sequential behaviour
+        semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+        async def request(doc, i):
+            if on_token is None:
+                return await self.generate_summary(doc.page_content)
+            parts = []
+            async for chunk in self.map_chain.astream({"context": doc.page_content}):
+                parts.append(chunk)
+                on_token(i, "".join(parts))
+            return "".join(parts)
+
+        async def summarize(i, doc):
+            key = section_hash(doc.page_content)
+            if journal is not None and key in journal:
+                response = journal.get(key)
+                if on_token is not None:
+                    on_token(i, response)
+                return i, response
+            async with semaphore:
+                try:
+                    response = await retry_section(lambda: request(doc, i), f"Summarizing document {i}")
+                except Exception as e:
+                    return i, e
+            if journal is not None:
+                journal.record(key, response)
+            return i, response
+
+        tasks = [asyncio.create_task(summarize(i, doc)) for i, doc in enumerate(list_of_all_docs, 1)]
+        failed = {}
         try:
-            credentials = self._get_credentials()
-            execution_context = ExecutionContext.create(credentials)
-            extract_pdf_operation = ExtractPDFOperation.create_new()
-            source = FileRef.create_from_local_file(input_file_path)
-            extract_pdf_operation.set_input(source)
-            extract_pdf_options = ExtractPDFOptions.builder().with_element_to_extract(ExtractElementType.TEXT).build()
-            extract_pdf_operation.set_options(extract_pdf_options)
-
-            result = extract_pdf_operation.execute(execution_context)
-            result.save_as(output_path)
-            self._zip_file(output_path, unzip_dir)
-            json_file_path = os.path.join(unzip_dir, "structuredData.json")
-            elements = self._parse_json(json_file_path)
-
-            file_split = 0
-            FIRST_TIME_HEADER = True
-            file_name = os.path.join(chunked_dir, f"file_{file_split}.txt")
-            parsed_file = open(file_name, "a", encoding="utf-8")
-            for element in elements:
-                if "//Document/H2" in element["Path"]:
-                    hdr_txt = element["Text"]
-                    if FIRST_TIME_HEADER:
-                        FIRST_TIME_HEADER = False
-                        parsed_file.write(hdr_txt)
-                        parsed_file.write("\n")
-                    else:
-                        parsed_file.close()
-                        file_split = file_split + 1
-                        file_name = os.path.join(chunked_dir, f"file_{file_split}.txt")
-                        parsed_file = open(file_name, "a", encoding="utf-8")
-                        parsed_file.write(hdr_txt)
-                        parsed_file.write("\n")
+            for task in asyncio.as_completed(tasks):
+                i, response = await task
+                if isinstance(response, Exception):
+                    logging.error(f"Summarizing document {i} failed: {response}")
+                    failed[i] = response
                 else:
-                    try:
-                        text_content = element["Text"]
-                        parsed_file.write(text_content)
-                        parsed_file.write("\n")
-                    except KeyError:
-                        pass
-            parsed_file.close()
-            logging.info(f"PDF parsing completed. Chunks saved in '{chunked_dir}'.")
-        except Exception as e:
-            print(e)
-            logging.exception("Exception encountered while executing operation")
-
-    async def generate_summary(self, content):
-        response = await self.map_chain.ainvoke({"context": content})
-        return response
+                    yield i, response
+        finally:
+            for task in tasks:
+                task.cancel()
+        if failed:
+            first_error = next(iter(failed.values()))
+            raise RuntimeError(
+                f"{len(failed)} of {len(tasks)} documents could not be summarized ({first_error}). "
+                "The finished ones were saved; run the summary again to retry the rest."
+            ) from first_error
 
-    async def process_documents(self, list_of_all_docs, output_dir):
+    @traced("summarize")
+    async def process_documents(self, list_of_all_docs, output_dir, max_concurrency=1, progress_callback=None,
+                                on_summary=None, on_token=None, checkpoint=True):
+        # Fewer, fuller requests: small sections are merged and oversized ones split to fit the budget
+        with span("pack_sections"):
+            list_of_all_docs = pack_sections(list_of_all_docs, self.token_budget, self.llm.model_name)
+        total = len(list_of_all_docs)
+
+        journal = open_journal("summary", list_of_all_docs, self.llm.model_name, self.map_template) if checkpoint else None
+        if journal is not None and len(journal):
+            print(f"Resuming: {len(journal)} of {total} documents were already summarized")
+        responses = {}
+        completed = 0
+        try:
+            async for i, response in self.stream_summaries(list_of_all_docs, max_concurrency, on_token=on_token, journal=journal):
+                completed += 1
+                responses[i] = response
+                if response.strip().upper() != "SKIP":
+                    print(f"Generated summary for document {i} ({completed}/{total} done)")
+                else:
+                    print(f"Skipped summarizing document {i} ({completed}/{total} done)")
+                if on_summary is not None:
+                    on_summary(i, response)
+                if progress_callback is not None:
+                    progress_callback(completed, total)
+        finally:
+            if journal is not None:
+                journal.close()
+
+        # Results arrive in completion order; rebuild them in document order
         summaries = []
-        for i, doc in enumerate(list_of_all_docs, 1):
-            print(f"Processing document {i}/{len(list_of_all_docs)}")
-            
-            response = await self.generate_summary(doc.page_content)
-            
+        for i in range(1, total + 1):
+            response = responses[i]
             if response.strip().upper() != "SKIP":
-                summaries.append(f"Document {i}:\n\n{response}\n\n{'='*50}\n\n")
-                print(f"Generated summary for document {i}")
-            else:
-                print(f"Skipped summarizing document {i}")
+                label = sections_label(list_of_all_docs[i - 1].metadata.get("sections")) or f"Document {i}"
+                summaries.append(f"{label}:\n\n{response}\n\n{'='*50}\n\n")
 
         if summaries:
             output_file = os.path.join(output_dir, "technical_summaries.txt")
@@ -146,4 +197,81 @@ class PDFExtract:
         else:
             print("No summaries were generated as all documents were skipped.")
 
-        return summaries
\ No newline at end of file
+        if journal is not None:
+            # The outputs are complete, so there is nothing left to resume
+            journal.discard()
+        return summaries
+
+    async def merge_summaries(self, summaries, max_topics, semaphore):
+        """One reduce request, split in two first if the summaries don't fit the token budget."""
+        summaries = [summary for summary in summaries if summary.strip().upper() != "SKIP"]
+        if not summaries:
+            return "SKIP"
+        context = "\n\n".join(summary.strip() for summary in summaries)
+        if len(summaries) > 1 and count_tokens(context, self.llm.model_name) > self.token_budget:
+            middle = len(summaries) // 2
+            halves = await asyncio.gather(
+                self.merge_summaries(summaries[:middle], TOPICS_PER_NODE, semaphore),
+                self.merge_summaries(summaries[middle:], TOPICS_PER_NODE, semaphore),
+            )
+            return await self.merge_summaries(halves, max_topics, semaphore)
+        async with semaphore:
+            return await retry_section(
+                lambda: self.reduce_chain.ainvoke({"context": context, "max_topics": max_topics}),
+                f"Merging {len(summaries)} summaries",
+            )
+
+    @traced("summary_reduce")
+    async def reduce_summaries(self, summaries, max_topics, max_concurrency=1):
+        """Merges map summaries up a tree until at most max_topics topics remain; returns a SummaryTree.
+
+        Every node merges up to REDUCE_FAN_IN consecutive summaries of the level below and starts
+        as soon as those are done, so levels overlap and wall-clock time grows with tree depth
+        rather than with the number of sections.
+        """
+        tree = SummaryTree([list(summaries)])
+        if tree.topic_count(0) <= max_topics:
+            return tree
+
+        semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+        async def done(summary):
+            return summary
+
+        async def merge_node(children, topics):
+            return await self.merge_summaries(await asyncio.gather(*children), topics, semaphore)
+
+        below = [asyncio.create_task(done(summary)) for summary in summaries]
+        levels = []
+        plan = reduce_plan(len(summaries), max_topics, REDUCE_FAN_IN, TOPICS_PER_NODE)
+        for depth, size in enumerate(plan, 1):
+            top = depth == len(plan)
+            level = [
+                asyncio.create_task(merge_node(
+                    below[j * REDUCE_FAN_IN:(j + 1) * REDUCE_FAN_IN],
+                    topic_share(max_topics, size, j) if top else TOPICS_PER_NODE,
+                ))
+                for j in range(size)
+            ]
+            levels.append(level)
+            below = level
+        try:
+            await asyncio.gather(*below)
+        finally:
+            for level in levels:
+                for task in level:
+                    task.cancel()
+        for level in levels:
+            tree.levels.append([task.result() for task in level])
+        return tree
+
+    async def summarize_hierarchically(self, list_of_all_docs, output_dir, max_topics, max_concurrency=1,
+                                       progress_callback=None):
+        """Map step, then the reduce tree; also writes the document-level summary to output_dir."""
+        summaries = await self.process_documents(
+            list_of_all_docs, output_dir, max_concurrency=max_concurrency, progress_callback=progress_callback
+        )
+        tree = await self.reduce_summaries(summaries, max_topics, max_concurrency=max_concurrency)
+        output_file = tree.write(output_dir)
+        print(f"Document summary ({tree.depth} levels) has been written to '{output_file}'")
+        return tree
@@ -0,0 +1,61 @@
+import math
+import os
+
+TOPIC_PREFIX = "Main Topic:"
+
+
+def count_topics(summary):
+    if summary.strip().upper() == "SKIP":
+        return 0
+    return max(1, sum(line.startswith(TOPIC_PREFIX) for line in summary.split("\n")))
+
+
+def reduce_plan(num_summaries, max_topics, fan_in, topics_per_node):
+    """Node counts per reduce level: each level merges up to fan_in consecutive summaries of the one
+    below, until the top level's nodes can share max_topics between them."""
+    sizes = [num_summaries]
+    while len(sizes) == 1 or (sizes[-1] > 1 and sizes[-1] * topics_per_node > max_topics):
+        sizes.append(math.ceil(sizes[-1] / fan_in))
+    return sizes[1:]
+
+
+def topic_share(max_topics, num_nodes, index):
+    """Topics node `index` of the top level may use, so the level adds up to max_topics."""
+    share, remainder = divmod(max_topics, num_nodes)
+    return max(1, share + (index < remainder))
+
+
+class SummaryTree:
+    """Summaries at every level of the map-reduce tree.
+
+    levels[0] holds the map step's section summaries, each later level merges consecutive
+    summaries of the one below into chapter-level ones, and the last level is the
+    document-level summary.
+    """
+
+    def __init__(self, levels):
+        self.levels = levels
+
+    @property
+    def depth(self):
+        return len(self.levels)
+
+    def topic_count(self, level):
+        return sum(count_topics(summary) for summary in self.levels[level])
+
+    def summaries(self, level=-1):
+        """The summaries of one level, leaving out merged nodes that came back as SKIP."""
+        return [summary for summary in self.levels[level] if count_topics(summary)]
+
+    def select(self, max_topics):
+        """The most detailed level with at most max_topics topics, or the document-level summary."""
+        for level in range(self.depth):
+            if self.topic_count(level) <= max_topics:
+                return self.summaries(level)
+        return self.summaries()
+
+    def write(self, output_dir, filename="document_summary.txt"):
+        output_file = os.path.join(output_dir, filename)
+        with open(output_file, "w") as f:
+            f.write("\n\n".join(summary.strip() for summary in self.summaries()) + "\n")
+        return output_file
@@ -0,0 +1,199 @@
+import json
+import logging
+import os
+import threading
+import numpy as np
+from langchain_core.documents import Document
+from modules.metrics import register_cache
+
+DEFAULT_STORE_DIR = os.getenv(
+    "EDUSAGE_VECTOR_STORE_DIR", os.path.join(os.path.expanduser("~"), ".edusage", "vectors")
+)
+DEFAULT_MAX_BYTES = int(os.getenv("EDUSAGE_VECTOR_STORE_MAX_BYTES", str(512 * 1024 * 1024)))
+
+
+class HashingEmbeddings:
+    """Offline embedding function built on scikit-learn's HashingVectorizer; no model download needed."""
+
+    def __init__(self, dimensions=1024):
+        from sklearn.feature_extraction.text import HashingVectorizer
+
+        self.vectorizer = HashingVectorizer(
+            n_features=dimensions, stop_words="english", alternate_sign=False, norm="l2", dtype=np.float32
+        )
+        self.model = f"hashing-{dimensions}"
+
+    def embed_documents(self, texts):
+        return self.vectorizer.transform(texts).toarray()
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+def get_embedding_function(name=None):
+    # Focus retrieval only ranks chunks of one document, which hashed word features do well
+    # without a network call per query; set EDUSAGE_EMBEDDINGS=openai for OpenAI embeddings
+    name = (name or os.getenv("EDUSAGE_EMBEDDINGS", "hashing")).lower()
+    if name == "openai":
+        from langchain_openai.embeddings import OpenAIEmbeddings
+
+        return OpenAIEmbeddings()
+    if name == "hashing":
+        return HashingEmbeddings()
+    raise ValueError(f"Unsupported embedding function: {name}")
+
+
+def _normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+class LocalVectorStore:
+    """Per-document chunk embeddings in memory-mapped .npy files with batched top-k cosine search.
+
+    Each document gets <doc_id>.npy (unit-length float32 rows) and <doc_id>.json (chunk texts and
+    metadata), so indexes survive restarts and are shared by every process on the host. Documents
+    are evicted least recently used first (by mtime, refreshed when a document is indexed or
+    loaded) once the store grows past max_bytes.
+    """
+
+    def __init__(self, store_dir=DEFAULT_STORE_DIR, embedding_function=None, max_bytes=DEFAULT_MAX_BYTES):
+        self.embedding_function = embedding_function or get_embedding_function()
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        # Vectors from different embedding models are not comparable, so each model gets its own directory
+        namespace = getattr(self.embedding_function, "model", None) or type(self.embedding_function).__name__
+        self.store_dir = os.path.join(store_dir, namespace)
+        self._documents = {}
+        self._lock = threading.Lock()
+        os.makedirs(self.store_dir, exist_ok=True)
+
+    def _paths(self, doc_id):
+        return os.path.join(self.store_dir, f"{doc_id}.npy"), os.path.join(self.store_dir, f"{doc_id}.json")
+
+    def has_document(self, doc_id):
+        return all(os.path.exists(path) for path in self._paths(doc_id))
+
+    def _touch(self, doc_id):
+        try:
+            os.utime(self._paths(doc_id)[0])
+        except FileNotFoundError:
+            pass
+
+    def add_document(self, doc_id, chunks, batch_size=256):
+        if self.has_document(doc_id):
+            self.hits += 1
+            self._touch(doc_id)
+            return
+        self.misses += 1
+        vectors_path, chunks_path = self._paths(doc_id)
+        tmp_suffix = f".{os.getpid()}.{threading.get_ident()}.tmp"
+        texts = [chunk.page_content for chunk in chunks]
+        vectors = None
+        for start in range(0, len(texts), batch_size):
+            batch = _normalize(self.embedding_function.embed_documents(texts[start:start + batch_size]))
+            if vectors is None:
+                vectors = np.lib.format.open_memmap(
+                    vectors_path + tmp_suffix, mode="w+", dtype=np.float32, shape=(len(texts), batch.shape[1])
+                )
+            vectors[start:start + len(batch)] = batch
+        if vectors is None:
+            return
+        vectors.flush()
+        del vectors
+        with open(chunks_path + tmp_suffix, "w", encoding="utf-8") as f:
+            json.dump([{"page_content": chunk.page_content, "metadata": chunk.metadata} for chunk in chunks], f)
+        os.replace(vectors_path + tmp_suffix, vectors_path)
+        os.replace(chunks_path + tmp_suffix, chunks_path)
+        self._evict(keep=doc_id)
+
+    def _load(self, doc_id):
+        with self._lock:
+            if doc_id not in self._documents:
+                vectors_path, chunks_path = self._paths(doc_id)
+                with open(chunks_path, encoding="utf-8") as f:
+                    chunks = [Document(**chunk) for chunk in json.load(f)]
+                self._documents[doc_id] = (np.load(vectors_path, mmap_mode="r"), chunks)
+                self._touch(doc_id)
+            return self._documents[doc_id]
+
+    def search_vectors(self, doc_id, query_vectors, k=4):
+        """Returns, for each query vector, the indices and cosine scores of its k nearest chunks."""
+        vectors, _ = self._load(doc_id)
+        queries = _normalize(np.atleast_2d(query_vectors))
+        scores = queries @ vectors.T
+        k = min(k, vectors.shape[0])
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        return np.take_along_axis(top, order, axis=1), np.take_along_axis(top_scores, order, axis=1)
+
+    def search(self, doc_id, queries, k=4):
+        _, chunks = self._load(doc_id)
+        query_vectors = self.embedding_function.embed_documents(list(queries))
+        indices, scores = self.search_vectors(doc_id, query_vectors, k)
+        return [
+            [(chunks[i], float(score)) for i, score in zip(row_indices, row_scores)]
+            for row_indices, row_scores in zip(indices, scores)
+        ]
+
+    def delete_document(self, doc_id):
+        with self._lock:
+            self._documents.pop(doc_id, None)
+        for path in self._paths(doc_id):
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+    def _entries(self):
+        """(mtime, size, doc_id) per stored document; size counts both of its files."""
+        entries = []
+        for name in os.listdir(self.store_dir):
+            if not name.endswith(".npy"):
+                continue
+            doc_id = name[:-len(".npy")]
+            try:
+                mtime = os.stat(self._paths(doc_id)[0]).st_mtime
+                size = sum(os.stat(path).st_size for path in self._paths(doc_id))
+            except FileNotFoundError:
+                continue
+            entries.append((mtime, size, doc_id))
+        return entries
+
+    def _evict(self, keep=None):
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, doc_id in entries:
+            if total <= self.max_bytes:
+                break
+            if doc_id == keep:
+                continue
+            # Processes that still have the document mapped keep reading their copy; unlinking is safe
+            self.delete_document(doc_id)
+            total -= size
+            logging.info(f"Evicted vector store document {doc_id}")
+
+    def stats(self):
+        entries = self._entries()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": len(entries),
+            "bytes": sum(size for _, size, _ in entries),
+        }
+
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+
+def get_vector_store():
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = LocalVectorStore()
+            register_cache("vectors", _default_store.stats)
+        return _default_store
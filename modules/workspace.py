@@ -0,0 +1,243 @@
+import contextlib
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import uuid
+
+DEFAULT_WORKSPACE_DIR = os.getenv(
+    "EDUSAGE_WORKSPACE_DIR", os.path.join(tempfile.gettempdir(), "edusage-workspaces")
+)
+DEFAULT_MAX_BYTES = int(os.getenv("EDUSAGE_WORKSPACE_MAX_BYTES", str(2 * 1024 * 1024 * 1024)))
+# Small documents get their workspace on a tmpfs mount; set EDUSAGE_WORKSPACE_MEMORY_DIR= to turn this off
+DEFAULT_MEMORY_DIR = os.getenv("EDUSAGE_WORKSPACE_MEMORY_DIR", "/dev/shm" if os.path.isdir("/dev/shm") else "")
+DEFAULT_MEMORY_MAX_BYTES = int(os.getenv("EDUSAGE_WORKSPACE_MEMORY_MAX_BYTES", str(256 * 1024 * 1024)))
+DEFAULT_MEMORY_DOCUMENT_BYTES = int(os.getenv("EDUSAGE_WORKSPACE_MEMORY_DOCUMENT_BYTES", str(8 * 1024 * 1024)))
+
+
+def _dir_size(path):
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            try:
+                total += os.lstat(os.path.join(dirpath, name)).st_size
+            except FileNotFoundError:
+                pass
+    return total
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class Workspace:
+    """A private directory for one job's artifacts: the uploaded file and anything written next to it."""
+
+    def __init__(self, store, root, path, reserved=0):
+        self.store = store
+        self.root = root
+        self.path = path
+        # Bytes held against the quota that haven't been written yet
+        self.reserved = reserved
+
+    @property
+    def in_memory(self):
+        return self.root.in_memory
+
+    def file_path(self, name):
+        return os.path.join(self.path, name)
+
+    def write_file(self, name, data):
+        """Writes data (bytes) to a file in the workspace and returns its path.
+
+        The workspace's reservation is used first; only the bytes beyond it are reserved now.
+        """
+        extra = len(data) - self.reserved
+        if extra > 0:
+            self.store.reserve(self.root, extra)
+            self.reserved += extra
+        path = self.file_path(name)
+        with open(path, "wb") as f:
+            f.write(data)
+        # The bytes are on disk now, where the quota check counts them
+        used = min(len(data), self.reserved)
+        self.store.release(self.root, used)
+        self.reserved -= used
+        return path
+
+    def size_bytes(self):
+        return _dir_size(self.path)
+
+
+class _Root:
+    def __init__(self, path, max_bytes, in_memory=False):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.in_memory = in_memory
+        # Bytes promised to workspaces that haven't been written yet
+        self.reserved = 0
+
+
+def _free_bytes(path):
+    stat = os.statvfs(path)
+    return stat.f_bavail * stat.f_frsize
+
+
+class WorkspaceStore:
+    """Owns every per-job working directory and keeps them within a byte quota.
+
+    Workspaces are removed when their job finishes. Directories left behind by crashed
+    processes, and anything else over the quota, are collected least recently used first
+    (by mtime); workspaces still in use by this or another live process are never touched.
+    Documents up to memory_document_bytes are placed under memory_dir (a tmpfs such as
+    /dev/shm) while its own quota allows; that quota never exceeds the mount's free space.
+    """
+
+    def __init__(self, workspace_dir=DEFAULT_WORKSPACE_DIR, max_bytes=DEFAULT_MAX_BYTES,
+                 memory_dir=DEFAULT_MEMORY_DIR, memory_max_bytes=DEFAULT_MEMORY_MAX_BYTES,
+                 memory_document_bytes=DEFAULT_MEMORY_DOCUMENT_BYTES):
+        self.disk = _Root(workspace_dir, max_bytes)
+        self.memory = None
+        if memory_dir and memory_max_bytes > 0:
+            self.memory = _Root(os.path.join(memory_dir, "edusage-workspaces"), memory_max_bytes, in_memory=True)
+        self.memory_document_bytes = memory_document_bytes
+        self.created = 0
+        self.collected = 0
+        self._active = set()
+        self._lock = threading.Lock()
+        os.makedirs(self.disk.path, exist_ok=True)
+        if self.memory is not None:
+            try:
+                os.makedirs(self.memory.path, exist_ok=True)
+                # Containers often mount a small /dev/shm (64 MB in Docker), well under the default quota
+                available = _free_bytes(self.memory.path) + _dir_size(self.memory.path)
+            except OSError:
+                logging.warning(f"Cannot use {memory_dir} for in-memory workspaces; using {workspace_dir} only")
+                self.memory = None
+            else:
+                self.memory.max_bytes = min(self.memory.max_bytes, available)
+
+    def _entries(self, root):
+        entries = []
+        for name in os.listdir(root.path):
+            path = os.path.join(root.path, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, path, name))
+        return entries
+
+    def _in_use(self, path, name):
+        if path in self._active:
+            return True
+        # Workspace names start with the owning pid, so other live processes keep theirs
+        pid = name.split("-", 1)[0]
+        return pid.isdigit() and int(pid) != os.getpid() and _pid_alive(int(pid))
+
+    def _collect(self, root, needed=0):
+        """Removes unused workspaces, oldest first, until needed more bytes fit the quota; returns the usage."""
+        sized = [(mtime, path, name, _dir_size(path)) for mtime, path, name in sorted(self._entries(root))]
+        total = sum(size for *_, size in sized)
+        for _, path, name, size in sized:
+            if total + needed <= root.max_bytes:
+                break
+            if self._in_use(path, name):
+                continue
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+            self.collected += 1
+            logging.info(f"Collected workspace {path} ({size} bytes)")
+        return total
+
+    def _try_reserve(self, root, num_bytes):
+        """Holds num_bytes of root's quota if they fit next to its usage and other reservations; call with the lock held."""
+        total = self._collect(root, num_bytes + root.reserved)
+        if total + root.reserved + num_bytes > root.max_bytes:
+            return False
+        root.reserved += num_bytes
+        return True
+
+    def reserve(self, root, num_bytes):
+        with self._lock:
+            if self._try_reserve(root, num_bytes):
+                return
+        raise RuntimeError(
+            f"The workspace quota of {root.max_bytes} bytes is used up by running jobs; try again when they finish."
+        )
+
+    def release(self, root, num_bytes):
+        with self._lock:
+            root.reserved -= num_bytes
+
+    def _reserve_root(self, size_hint):
+        if self.memory is not None and size_hint <= self.memory_document_bytes:
+            with self._lock:
+                if self._try_reserve(self.memory, size_hint):
+                    return self.memory
+        self.reserve(self.disk, size_hint)
+        return self.disk
+
+    @contextlib.contextmanager
+    def workspace(self, size_hint=0):
+        """Yields a new Workspace and deletes it, with everything in it, on exit.
+
+        size_hint is the expected input size; it decides between memory and disk and is
+        reserved against the quota up front, so concurrent jobs can't overcommit it.
+        Whatever is left of the reservation is released on exit.
+        """
+        root = self._reserve_root(size_hint)
+        path = os.path.join(root.path, f"{os.getpid()}-{uuid.uuid4().hex}")
+        workspace = Workspace(self, root, path, reserved=size_hint)
+        try:
+            with self._lock:
+                os.makedirs(path)
+                self._active.add(path)
+                self.created += 1
+            yield workspace
+        finally:
+            with self._lock:
+                self._active.discard(path)
+                root.reserved -= workspace.reserved
+            shutil.rmtree(path, ignore_errors=True)
+
+    def collect(self):
+        """Removes every workspace not in use; returns how many were removed."""
+        collected = self.collected
+        for root in (self.disk, self.memory):
+            if root is not None:
+                with self._lock:
+                    self._collect(root, root.max_bytes + 1)
+        return self.collected - collected
+
+    def stats(self):
+        with self._lock:
+            active = len(self._active)
+        stats = {"active": active, "created": self.created, "collected": self.collected}
+        for label, root in (("disk", self.disk), ("memory", self.memory)):
+            if root is not None:
+                stats[f"{label}_bytes"] = sum(_dir_size(path) for _, path, _ in self._entries(root))
+                stats[f"{label}_reserved_bytes"] = root.reserved
+                stats[f"{label}_max_bytes"] = root.max_bytes
+        return stats
+
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+
+def get_workspace_store():
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = WorkspaceStore()
+            # Leftovers from earlier runs are collected on startup rather than once the quota fills
+            _default_store.collect()
+        return _default_store
@@ -1,6 +1,5 @@
 import streamlit as st
 import os
-import tempfile
 import sys
 import asyncio
 
@@ -8,18 +7,83 @@ import asyncio
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from modules.glossary import PDFExtract
+from modules.document_cache import file_key, get_document_cache
+from modules.glossary_store import get_glossary_store
+from modules.jobs import DONE, FAILED, get_job_manager
+from modules.workspace import get_workspace_store
 
-async def process_pdf_for_glossary(pdf_extract, tmp_file_path, output_dir, unzip_dir, chunked_dir):
-    with st.spinner("Parsing PDF..."):
-        pdf_extract.parse_pdf(tmp_file_path, os.path.join(output_dir, "extracted.zip"), unzip_dir, chunked_dir)
-    st.success("PDF parsed successfully!")
+POLL_INTERVAL_SECONDS = 1
 
-    with st.spinner("Extracting glossary terms..."):
-        glossary = await pdf_extract.create_glossary(chunked_dir)
-    st.success("Glossary terms extracted successfully!")
+SEARCH_RESULT_LIMIT = 25
+
+async def run_glossary_job(job, file_bytes, doc_key, file_name=None):
+    # Runs on a background worker, so it reports through the job instead of Streamlit widgets
+    document_cache = get_document_cache()
+    glossary_store = get_glossary_store()
+
+    # Identical uploads from any session or earlier run reuse the glossary extracted the first time
+    glossary = document_cache.get(("glossary", doc_key))
+    if glossary is None:
+        glossary = glossary_store.get_document(doc_key)
+    if glossary is not None:
+        return glossary
+
+    # Everything written for this job lives in its workspace, which is deleted when the job ends
+    with get_workspace_store().workspace(len(file_bytes)) as workspace:
+        tmp_file_path = workspace.write_file("input.pdf", file_bytes)
+        output_dir = workspace.path
+
+        pdf_extract = PDFExtract(os.getenv("PDF_SERVICES_CLIENT_ID"), os.getenv("PDF_SERVICES_CLIENT_SECRET"))
+
+        job.set_message("Parsing PDF...")
+        docs = document_cache.get_or_compute(
+            ("sections", pdf_extract.backend.name, doc_key), lambda: list(pdf_extract.extract_sections(tmp_file_path))
+        )
+
+        def update_progress(completed, total):
+            job.update_progress(completed, total, f"Extracting glossary terms... {completed}/{total} requests")
+
+        job.set_message("Extracting glossary terms...")
+        glossary = await pdf_extract.create_glossary(docs, output_dir, progress_callback=update_progress)
+    document_cache.put(("glossary", doc_key), glossary)
+    glossary_store.add_document(doc_key, glossary, name=file_name)
 
     return glossary
 
+def show_glossary(glossary):
+    st.subheader("Extracted Glossary Terms")
+    for term, definition in glossary.items():
+        with st.expander(term):
+            st.write(definition)
+
+def show_glossary_search():
+    glossary_store = get_glossary_store()
+    stats = glossary_store.stats()
+    if not stats["terms"]:
+        return
+    st.subheader("Search Glossary")
+    query = st.text_input(f"Search {stats['terms']} terms from {stats['documents']} documents")
+    if query:
+        results = glossary_store.search(query, limit=SEARCH_RESULT_LIMIT)
+        if not results:
+            st.info("No matching terms.")
+        for result in results:
+            documents = "document" if result["documents"] == 1 else "documents"
+            with st.expander(f"{result['term']} ({result['documents']} {documents})"):
+                st.write(result["definition"])
+
+async def show_glossary_job(job):
+    if job.status == FAILED:
+        st.error(f"Glossary extraction failed: {job.error}")
+    elif job.status == DONE:
+        st.success("Glossary terms extracted successfully!")
+        show_glossary(job.result)
+    else:
+        st.progress(job.fraction, text=job.message)
+        # Poll until the background job finishes; a refresh reconnects through the job id in the URL
+        await asyncio.sleep(POLL_INTERVAL_SECONDS)
+        st.rerun()
+
 async def show_glossary_page():
     st.header("Glossary Extractor")
         # Custom CSS for the info box
@@ -51,36 +115,37 @@ async def show_glossary_page():
     Great for understanding key terms and concepts!
     """)
 
+    job_manager = get_job_manager()
+    job_id = st.session_state.get("glossary_job_id") or st.query_params.get("glossary_job")
+    job = job_manager.get(job_id) if job_id else None
+
     uploaded_file = st.file_uploader("Choose a PDF file", type="pdf")
 
+    stored_glossary = None
     if uploaded_file is not None:
         st.success("File uploaded successfully!")
+        file_bytes = uploaded_file.getvalue()
+        doc_key = file_key(file_bytes)
+        # Documents extracted before, by anyone, are shown straight from the glossary store
+        stored_glossary = get_glossary_store().get_document(doc_key)
+
+        if stored_glossary is None and st.button("Extract Glossary"):
+            job = job_manager.submit(
+                "glossary", run_glossary_job, file_bytes, doc_key, uploaded_file.name, key=("glossary", doc_key)
+            )
+            st.session_state.glossary_job_id = job.id
+            st.query_params["glossary_job"] = job.id
+
+    elif job is None:
+        st.info("Please upload a PDF file to begin.")
 
-        if st.button("Extract Glossary"):
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp_file:
-                tmp_file.write(uploaded_file.getvalue())
-                tmp_file_path = tmp_file.name
-
-            output_dir = tempfile.mkdtemp()
-            unzip_dir = os.path.join(output_dir, "unzipped")
-            chunked_dir = os.path.join(output_dir, "chunks")
-            os.makedirs(unzip_dir)
-            os.makedirs(chunked_dir)
-
-            pdf_extract = PDFExtract(os.getenv("PDF_SERVICES_CLIENT_ID"), os.getenv("PDF_SERVICES_CLIENT_SECRET"))
-
-            glossary = await process_pdf_for_glossary(pdf_extract, tmp_file_path, output_dir, unzip_dir, chunked_dir)
-
-            st.subheader("Extracted Glossary Terms")
-            for term, definition in glossary.items():
-                with st.expander(term):
-                    st.write(definition)
-
-            # Clean up the temporary file
-            os.unlink(tmp_file_path)
+    if stored_glossary is not None:
+        st.success("This document's glossary was extracted before.")
+        show_glossary(stored_glossary)
+    elif job is not None:
+        await show_glossary_job(job)
 
-    else:
-        st.info("Please upload a PDF file to begin.")
+    show_glossary_search()
 
 def main():
     asyncio.run(show_glossary_page())
@@ -1,12 +1,69 @@
 import streamlit as st
 import os
 import sys
+import time
 from io import BytesIO
 
 # Add the parent directory to sys.path to allow importing from modules
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from modules.quiz import process_document, generate_quiz, QuizMultipleChoice, QuizTrueFalse, QuizOpenEnded
+from modules.quiz import process_document, agenerate_quiz, grade_borderline_answers
+from modules.document_cache import file_key, get_document_cache
+from modules.jobs import DONE, FAILED, get_job_manager
+from modules.quiz_bank import get_question_bank, question_id
+from modules.grading import CORRECT, get_answer_grader
+
+POLL_INTERVAL_SECONDS = 1
+# Questions are generated in parallel, so long quizzes take about as long as short ones
+MAX_QUIZ_QUESTIONS = 50
+# Open-ended answers the local grader can't decide are sent to the model when this is on
+LLM_GRADING = os.getenv("EDUSAGE_LLM_GRADING", "").lower() in ("1", "true", "yes")
+
+def load_chunks(file_bytes, file_name):
+    file_content = BytesIO(file_bytes)
+    file_content.name = file_name  # Use the original file name
+    return process_document(file_content)
+
+async def run_quiz_job(job, chunks, num_questions, quiz_type, focus, doc_key):
+    job.set_message("Generating quiz...")
+    quiz_data = await agenerate_quiz(chunks, num_questions, quiz_type, focus=focus)
+    if not focus:
+        # Questions generated while the bank was short are banked for later quizzes
+        get_question_bank().add(doc_key, quiz_type, quiz_data)
+    return {"quiz_data": quiz_data, "quiz_type": quiz_type}
+
+def start_quiz(quiz_data, quiz_type):
+    st.session_state.quiz_data = quiz_data
+    st.session_state.quiz_generated = True
+    st.session_state.quiz_type = quiz_type
+    st.session_state.current_question = 0
+    st.session_state.score = 0
+    st.session_state.user_answers = []
+    st.session_state.open_grades = None
+    # Later quizzes on this document skip questions the student has already answered
+    seen = st.session_state.seen_questions.setdefault(st.session_state.doc_key, set())
+    seen.update(question_id(question) for question in quiz_data.questions)
+
+def clear_quiz_job():
+    st.session_state.quiz_job_id = None
+    if "quiz_job" in st.query_params:
+        del st.query_params["quiz_job"]
+
+def show_quiz_job(job):
+    if job is None:
+        clear_quiz_job()
+    elif job.status == FAILED:
+        st.error(f"Quiz generation failed: {job.error}")
+        clear_quiz_job()
+    elif job.status == DONE:
+        start_quiz(job.result["quiz_data"], job.result["quiz_type"])
+        clear_quiz_job()
+        st.rerun()
+    else:
+        with st.spinner(job.message):
+            # Poll until the background job finishes; a refresh reconnects through the job id in the URL
+            time.sleep(POLL_INTERVAL_SECONDS)
+        st.rerun()
 
 def show_quiz_page():
     st.header("Quiz Generator")
@@ -43,10 +100,8 @@ def show_quiz_page():
     # Initialize session state variables
     if 'quiz_generated' not in st.session_state:
         st.session_state.quiz_generated = False
-    if 'uploaded_file_content' not in st.session_state:
-        st.session_state.uploaded_file_content = None
-    if 'chunks' not in st.session_state:
-        st.session_state.chunks = None
+    if 'doc_key' not in st.session_state:
+        st.session_state.doc_key = None
     if 'quiz_type' not in st.session_state:
         st.session_state.quiz_type = None
     if 'quiz_data' not in st.session_state:
@@ -57,37 +112,63 @@ def show_quiz_page():
         st.session_state.score = 0
     if 'user_answers' not in st.session_state:
         st.session_state.user_answers = []
+    if 'open_grades' not in st.session_state:
+        st.session_state.open_grades = None
+    if 'seen_questions' not in st.session_state:
+        st.session_state.seen_questions = {}
 
     uploaded_file = st.file_uploader("Upload a PDF document", type=["pdf"])
 
+    # Sessions keep only the file hash; the chunks live in the process-wide document cache
+    document_cache = get_document_cache()
+    chunks = None
     if uploaded_file is not None:
-        st.session_state.uploaded_file_content = uploaded_file.getvalue()
-
-    if st.session_state.uploaded_file_content is not None and st.session_state.chunks is None:
-        with st.spinner("Processing document..."):
-            file_content = BytesIO(st.session_state.uploaded_file_content)
-            file_content.name = uploaded_file.name  # Use the original file name
-            chunks = process_document(file_content)
-            st.session_state.chunks = chunks  # Store chunks for later use
+        file_bytes = uploaded_file.getvalue()
+        st.session_state.doc_key = file_key(file_bytes)
+        cache_key = ("quiz-chunks", st.session_state.doc_key)
+        if not document_cache.contains(cache_key):
+            with st.spinner("Processing document..."):
+                chunks = document_cache.get_or_compute(cache_key, lambda: load_chunks(file_bytes, uploaded_file.name))
             if chunks:
                 st.success("Document processed successfully!")
             else:
                 st.error("Failed to process document.")
+        else:
+            chunks = document_cache.get(cache_key)
+    elif st.session_state.doc_key is not None:
+        chunks = document_cache.get(("quiz-chunks", st.session_state.doc_key))
+        if chunks is None and not st.session_state.quiz_generated:
+            st.info("Your document is no longer cached. Please upload it again.")
+
+    question_bank = get_question_bank()
+    if chunks:
+        # Fill the question bank in the background while the student picks quiz settings
+        question_bank.fill(st.session_state.doc_key, chunks)
 
-    if st.session_state.chunks is not None and not st.session_state.quiz_generated:
+    if chunks is not None and not st.session_state.quiz_generated:
         # Quiz parameters
-        num_questions = st.slider("Number of questions", 1, 10, 5)
+        num_questions = st.slider("Number of questions", 1, MAX_QUIZ_QUESTIONS, 5)
         quiz_type = st.selectbox("Quiz type", ["Multiple Choice", "True/False", "Open Ended"])
+        focus = st.text_input("Focus topic (optional)")
+        seen = st.session_state.seen_questions.get(st.session_state.doc_key, set())
+        st.caption(f"{question_bank.count(st.session_state.doc_key, quiz_type, exclude=seen)} new {quiz_type} questions ready")
 
         if st.button("Generate Quiz"):
-            quiz_data = generate_quiz(st.session_state.chunks, num_questions, quiz_type)
-            st.session_state.quiz_data = quiz_data
-            st.session_state.quiz_generated = True
-            st.session_state.quiz_type = quiz_type
-            st.session_state.current_question = 0
-            st.session_state.score = 0
-            st.session_state.user_answers = []
-            st.rerun()
+            focus = focus.strip() or None
+            # Focused quizzes need questions about that topic, so only unfocused ones come from the bank
+            quiz_data = None if focus else question_bank.draw(st.session_state.doc_key, chunks, quiz_type, num_questions, exclude=seen)
+            if quiz_data is not None:
+                start_quiz(quiz_data, quiz_type)
+                st.rerun()
+            job = get_job_manager().submit(
+                "quiz", run_quiz_job, chunks, num_questions, quiz_type, focus, st.session_state.doc_key
+            )
+            st.session_state.quiz_job_id = job.id
+            st.query_params["quiz_job"] = job.id
+
+    quiz_job_id = st.session_state.get("quiz_job_id") or st.query_params.get("quiz_job")
+    if quiz_job_id and not st.session_state.quiz_generated:
+        show_quiz_job(get_job_manager().get(quiz_job_id))
 
     if st.session_state.quiz_generated:
         display_quiz()
@@ -137,25 +218,44 @@ def check_answer(quiz_data, quiz_type, current_question, user_answer):
             st.session_state.score += 1
         else:
             st.error(f"Incorrect. The correct answer is: {correct_answer}")
-    else:  # Open Ended
-        st.write(f"Your answer: {user_answer}")
-        st.write(f"Correct answer: {correct_answer}")
-        st.write("Please compare your answer to the correct answer.")
-        if st.button("Mark as Correct", key=f"mark{current_question}"):
-            st.success("Marked as correct!")
-            st.session_state.score += 1
-        else:
-            st.error("Marked as incorrect.")
+    # Open-ended answers are graded together once the quiz is finished
+
+def grade_open_answers():
+    # The whole attempt is scored in one batch, and only once per quiz
+    if st.session_state.open_grades is None:
+        quiz_data = st.session_state.quiz_data
+        grades = get_answer_grader().grade(
+            quiz_data.answers[:len(st.session_state.user_answers)], st.session_state.user_answers, questions=quiz_data.questions,
+            escalate=grade_borderline_answers if LLM_GRADING else None
+        )
+        st.session_state.open_grades = grades
+        st.session_state.score = sum(grade["verdict"] == CORRECT for grade in grades)
+    return st.session_state.open_grades
+
+def show_open_grades(grades):
+    quiz_data = st.session_state.quiz_data
+    for i, grade in enumerate(grades):
+        mark = "✅" if grade["verdict"] == CORRECT else "❌"
+        with st.expander(f"{mark} Question {i + 1} ({grade['score']:.0%} match)"):
+            st.write(quiz_data.questions[i])
+            st.write(f"Your answer: {st.session_state.user_answers[i]}")
+            st.write(f"Reference answer: {quiz_data.answers[i]}")
+            if grade["missing_keywords"] and grade["verdict"] != CORRECT:
+                st.caption(f"Not mentioned: {', '.join(grade['missing_keywords'])}")
 
 def show_quiz_results():
     st.subheader("Quiz Completed!")
+    grades = grade_open_answers() if st.session_state.quiz_type == "Open Ended" else None
     st.write(f"Your final score: {st.session_state.score} out of {len(st.session_state.quiz_data.questions)}")
+    if grades is not None:
+        show_open_grades(grades)
     if st.button("Start New Quiz"):
         # Reset only quiz-related variables
         st.session_state.quiz_generated = False
         st.session_state.current_question = 0
         st.session_state.score = 0
         st.session_state.user_answers = []
+        st.session_state.open_grades = None
         st.session_state.quiz_data = None
         st.session_state.quiz_type = None
         st.session_state.num_questions = None
@@ -1,79 +1,138 @@
 import streamlit as st
 import os
-import tempfile
 import sys
 import asyncio
-from pptx import Presentation
-from pptx.util import Inches, Pt
-from pptx.dml.color import RGBColor
-from pptx.enum.text import PP_ALIGN
+import time
 
 # Add the parent directory to sys.path to allow importing from modules
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from modules.summarizer import PDFExtract
+from modules.deck import DeckBuilder, deck_file_name
+from modules.document_cache import file_key, get_document_cache
+from modules.jobs import DONE, FAILED, get_job_manager
+from modules.workspace import get_workspace_store
+
+POLL_INTERVAL_SECONDS = 1
+PARTIAL_DECK_INTERVAL_SECONDS = 5
+
+async def run_summarize_job(job, file_bytes, file_name, doc_key, stream=True, max_slides=None):
+    # Runs on a background worker, so it reports through the job instead of Streamlit widgets
+    # Everything written for this job lives in its workspace, which is deleted when the job ends
+    with get_workspace_store().workspace(len(file_bytes)) as workspace:
+        document_cache = get_document_cache()
+        output_dir = workspace.path
+        deck = DeckBuilder(file_name)
+        job.publish("file_name", file_name)
+        pdf_extract = PDFExtract(os.getenv("PDF_SERVICES_CLIENT_ID"), os.getenv("PDF_SERVICES_CLIENT_SECRET"))
+        max_concurrency = int(os.getenv("SUMMARY_MAX_CONCURRENCY", "8"))
+
+        # Identical uploads from any session reuse the summaries generated the first time
+        summaries = document_cache.get(("summaries", doc_key))
+        if summaries is None:
+            tmp_file_path = workspace.write_file("input.pdf", file_bytes)
+
+            job.set_message("Parsing PDF...")
+            list_of_all_docs = document_cache.get_or_compute(
+                ("sections", pdf_extract.backend.name, doc_key), lambda: list(pdf_extract.extract_sections(tmp_file_path))
+            )
 
-def create_ppt(summaries, output_dir, filename):
-    prs = Presentation()
-    prs.slide_width = Inches(16)
-    prs.slide_height = Inches(9)
-
-    # Add a title slide
-    title_slide_layout = prs.slide_layouts[0]
-    slide = prs.slides.add_slide(title_slide_layout)
-    title = slide.shapes.title
-    subtitle = slide.placeholders[1]
-    title.text = os.path.splitext(filename)[0]
-    subtitle.text = "Document Summary"
+            def update_progress(completed, total):
+                job.update_progress(completed, total, f"Generating summaries... {completed}/{total} sections")
+
+            # Summaries finish out of order; release them to the page and the deck in document order
+            pending = {}
+            released = []
+            in_flight = {}
+            last_snapshot = {"time": 0.0, "slides": 1}
+
+            def publish_deck_snapshot():
+                # Saving a large deck is not free, so partial downloads are refreshed at most every few seconds
+                slides = deck.slide_count
+                if slides > last_snapshot["slides"] and time.time() - last_snapshot["time"] >= PARTIAL_DECK_INTERVAL_SECONDS:
+                    job.publish("partial_deck", (slides, deck.to_bytes()))
+                    last_snapshot.update(time=time.time(), slides=slides)
+
+            def on_token(i, text):
+                in_flight[i] = text
+                job.publish("in_flight", dict(in_flight))
+
+            def on_summary(i, response):
+                in_flight.pop(i, None)
+                pending[i] = response
+                while len(released) + 1 in pending:
+                    response = pending.pop(len(released) + 1)
+                    released.append(response)
+                    if response.strip().upper() != "SKIP":
+                        deck.add_summary(response)
+                job.publish("summaries", [r for r in released if r.strip().upper() != "SKIP"])
+                job.publish("in_flight", dict(in_flight))
+                publish_deck_snapshot()
+
+            job.set_message("Generating summaries...")
+            summaries = await pdf_extract.process_documents(
+                list_of_all_docs, output_dir, max_concurrency=max_concurrency, progress_callback=update_progress,
+                on_summary=on_summary if stream else None, on_token=on_token if stream else None
+            )
+            document_cache.put(("summaries", doc_key), summaries)
+
+            if not stream:
+                for summary in summaries:
+                    deck.add_summary(summary)
+        else:
+            for summary in summaries:
+                deck.add_summary(summary)
+
+        if max_slides:
+            # Merge the section summaries up the reduce tree until they fit the requested deck length
+            job.set_message(f"Condensing the summaries into at most {max_slides} slides...")
+            tree = await pdf_extract.reduce_summaries(summaries, max_slides - 1, max_concurrency=max_concurrency)
+            deck = DeckBuilder(file_name)
+            for summary in tree.select(max_slides - 1):
+                deck.add_summary(summary, max_slides=max_slides)
+
+        job.set_message("Creating PowerPoint summary...")
+        return {"ppt": deck.to_bytes(), "file_name": deck_file_name(file_name)}
+
+def show_partial_summaries(job):
+    summaries = job.get_partial("summaries", [])
+    in_flight = job.get_partial("in_flight", {})
+    partial_deck = job.get_partial("partial_deck")
+
+    if partial_deck is not None and not job.finished:
+        slides, deck_bytes = partial_deck
+        st.download_button(
+            label=f"Download Partial PowerPoint Summary ({slides} slides)",
+            data=deck_bytes,
+            file_name=deck_file_name(job.get_partial("file_name")),
+            mime="application/vnd.openxmlformats-officedocument.presentationml.presentation"
+        )
 
-    # Add summaries to slides
     for summary in summaries:
-        slide_layout = prs.slide_layouts[1]  # Use layout with title and content
-        slide = prs.slides.add_slide(slide_layout)
-        
-        lines = summary.split('\n')
-        
-        # Handle the topic line
-        if lines[0].startswith("Main Topic:"):
-            topic = lines[0].replace("Main Topic:", "Topic:").strip()
-            title = slide.shapes.title
-            title.text = topic
-            lines = lines[1:]  # Remove the topic line from further processing
-        
-        # Add content
-        content = slide.placeholders[1]
-        tf = content.text_frame
-        tf.clear()  # Clear existing text
-        
-        for line in lines:
-            p = tf.add_paragraph()
-            p.text = line.strip()
-            p.level = 0 if line.startswith('•') else 1
-            p.font.size = Pt(14)
-            p.font.color.rgb = RGBColor(0, 0, 0)
-
-    # Save the presentation
-    ppt_path = os.path.join(output_dir, f"{os.path.splitext(filename)[0]}_summary.pptx")
-    prs.save(ppt_path)
-    return ppt_path
-
-async def process_pdf(pdf_extract, tmp_file_path, output_dir, unzip_dir, chunked_dir):
-    with st.spinner("Parsing PDF..."):
-        pdf_extract.parse_pdf(tmp_file_path, os.path.join(output_dir, "extracted.zip"), unzip_dir, chunked_dir)
-    st.success("PDF parsed successfully!")
-
-    files = pdf_extract.get_files_from_dir(chunked_dir)
-    list_of_all_docs = []
-    for file in files:
-        if file.endswith(".txt"):
-            document = pdf_extract.load_docs(file)
-            list_of_all_docs.extend(document)
-
-    with st.spinner("Generating summaries..."):
-        summaries = await pdf_extract.process_documents(list_of_all_docs, output_dir)
-    st.success("Summaries generated successfully!")
-
-    return summaries
+        st.markdown(summary)
+        st.markdown("---")
+    for i, text in sorted(in_flight.items()):
+        st.caption(f"Writing part {i}...")
+        st.markdown(text)
+
+async def show_summary_job(job):
+    if job.status == FAILED:
+        st.error(f"Summarization failed: {job.error}")
+    elif job.status == DONE:
+        st.success("PowerPoint summary created successfully!")
+        st.download_button(
+            label="Download PowerPoint Summary",
+            data=job.result["ppt"],
+            file_name=job.result["file_name"],
+            mime="application/vnd.openxmlformats-officedocument.presentationml.presentation"
+        )
+        show_partial_summaries(job)
+    else:
+        st.progress(job.fraction, text=job.message)
+        show_partial_summaries(job)
+        # Poll until the background job finishes; a refresh reconnects through the job id in the URL
+        await asyncio.sleep(POLL_INTERVAL_SECONDS)
+        st.rerun()
 
 async def show_summarizer_page():
     st.header("Summarizer & Slide Deck Creator")
@@ -105,43 +164,39 @@ async def show_summarizer_page():
 
     Ideal for quick document review and presentation prep!
     """)
+    job_manager = get_job_manager()
+    job_id = st.session_state.get("summary_job_id") or st.query_params.get("summary_job")
+    job = job_manager.get(job_id) if job_id else None
+
     uploaded_file = st.file_uploader("Choose a PDF file", type="pdf")
 
     if uploaded_file is not None:
         st.success("File uploaded successfully!")
 
+        stream = st.toggle("Stream summaries as they are written", value=True)
+        max_slides = st.number_input(
+            "Maximum slides (0 for one slide per topic)", min_value=0, max_value=500, value=0, step=5,
+            help="The title slide counts too, so a condensed deck needs at least 2 slides; 1 means no limit.",
+        )
+        # A one-slide deck would hold nothing but the title
+        max_slides = max_slides if max_slides >= 2 else 0
+
         if st.button("Process and Summarize"):
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp_file:
-                tmp_file.write(uploaded_file.getvalue())
-                tmp_file_path = tmp_file.name
-
-            output_dir = tempfile.mkdtemp()
-            unzip_dir = os.path.join(output_dir, "unzipped")
-            chunked_dir = os.path.join(output_dir, "chunks")
-            os.makedirs(unzip_dir)
-            os.makedirs(chunked_dir)
-
-            pdf_extract = PDFExtract(os.getenv("PDF_SERVICES_CLIENT_ID"), os.getenv("PDF_SERVICES_CLIENT_SECRET"))
-
-            summaries = await process_pdf(pdf_extract, tmp_file_path, output_dir, unzip_dir, chunked_dir)
-
-            with st.spinner("Creating PowerPoint summary..."):
-                ppt_path = create_ppt(summaries, output_dir, uploaded_file.name)
-            
-            st.success("PowerPoint summary created successfully!")
-            st.download_button(
-                label="Download PowerPoint Summary",
-                data=open(ppt_path, "rb").read(),
-                file_name=f"{os.path.splitext(uploaded_file.name)[0]}_summary.pptx",
-                mime="application/vnd.openxmlformats-officedocument.presentationml.presentation"
+            file_bytes = uploaded_file.getvalue()
+            doc_key = file_key(file_bytes)
+            job = job_manager.submit(
+                "summarize", run_summarize_job, file_bytes, uploaded_file.name, doc_key, stream=stream,
+                max_slides=max_slides or None, key=("summarize", doc_key, max_slides)
             )
+            st.session_state.summary_job_id = job.id
+            st.query_params["summary_job"] = job.id
 
-            # Clean up the temporary file
-            os.unlink(tmp_file_path)
-
-    else:
+    elif job is None:
         st.info("Please upload a PDF file to begin.")
 
+    if job is not None:
+        await show_summary_job(job)
+
 def main():
     asyncio.run(show_summarizer_page())
 